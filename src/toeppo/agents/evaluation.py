@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+
+from toeppo.agents.policy import Policy
+from toeppo.environment.deal_bank import DealBank
+from toeppo.environment.toep_env import ToepEnv
+
+MAX_STEPS_PER_ROUND = 1000
+
+
+class DuplicateResult:
+    def __init__(self, advantages: np.ndarray):
+        # advantages[deal, seat]: points the baseline lost minus points the candidate lost
+        self.advantages = advantages
+
+    @property
+    def mean(self) -> float:
+        return float(self.advantages.mean())
+
+    @property
+    def standard_error(self) -> float:
+        # Rotations of one deal are correlated, so treat every deal as one sample
+        per_deal = self.advantages.mean(axis=1)
+
+        if len(per_deal) < 2:
+            return math.inf
+
+        return float(per_deal.std(ddof=1) / math.sqrt(len(per_deal)))
+
+    def __repr__(self):
+        return f"DuplicateResult(mean={self.mean:.3f}, standard_error={self.standard_error:.3f}, deals={len(self.advantages)})"
+
+
+def play_banked_round(
+    env: ToepEnv, policies: list[Policy], deal_index: int
+) -> list[int]:
+    """Play one round on a banked deal from zero scores, returns the points every seat lost"""
+    env.game.deal_bank.seek(deal_index)
+
+    env.reset()
+    finished_rounds = env.game.finished_rounds
+
+    for _ in range(MAX_STEPS_PER_ROUND):
+        if env.game.finished_rounds != finished_rounds:
+            return env.game.last_round_points
+
+        agent = env.agent_selection
+        seat = env.agent_name_mapping[agent]
+        action = policies[seat].compute_action(env.observations[agent])
+        env.step(action)
+
+    raise RuntimeError(f"Deal {deal_index} did not finish a round")
+
+
+def duplicate_evaluation(
+    candidate: Policy,
+    baseline: Policy,
+    deal_bank: DealBank,
+    n_deals: int = None,
+    n_players: int = 4,
+) -> DuplicateResult:
+    """
+    Compare two policies on the same deals to cancel out card luck.
+    Every deal is played with the candidate in each of the seats and the
+    baseline in the others, and compared to the same deal played with the
+    baseline in all seats.
+    :param n_deals:
+        Number of deals of the bank to play, the whole bank if None
+    """
+    env = ToepEnv(n_players, deal_bank=deal_bank)
+    n_deals = len(deal_bank) if n_deals is None else n_deals
+    advantages = np.zeros((n_deals, n_players))
+
+    for deal_index in range(n_deals):
+        baseline_points = play_banked_round(
+            env, [baseline] * n_players, deal_index
+        )
+
+        for seat in range(n_players):
+            policies = [baseline] * n_players
+            policies[seat] = candidate
+            candidate_points = play_banked_round(env, policies, deal_index)
+
+            advantages[deal_index, seat] = (
+                baseline_points[seat] - candidate_points[seat]
+            )
+
+    return DuplicateResult(advantages)
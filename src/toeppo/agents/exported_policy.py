@@ -0,0 +1,89 @@
+import numpy as np
+
+from toeppo.agents.policy import Policy, masked_softmax
+
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "swish": lambda x: x / (1.0 + np.exp(-x)),
+    "silu": lambda x: x / (1.0 + np.exp(-x)),
+    "elu": lambda x: np.where(x > 0.0, x, np.expm1(np.minimum(x, 0.0))),
+    "linear": lambda x: x,
+}
+
+
+class ExportedPolicy(Policy):
+    """Runs the policy branch of an exported TorchActionMaskModel in NumPy.
+
+    The weight file is written by ``toeppo.training.export`` and only needs
+    NumPy to be read, so no Ray runtime or torch install is required.
+    """
+
+    def __init__(
+        self,
+        weights: list[np.ndarray],
+        biases: list[np.ndarray],
+        activation: str = "tanh",
+    ):
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation {activation}")
+
+        self.activation = activation
+        self.activation_fn = ACTIVATIONS[activation]
+        # Bumped by set_weights, so caches of this policy know to invalidate
+        self.weights_version = 0
+        self.set_weights(weights, biases)
+
+    def set_weights(self, weights: list[np.ndarray], biases: list[np.ndarray]):
+        # Weights are stored as (in_features, out_features) to avoid transposing every call
+        self.weights = [np.ascontiguousarray(w, np.float32) for w in weights]
+        self.biases = [np.ascontiguousarray(b, np.float32) for b in biases]
+        self.weights_version += 1
+
+    @classmethod
+    def load(cls, path) -> "ExportedPolicy":
+        with np.load(path) as archive:
+            n_layers = int(archive["n_layers"])
+            weights = [archive[f"weight_{i}"] for i in range(n_layers)]
+            biases = [archive[f"bias_{i}"] for i in range(n_layers)]
+            activation = str(archive["activation"])
+
+        return cls(weights, biases, activation)
+
+    def save(self, path):
+        arrays = {"n_layers": np.array(len(self.weights))}
+
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"weight_{i}"] = weight
+            arrays[f"bias_{i}"] = bias
+
+        np.savez(path, activation=np.array(self.activation), **arrays)
+
+    @property
+    def observation_size(self) -> int:
+        return self.weights[0].shape[0]
+
+    def logits(self, observations: np.ndarray) -> np.ndarray:
+        hidden = np.asarray(observations, dtype=np.float32)
+
+        for weight, bias in zip(self.weights[:-1], self.biases[:-1]):
+            hidden = self.activation_fn(hidden @ weight + bias)
+
+        return hidden @ self.weights[-1] + self.biases[-1]
+
+    def action_probabilities(self, observations, action_masks):
+        return masked_softmax(self.logits(observations), action_masks)
+
+    def compute_actions(
+        self, observations, action_masks, explore=False, rng=None
+    ):
+        if explore:
+            return super().compute_actions(
+                observations, action_masks, explore, rng
+            )
+
+        masked_logits = np.where(
+            action_masks > 0, self.logits(observations), -np.inf
+        )
+
+        return masked_logits.argmax(axis=1)
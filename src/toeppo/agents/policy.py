@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class Policy:
+    """A policy that picks actions for batches of ToepEnv observations.
+
+    Observations are the flattened ``"observation"`` entries of the env and
+    masks the matching ``"action_mask"`` entries, stacked along the first axis.
+    """
+
+    def action_probabilities(
+        self, observations: np.ndarray, action_masks: np.ndarray
+    ) -> np.ndarray:
+        raise NotImplementedError
+
+    def compute_actions(
+        self,
+        observations: np.ndarray,
+        action_masks: np.ndarray,
+        explore: bool = False,
+        rng: np.random.Generator = None,
+    ) -> np.ndarray:
+        probabilities = self.action_probabilities(observations, action_masks)
+
+        if not explore:
+            return probabilities.argmax(axis=1)
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        # Inverse transform sampling of every row at once
+        cumulative = probabilities.cumsum(axis=1)
+        draws = rng.random((len(cumulative), 1)) * cumulative[:, -1:]
+        actions = (cumulative <= draws).sum(axis=1)
+
+        return np.minimum(actions, probabilities.shape[1] - 1)
+
+    def compute_action(
+        self, observation: dict, explore: bool = False, rng=None
+    ) -> int:
+        observations, action_masks = stack_observations([observation])
+
+        return int(
+            self.compute_actions(observations, action_masks, explore, rng)[0]
+        )
+
+
+class RandomPolicy(Policy):
+    """Plays uniformly at random among the legal actions"""
+
+    def action_probabilities(self, observations, action_masks):
+        legal = np.asarray(action_masks, dtype=np.float32)
+
+        return legal / legal.sum(axis=1, keepdims=True)
+
+    def compute_actions(
+        self, observations, action_masks, explore=False, rng=None
+    ):
+        # Taking the argmax of a uniform distribution would always give the first legal action
+        return super().compute_actions(
+            observations, action_masks, explore=True, rng=rng
+        )
+
+
+def stack_observations(
+    observations: list[dict],
+) -> tuple[np.ndarray, np.ndarray]:
+    return (
+        np.stack([observation["observation"] for observation in observations]),
+        np.stack([observation["action_mask"] for observation in observations]),
+    )
+
+
+def masked_softmax(logits: np.ndarray, action_masks: np.ndarray) -> np.ndarray:
+    masked_logits = np.where(action_masks > 0, logits, -np.inf)
+    masked_logits -= masked_logits.max(axis=1, keepdims=True)
+    exponents = np.exp(masked_logits)
+
+    return exponents / exponents.sum(axis=1, keepdims=True)
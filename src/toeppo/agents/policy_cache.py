@@ -0,0 +1,136 @@
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+from toeppo.agents.policy import Policy
+from toeppo.environment.suit_symmetry import (
+    ObservationCanonicalizer,
+    to_real_probabilities,
+)
+
+
+def decision_key(observation: np.ndarray, action_mask: np.ndarray) -> bytes:
+    """Digest of everything the policy sees for one decision"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(observation).tobytes())
+    digest.update(np.ascontiguousarray(action_mask, dtype=np.int8).tobytes())
+
+    return digest.digest()
+
+
+class CachedPolicy(Policy):
+    """Serves repeated decisions of a policy from a bounded LRU cache.
+
+    Decisions are keyed by a digest of the observation and action mask, or by
+    ``key_function`` when given, e.g. a canonical information set key. Only the
+    misses of a batch go through the wrapped policy, a batch of hits does no
+    forward pass at all. The cache is cleared when the ``weights_version`` of
+    the wrapped policy changes; call ``invalidate`` after changing weights in
+    place.
+    """
+
+    def __init__(
+        self, policy: Policy, max_size: int = 100_000, key_function=None
+    ):
+        if max_size < 1:
+            raise ValueError("The policy cache needs room for a decision")
+
+        self.policy = policy
+        self.max_size = max_size
+        self.key_function = key_function or decision_key
+        self.entries: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self.weights_version = getattr(policy, "weights_version", 0)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        self.entries.clear()
+        self.invalidations += 1
+
+    def action_probabilities(self, observations, action_masks):
+        weights_version = getattr(self.policy, "weights_version", 0)
+
+        if weights_version != self.weights_version:
+            self.weights_version = weights_version
+            self.invalidate()
+
+        keys = [
+            self.key_function(observation, action_mask)
+            for observation, action_mask in zip(observations, action_masks)
+        ]
+        probabilities = np.empty(
+            (len(keys), np.shape(action_masks)[1]), dtype=np.float32
+        )
+        missed_rows = []
+
+        for row, key in enumerate(keys):
+            cached = self.entries.get(key)
+
+            if cached is None:
+                missed_rows.append(row)
+            else:
+                self.entries.move_to_end(key)
+                probabilities[row] = cached
+
+        self.hits += len(keys) - len(missed_rows)
+        self.misses += len(missed_rows)
+
+        if not missed_rows:
+            return probabilities
+
+        probabilities[missed_rows] = self.policy.action_probabilities(
+            np.asarray(observations)[missed_rows],
+            np.asarray(action_masks)[missed_rows],
+        )
+
+        for row in missed_rows:
+            # Equal decisions within one batch are computed twice but stored once
+            self.entries[keys[row]] = probabilities[row].copy()
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        return probabilities
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "invalidations": self.invalidations,
+        }
+
+
+class CanonicalPolicy(Policy):
+    """Runs a policy on suit-canonical observations.
+
+    Observations and masks are relabeled into canonical suit order before
+    they reach the wrapped policy and its probabilities are mapped back to
+    the real card actions. Wrapping a CachedPolicy shares its entries between
+    decisions that only differ by a relabeling of the suits. The wrapped
+    policy should be trained on canonical observations, e.g. with the
+    canonical_suits option of ToepEnv.
+    """
+
+    def __init__(
+        self, policy: Policy, n_players: int = 4, hand_strength=False
+    ):
+        self.policy = policy
+        self.canonicalizer = ObservationCanonicalizer(n_players, hand_strength)
+
+    def action_probabilities(self, observations, action_masks):
+        observations, action_masks, permutations = (
+            self.canonicalizer.canonicalize(observations, action_masks)
+        )
+
+        return to_real_probabilities(
+            self.policy.action_probabilities(observations, action_masks),
+            permutations,
+        )
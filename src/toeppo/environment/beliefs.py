@@ -0,0 +1,362 @@
+"""What one seat can know about the hidden cards of a round.
+
+A BeliefTracker follows a round from one seat. It tracks which cards were
+played and which cards that seat holds. It also tracks hands revealed by a
+false vuile was, and the suits a seat is void in because it did not follow
+the leading suit. Card sets are bitmasks over card indices.
+
+Every card of a suit that is still hidden can go to the same seats, so a
+deal is fixed up to relabeling within suits by how many cards of each suit
+every hidden hand gets. Counting the deals that complete every such choice
+lets hands be sampled exactly uniformly from the consistent deals, with no
+rejected samples however constrained the round is.
+
+Usage:
+    tracker = BeliefTracker(n_players=4, seat=0)
+    tracker.update(game)  # after every decision of the round
+    hands = tracker.sample_hands(1000, rng)
+    world = determinize(game, hands[0], rng)
+"""
+
+import math
+
+import numpy as np
+
+from toeppo.environment.toep_game import (
+    CARDS_PER_PLAYER,
+    NOTHING,
+    NUMBER_OF_CARDS,
+    RANKS,
+    SUITS,
+    Card,
+    Deck,
+    ToepGame,
+)
+
+N_SUITS = len(SUITS)
+N_RANKS = len(RANKS)
+ALL_CARDS = (1 << NUMBER_OF_CARDS) - 1
+SUIT_CARDS = tuple(
+    ((1 << N_RANKS) - 1) << (N_RANKS * suit) for suit in range(N_SUITS)
+)
+
+
+def card_mask(cards) -> int:
+    mask = 0
+
+    for card in cards:
+        mask |= 1 << card.index
+
+    return mask
+
+
+def mask_indices(mask: int) -> list[int]:
+    return [index for index in range(NUMBER_OF_CARDS) if mask >> index & 1]
+
+
+def suit_compositions(n_cards: int, limits: tuple[int, ...]):
+    """Every way to take n_cards with at most limits[suit] of each suit"""
+    if len(limits) == 1:
+        if n_cards <= limits[0]:
+            yield (n_cards,)
+        return
+
+    for count in range(min(n_cards, limits[0]) + 1):
+        for rest in suit_compositions(n_cards - count, limits[1:]):
+            yield (count, *rest)
+
+
+class BeliefTracker:
+    """Card knowledge of one seat, fed by the events of a round.
+
+    Call ``update`` with the game after every decision, or feed the events
+    yourself. A seat that looked at a true vuile was knows the old hand
+    went into the deck. ``update`` cannot see that, so pass it to
+    ``hand_replaced``.
+
+    :param card_indices:
+        Cards of the deck the game deals from, the full deck if None
+    """
+
+    def __init__(self, n_players: int, seat: int, card_indices=None):
+        self.n_players = n_players
+        self.seat = seat
+        self.deck_cards = (
+            ALL_CARDS
+            if card_indices is None
+            else card_mask(map(Card.from_index, card_indices))
+        )
+        self.round_key = None
+        self.start_round(())
+
+    def start_round(self, hand):
+        self.played = 0
+        self.in_deck = 0
+        self.known_hands = [0] * self.n_players
+        self.known_hands[self.seat] = card_mask(hand)
+        self.hand_sizes = [CARDS_PER_PLAYER] * self.n_players
+        self.pile_sizes = [0] * self.n_players
+        # Per seat a bitmask of suit indices it cannot hold
+        self.void_suits = [0] * self.n_players
+        self.revealed_mask = 1 << self.seat
+        self.leading_suits = {}
+        self.invalidate()
+
+    def invalidate(self):
+        # Completion counts and choices per (hidden hand, remaining suits)
+        self.completions = {}
+        self.choices = {}
+
+    # Events
+    def card_played(self, seat: int, card: Card, leading_suit=None):
+        bit = 1 << card.index
+        self.played |= bit
+        self.known_hands[seat] &= ~bit
+        self.hand_sizes[seat] -= 1
+        self.pile_sizes[seat] += 1
+
+        if leading_suit is not None and card.suit != leading_suit:
+            self.void_suits[seat] |= 1 << (leading_suit.value - 1)
+
+        self.invalidate()
+
+    def hand_revealed(self, seat: int, cards):
+        self.known_hands[seat] = card_mask(cards)
+        self.hand_sizes[seat] = len(cards)
+        self.revealed_mask |= 1 << seat
+        self.invalidate()
+
+    def hand_replaced(self, seat: int, old_cards=None, new_cards=None):
+        """
+        A true vuile was: the old hand went under the deck, a new one was drawn.
+        :param old_cards:
+            The old hand when it was seen, else whatever was known of it
+        :param new_cards:
+            The new hand when it is seen
+        """
+        old_hand = (
+            self.known_hands[seat]
+            if old_cards is None
+            else card_mask(old_cards)
+        )
+        self.in_deck |= old_hand
+        self.known_hands[seat] = (
+            0 if new_cards is None else card_mask(new_cards)
+        )
+        self.hand_sizes[seat] = CARDS_PER_PLAYER
+        self.void_suits[seat] = 0
+        self.invalidate()
+
+    def update(self, game: ToepGame):
+        """Feed what happened in the game since the last update"""
+        players = game.players
+        round_key = (game.finished_games, game.finished_rounds)
+
+        if round_key != self.round_key:
+            self.round_key = round_key
+            self.start_round(players[self.seat].hand)
+
+        # The leading suit is known to everyone for the sub round in play
+        if game.leading_suit is not None:
+            self.leading_suits[game.sub_round] = game.leading_suit
+
+        for seat, player in enumerate(players):
+            pile = player.pile
+
+            # Pile position p was played in sub round p + 1
+            for position in range(self.pile_sizes[seat], len(pile)):
+                self.card_played(
+                    seat, pile[position], self.leading_suits.get(position + 1)
+                )
+
+            if player.play_open and not self.revealed_mask & (1 << seat):
+                self.hand_revealed(seat, player.hand)
+
+        hand = card_mask(players[self.seat].hand)
+
+        if hand != self.known_hands[self.seat]:
+            self.hand_replaced(self.seat, new_cards=players[self.seat].hand)
+
+    # Sampling
+    @property
+    def hidden_cards(self) -> int:
+        """Cards that could be in any hidden hand or in the deck"""
+        known = self.played | self.in_deck
+
+        for hand in self.known_hands:
+            known |= hand
+
+        return self.deck_cards & ~known
+
+    def hidden_needs(self) -> list[tuple[int, int]]:
+        """Seats with unknown cards and how many they hold"""
+        return [
+            (seat, size - self.known_hands[seat].bit_count())
+            for seat, size in enumerate(self.hand_sizes)
+            if size > self.known_hands[seat].bit_count()
+        ]
+
+    def hidden_suit_counts(self) -> tuple[int, ...]:
+        hidden = self.hidden_cards
+
+        return tuple((hidden & cards).bit_count() for cards in SUIT_CARDS)
+
+    def count_completions(self, position: int, remaining: tuple) -> int:
+        """Deals of the hidden hands from position on, from remaining cards"""
+        key = (position, remaining)
+        count = self.completions.get(key)
+
+        if count is not None:
+            return count
+
+        needs = self.hidden_needs()
+
+        if position == len(needs):
+            # The deck takes whatever is left, in any order
+            count = 1
+        else:
+            seat, n_cards = needs[position]
+            void_suits = self.void_suits[seat]
+            limits = tuple(
+                0 if void_suits & (1 << suit) else remaining[suit]
+                for suit in range(N_SUITS)
+            )
+            counts = []
+            weights = []
+
+            for composition in suit_compositions(n_cards, limits):
+                rest = tuple(
+                    left - taken for left, taken in zip(remaining, composition)
+                )
+                weight = math.prod(
+                    math.comb(left, taken)
+                    for left, taken in zip(remaining, composition)
+                ) * self.count_completions(position + 1, rest)
+
+                if weight:
+                    counts.append(composition)
+                    weights.append(weight)
+
+            count = sum(weights)
+
+            if count:
+                self.choices[key] = (
+                    np.array(counts, dtype=np.int64),
+                    np.array(weights, dtype=np.float64) / count,
+                )
+
+        self.completions[key] = count
+
+        return count
+
+    @property
+    def n_consistent_deals(self) -> int:
+        return self.count_completions(0, self.hidden_suit_counts())
+
+    def sample_hands(
+        self, n_samples: int, rng: np.random.Generator = None
+    ) -> np.ndarray:
+        """
+        Hands of every seat, uniformly from the deals consistent with the beliefs.
+        :return:
+            (n_samples, n_players, CARDS_PER_PLAYER) uint8 card indices,
+            NOTHING after the last card of a hand
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+
+        remaining_counts = self.hidden_suit_counts()
+
+        if self.count_completions(0, remaining_counts) == 0:
+            raise ValueError("No deal is consistent with the beliefs")
+
+        needs = self.hidden_needs()
+        # Suit counts every hidden hand gets, drawn hand by hand
+        taken = np.zeros((n_samples, len(needs), N_SUITS), dtype=np.int64)
+        remaining = np.tile(remaining_counts, (n_samples, 1))
+
+        for position in range(len(needs)):
+            states, inverse = np.unique(remaining, axis=0, return_inverse=True)
+
+            for state_index, state in enumerate(states):
+                rows = np.flatnonzero(inverse.ravel() == state_index)
+                counts, probabilities = self.choices[
+                    (position, tuple(state.tolist()))
+                ]
+                taken[rows, position] = counts[
+                    rng.choice(len(counts), len(rows), p=probabilities)
+                ]
+
+            remaining -= taken[:, position]
+
+        # Owner of every card, the hidden position, len(needs) for the deck
+        hidden = self.hidden_cards
+        owners = np.full((n_samples, NUMBER_OF_CARDS), -1, dtype=np.int64)
+        bounds = taken.cumsum(axis=1)
+
+        for suit, cards in enumerate(SUIT_CARDS):
+            suit_indices = np.array(mask_indices(hidden & cards))
+
+            if not len(suit_indices):
+                continue
+
+            shuffled = suit_indices[
+                rng.random((n_samples, len(suit_indices))).argsort(axis=1)
+            ]
+            slots = np.arange(len(suit_indices))
+            owners[np.arange(n_samples)[:, None], shuffled] = (
+                slots[None, :, None] >= bounds[:, None, :, suit]
+            ).sum(axis=2)
+
+        hands = np.full(
+            (n_samples, self.n_players, CARDS_PER_PLAYER),
+            NOTHING,
+            dtype=np.uint8,
+        )
+        card_indices = np.arange(NUMBER_OF_CARDS)
+
+        for seat, known in enumerate(self.known_hands):
+            hands[:, seat, : known.bit_count()] = mask_indices(known)
+
+        for position, (seat, n_cards) in enumerate(needs):
+            n_known = self.known_hands[seat].bit_count()
+            # Sorting puts the cards of the hand first
+            cards = np.sort(
+                np.where(owners == position, card_indices, NUMBER_OF_CARDS),
+                axis=1,
+            )[:, :n_cards]
+            hands[:, seat, n_known : n_known + n_cards] = cards
+
+        return hands
+
+
+def determinize(
+    game: ToepGame, hands: np.ndarray, rng: np.random.Generator = None
+) -> ToepGame:
+    """
+    Copy of the game with the sampled hands and the other cards in the deck.
+    :param hands:
+        (n_players, CARDS_PER_PLAYER) card indices, e.g. from sample_hands
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    world = ToepGame.from_bytes(game.to_bytes())
+    used = 0
+
+    for player, hand in zip(world.players, hands):
+        player.hand.set_cards(
+            Card.from_index(index)
+            for index in hand.tolist()
+            if index != NOTHING
+        )
+        used |= card_mask(player.hand) | card_mask(player.pile)
+
+    # Only cards that are still somewhere can be in the deck
+    left = card_mask(game.deck) | card_mask(
+        card for player in game.players for card in player.hand
+    )
+    deck = mask_indices(left & ~used)
+    world.deck = Deck.from_indices(rng.permutation(deck).tolist())
+
+    return world
@@ -0,0 +1,82 @@
+"""Seeded bank of pre-generated deals.
+
+A deal is a permutation of the deck indices, stored as one uint8 row of a
+.npy file that is opened memory-mapped. A ToepGame given a DealBank takes
+the deck of every round, and with that the cards of vuile was redraws, from
+the bank instead of shuffling, so the same deals can be replayed exactly.
+
+Usage: python -m toeppo.environment.deal_bank OUTPUT N_DEALS [--seed SEED]
+"""
+
+import argparse
+
+import numpy as np
+
+from toeppo.environment.toep_game import NUMBER_OF_CARDS, Deck
+
+
+class DealBank:
+    def __init__(self, deals: np.ndarray):
+        if deals.ndim != 2 or deals.shape[1] != NUMBER_OF_CARDS:
+            raise ValueError(f"Unexpected shape of deals {deals.shape}")
+
+        self.deals = deals
+        self.position = 0
+
+    @classmethod
+    def generate(cls, path, n_deals: int, seed: int = 0) -> "DealBank":
+        rng = np.random.default_rng(seed)
+        deals = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.uint8, shape=(n_deals, NUMBER_OF_CARDS)
+        )
+        deals[:] = rng.permuted(
+            np.tile(np.arange(NUMBER_OF_CARDS, dtype=np.uint8), (n_deals, 1)),
+            axis=1,
+        )
+        deals.flush()
+        del deals
+
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path) -> "DealBank":
+        return cls(np.load(path, mmap_mode="r"))
+
+    def __reduce__(self):
+        # Map the file again on unpickling instead of copying the deals
+        if isinstance(self.deals, np.memmap):
+            return load_at, (self.deals.filename, self.position)
+
+        return type(self), (np.asarray(self.deals),), self.__dict__
+
+    def __len__(self):
+        return len(self.deals)
+
+    def deck(self, deal_index: int) -> Deck:
+        return Deck.from_indices(self.deals[deal_index].tolist())
+
+    def next_deck(self) -> Deck:
+        deck = self.deck(self.position)
+        self.position = (self.position + 1) % len(self)
+
+        return deck
+
+    def seek(self, deal_index: int):
+        self.position = deal_index % len(self)
+
+
+def load_at(path, position: int) -> DealBank:
+    deal_bank = DealBank.load(path)
+    deal_bank.seek(position)
+
+    return deal_bank
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("n_deals", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    DealBank.generate(args.output, args.n_deals, args.seed)
@@ -0,0 +1,239 @@
+"""Precomputed strength of every four-card starting hand.
+
+For every hand and player count the table holds the expected share of the
+four tricks the hand wins and the probability it wins the last trick, and
+with that the round. Both are estimated offline by playing out random deals
+of the remaining cards with uniformly random legal play, following the
+trick rules of ToepGame: the highest card of the leading suit wins the trick
+and its owner leads the next one.
+
+Hands are indexed by the rank of their card set in the combinatorial number
+system, so a lookup is a handful of additions. The table is stored as a .npy
+file and opened memory-mapped and read-only, so worker processes share one
+copy through the page cache.
+
+Usage: python -m toeppo.environment.hand_strength OUTPUT [--samples N]
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+import random
+
+import numpy as np
+
+from toeppo.environment.toep_game import (
+    CARDS_PER_PLAYER,
+    NUMBER_OF_CARDS,
+    Card,
+    Deck,
+)
+
+N_HANDS = math.comb(NUMBER_OF_CARDS, CARDS_PER_PLAYER)
+MIN_PLAYERS = 2
+MAX_PLAYERS = NUMBER_OF_CARDS // CARDS_PER_PLAYER
+TRICK_WIN = 0
+ROUND_WIN = 1
+
+CARD_SUITS = tuple(card.suit.value for card in Deck())
+CARD_VALUES = tuple(card.value for card in Deck())
+
+# BINOMIALS[k][n] = n choose k
+BINOMIALS = tuple(
+    tuple(math.comb(n, k) for n in range(NUMBER_OF_CARDS))
+    for k in range(CARDS_PER_PLAYER + 1)
+)
+
+
+def hand_rank(card_indices) -> int:
+    """Rank of a four-card set among all N_HANDS sets, independent of order"""
+    rank = 0
+
+    for k, card_index in enumerate(sorted(card_indices), start=1):
+        rank += BINOMIALS[k][card_index]
+
+    return rank
+
+
+def hand_from_rank(rank: int) -> tuple[int, ...]:
+    card_indices = []
+
+    for k in range(CARDS_PER_PLAYER, 0, -1):
+        card_index = k - 1
+        while (
+            card_index + 1 < NUMBER_OF_CARDS
+            and BINOMIALS[k][card_index + 1] <= rank
+        ):
+            card_index += 1
+
+        card_indices.append(card_index)
+        rank -= BINOMIALS[k][card_index]
+
+    return tuple(reversed(card_indices))
+
+
+def card_indices_of(cards) -> list[int]:
+    return [card.index if isinstance(card, Card) else card for card in cards]
+
+
+class HandStrengthTable:
+    def __init__(self, table: np.ndarray):
+        if table.shape != (MAX_PLAYERS - MIN_PLAYERS + 1, N_HANDS, 2):
+            raise ValueError(f"Unexpected hand strength table {table.shape}")
+
+        self.table = table
+
+    @classmethod
+    def load(cls, path) -> "HandStrengthTable":
+        return cls(np.load(path, mmap_mode="r"))
+
+    def __reduce__(self):
+        # Let worker processes map the file again instead of copying the table
+        if isinstance(self.table, np.memmap):
+            return type(self).load, (self.table.filename,)
+
+        return type(self), (np.asarray(self.table),)
+
+    def lookup(self, cards, n_players: int) -> np.ndarray:
+        """Trick-win and round-win probability of a hand of Cards or card indices"""
+        rank = hand_rank(card_indices_of(cards))
+
+        return self.table[n_players - MIN_PLAYERS, rank]
+
+    def trick_win_probability(self, cards, n_players: int) -> float:
+        return float(self.lookup(cards, n_players)[TRICK_WIN])
+
+    def round_win_probability(self, cards, n_players: int) -> float:
+        return float(self.lookup(cards, n_players)[ROUND_WIN])
+
+
+def play_out(
+    hands: list[list[int]], leader: int, rng: random.Random
+) -> list[int]:
+    """Play four tricks with random legal cards, returns the winner of every trick"""
+    n_players = len(hands)
+    hands = [list(hand) for hand in hands]
+    trick_winners = []
+
+    for _ in range(CARDS_PER_PLAYER):
+        leading_card = hands[leader].pop(rng.randrange(len(hands[leader])))
+        leading_suit = CARD_SUITS[leading_card]
+        winner = leader
+        best_value = CARD_VALUES[leading_card]
+
+        for offset in range(1, n_players):
+            seat = (leader + offset) % n_players
+            hand = hands[seat]
+            following = [
+                index
+                for index, card in enumerate(hand)
+                if CARD_SUITS[card] == leading_suit
+            ]
+
+            if following:
+                card = hand.pop(following[rng.randrange(len(following))])
+            else:
+                card = hand.pop(rng.randrange(len(hand)))
+
+            if (
+                CARD_SUITS[card] == leading_suit
+                and CARD_VALUES[card] > best_value
+            ):
+                winner = seat
+                best_value = CARD_VALUES[card]
+
+        trick_winners.append(winner)
+        leader = winner
+
+    return trick_winners
+
+
+def estimate_hand_strengths(
+    ranks: range, player_counts: list[int], samples: int, seed: int
+) -> np.ndarray:
+    strengths = np.zeros((len(player_counts), len(ranks), 2), np.float32)
+
+    for position, rank in enumerate(ranks):
+        rng = random.Random(seed * N_HANDS + rank)
+        hand = list(hand_from_rank(rank))
+        rest = [index for index in range(NUMBER_OF_CARDS) if index not in hand]
+
+        for count_index, n_players in enumerate(player_counts):
+            tricks_won = 0
+            rounds_won = 0
+
+            for _ in range(samples):
+                rng.shuffle(rest)
+                hands = [hand] + [
+                    rest[i * CARDS_PER_PLAYER : (i + 1) * CARDS_PER_PLAYER]
+                    for i in range(n_players - 1)
+                ]
+                trick_winners = play_out(hands, rng.randrange(n_players), rng)
+
+                tricks_won += trick_winners.count(0)
+                rounds_won += trick_winners[-1] == 0
+
+            strengths[count_index, position, TRICK_WIN] = tricks_won / (
+                samples * CARDS_PER_PLAYER
+            )
+            strengths[count_index, position, ROUND_WIN] = rounds_won / samples
+
+    return strengths
+
+
+def compute_hand_strength_table(
+    path,
+    samples: int = 256,
+    processes: int = None,
+    seed: int = 0,
+    chunk_size: int = 512,
+) -> HandStrengthTable:
+    """
+    Estimate the strength of all hands in parallel and write the table to path.
+    :param samples:
+        Random deals played out per hand and player count
+    :param processes:
+        Worker processes, all cores if None
+    """
+    player_counts = list(range(MIN_PLAYERS, MAX_PLAYERS + 1))
+    table = np.lib.format.open_memmap(
+        path,
+        mode="w+",
+        dtype=np.float32,
+        shape=(len(player_counts), N_HANDS, 2),
+    )
+    chunks = [
+        range(start, min(start + chunk_size, N_HANDS))
+        for start in range(0, N_HANDS, chunk_size)
+    ]
+
+    with ProcessPoolExecutor(processes or os.cpu_count()) as executor:
+        results = executor.map(
+            estimate_hand_strengths,
+            chunks,
+            [player_counts] * len(chunks),
+            [samples] * len(chunks),
+            [seed] * len(chunks),
+        )
+
+        for chunk, strengths in zip(chunks, results):
+            table[:, chunk.start : chunk.stop] = strengths
+
+    table.flush()
+    del table
+
+    return HandStrengthTable.load(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    compute_hand_strength_table(
+        args.output, args.samples, args.processes, args.seed
+    )
@@ -1,11 +1,9 @@
-import gymnasium as gym
 from gymnasium.spaces import (
     Dict,
     Discrete,
     MultiDiscrete,
     MultiBinary,
     Box,
-    flatten,
     flatten_space,
 )
 import numpy as np
@@ -19,11 +17,13 @@ class ToepObservationSpace:
         card_to_number_mapping: dict,
         max_score=15,
         max_score_multiplier=10,
+        hand_strength_features=False,
     ):
         self.num_players = num_players
         self.max_cards_per_pile = num_cards_per_player
         self.card_to_number_dict = card_to_number_mapping
         self.num_cards_per_player = num_cards_per_player
+        self.hand_strength_features = hand_strength_features
         highest_number = max(self.card_to_number_dict.values())
 
         # Define subspaces for different elements of the observation
@@ -46,17 +46,23 @@ class ToepObservationSpace:
         self.sub_round_number_space = Discrete(self.num_cards_per_player + 1)
         self.action_type_space = Discrete(4)
 
+        # Trick-win and round-win probability of the starting hand
+        self.hand_strength_space = Box(0.0, 1.0, (2,), dtype=np.float32)
+
         # Combine all subspaces into a dictionary space
-        self.observation_space_dict = Dict(
-            {
-                "player_hands": self.player_hands_space,
-                "player_piles": self.player_piles_space,
-                "player_scores": self.player_scores_space,
-                "turn_number": self.turn_number_space,
-                "sub_round_number": self.sub_round_number_space,
-                "action_type": self.action_type_space,
-            }
-        )
+        subspaces = {
+            "player_hands": self.player_hands_space,
+            "player_piles": self.player_piles_space,
+            "player_scores": self.player_scores_space,
+            "turn_number": self.turn_number_space,
+            "sub_round_number": self.sub_round_number_space,
+            "action_type": self.action_type_space,
+        }
+
+        if self.hand_strength_features:
+            subspaces["hand_strength"] = self.hand_strength_space
+
+        self.observation_space_dict = Dict(subspaces)
 
         # Create a Box space
         self.observation_space_flattened = flatten_space(
@@ -98,6 +104,9 @@ class ToepObservationSpace:
             "action_type": action_type,
         }
 
+        if self.hand_strength_features:
+            dictionary["hand_strength"] = np.zeros(2, dtype=np.float32)
+
         # return flatten(self.observation_space_dict, dictionary)
         return dictionary
 
@@ -121,4 +130,7 @@ class ToepObservationSpace:
             + np.prod(action_type_shape)
         )
 
+        if self.hand_strength_features:
+            total_size += int(np.prod(self.hand_strength_space.shape))
+
         return (total_size,)
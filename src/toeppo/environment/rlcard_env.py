@@ -0,0 +1,387 @@
+"""RLCard environment of Toepen, for RLCard's DMC and NFSP trainers.
+
+ToepRLCardGame gives ToepGame the game interface RLCard envs drive and
+ToepRLCardEnv is the RLCard Env around it. Actions are numbered as in
+ToepEnv; the raw actions are their names. An episode is a round or a game,
+as the "round" and "game" episode modes of ToepEnv, and the payoffs are the
+rewards ToepEnv gives over that episode.
+
+The state of a seat is a compact float32 vector instead of the one-hot
+ToepEnv observation. Seats are listed from the observer on, so the same
+model works from every seat. Per seat it has the known hand, the pile and
+the card of the sub round as 32-card bitmaps, then the score over
+MAX_SCORE and flags. After the seats come the action type, sub round and
+leading suit one-hot and the stake over MAX_SCORE.
+
+Usage:
+    env = ToepRLCardEnv({"seed": 0, "episode_mode": "round"})
+    state, player_id = env.reset()
+    state, player_id = env.step(next(iter(state["legal_actions"])))
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+from rlcard.envs import Env
+
+from toeppo.environment.toep_env import (
+    CARD_NUMBER_OFFSET,
+    GAME_EPISODES,
+    NUMBER_TO_CARD,
+    ROUND_EPISODES,
+    STATISTICS,
+    ToepEnv,
+    action_mask,
+    action_type_to_int,
+    apply_action,
+)
+from toeppo.environment.toep_game import (
+    CARDS_PER_PLAYER,
+    NUMBER_OF_CARDS,
+    PHASE_TO_ACTION_TYPE,
+    SUITS,
+    ActionType,
+    ToepGame,
+)
+
+# Actions before the cards are named as their statistics
+ACTION_NAMES = STATISTICS[:CARD_NUMBER_OFFSET] + tuple(
+    str(NUMBER_TO_CARD[action])
+    for action in range(CARD_NUMBER_OFFSET, ToepEnv.ACTION_SPACE_SIZE)
+)
+ACTION_NUMBERS = {name: action for action, name in enumerate(ACTION_NAMES)}
+
+# Hand, pile and card of the sub round bitmaps, score, alive, play open,
+# toeped last, called vuile was and dealing flags
+SEAT_FEATURES = 3 * NUMBER_OF_CARDS + 6
+# Action type, sub round 0 to CARDS_PER_PLAYER, leading suit and stake
+GAME_FEATURES = 4 + CARDS_PER_PLAYER + 1 + len(SUITS) + 1
+
+DEFAULT_CONFIG = {
+    "allow_step_back": False,
+    "seed": None,
+    "n_players": 4,
+    "episode_mode": ROUND_EPISODES,
+    "losing_penalty_multiplier": 10,
+}
+
+
+def state_size(n_players: int) -> int:
+    return n_players * SEAT_FEATURES + GAME_FEATURES
+
+
+def encode_state(
+    game: ToepGame, seat: int, action_type: ActionType
+) -> np.ndarray:
+    """Compact float32 encoding of the game as seat sees it"""
+    n_players = game.n_players
+    state = np.zeros(state_size(n_players), dtype=np.float32)
+
+    for position in range(n_players):
+        player = game.players[(seat + position) % n_players]
+        features = state[position * SEAT_FEATURES :]
+
+        if player.seat == seat or player.play_open:
+            for card in player.hand:
+                features[card.index] = 1.0
+
+        for card in player.pile:
+            features[NUMBER_OF_CARDS + card.index] = 1.0
+
+        if 1 <= game.sub_round <= len(player.pile):
+            card = player.pile[game.sub_round - 1]
+            features[2 * NUMBER_OF_CARDS + card.index] = 1.0
+
+        flags = features[3 * NUMBER_OF_CARDS : SEAT_FEATURES]
+        flags[0] = player.score / game.MAX_SCORE
+        flags[1] = game.is_alive(player.seat)
+        flags[2] = player.play_open
+        flags[3] = game.last_seat_to_toep == player.seat
+        flags[4] = game.called_vuile_was == player.seat
+        flags[5] = game.dealing_seat == player.seat
+
+    features = state[n_players * SEAT_FEATURES :]
+    features[action_type_to_int(action_type)] = 1.0
+    features[4 + game.sub_round] = 1.0
+
+    if game.leading_suit is not None:
+        features[5 + CARDS_PER_PLAYER + game.leading_suit.value - 1] = 1.0
+
+    features[-1] = game.stake / game.MAX_SCORE
+
+    return state
+
+
+class ToepRLCardGame:
+    """ToepGame behind the game interface of RLCard envs.
+
+    :param episode_mode:
+        "round" to end an episode after every round, the scores carry over
+        to the next episode until the game ends, or "game" to end it when a
+        player reaches MAX_SCORE
+    :param losing_penalty_multiplier:
+        Penalty per point over MAX_SCORE - 1 for losing the game, as in
+        ToepEnv
+    """
+
+    def __init__(
+        self,
+        n_players: int = 4,
+        episode_mode: str = ROUND_EPISODES,
+        losing_penalty_multiplier: int = 10,
+        allow_step_back: bool = False,
+    ):
+        if episode_mode not in (ROUND_EPISODES, GAME_EPISODES):
+            raise ValueError(f"Unknown episode mode {episode_mode}")
+
+        self.game = ToepGame(n_players)
+        self.episode_mode = episode_mode
+        self.losing_penalty_multiplier = losing_penalty_multiplier
+        self.allow_step_back = allow_step_back
+        # Serialized states before every action, for step_back
+        self.history = []
+        self._np_random = None
+        self.base_seed = None
+        # Copies pickled from this one so far, and which copy this one is
+        self.copies = 0
+        self.actor_index = None
+        # Whether self.game is seeded yet
+        self.game_seeded = False
+        # Counters at the start of the episode, None before the first one
+        self.start_scores = None
+        self.start_rounds = None
+        self.start_games = None
+
+    @property
+    def np_random(self) -> np.random.RandomState:
+        return self._np_random
+
+    @np_random.setter
+    def np_random(self, np_random: np.random.RandomState):
+        # RLCard seeds through this, ToepGame shuffles with its own generator
+        self._np_random = np_random
+        self.base_seed = int(np_random.randint(2**31))
+        self.game_seeded = False
+        self.seed_game()
+
+    def seed_game(self):
+        """Seed the game, copies with the seed of their actor index.
+
+        DMC pickles the seeded env into every actor process. A pickled
+        ToepGame loses its generator, and the actors would all play the
+        same deals if they were seeded alike. Copies are numbered in the
+        order they are pickled, which DMC does actor by actor, and copy i
+        takes child i of SeedSequence.spawn on the base seed.
+        """
+        if self.base_seed is None or self.game_seeded:
+            return
+
+        seed = self.base_seed
+
+        if self.actor_index is not None:
+            seed_sequence = np.random.SeedSequence(self.base_seed)
+            child = seed_sequence.spawn(self.actor_index + 1)[-1]
+            seed = int(child.generate_state(1)[0])
+
+        self.game.seed(seed)
+        self.game_seeded = True
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["copies"] = 0
+        state["actor_index"] = self.copies
+        state["game_seeded"] = False
+        self.copies += 1
+
+        return state
+
+    @property
+    def ended_on_round(self) -> bool:
+        """Whether the last episode terminated at the end of a round"""
+        return (
+            self.episode_mode == ROUND_EPISODES
+            and self.start_rounds is not None
+            and self.is_over()
+        )
+
+    def init_game(self) -> tuple[dict, int]:
+        game = self.game
+        self.seed_game()
+
+        # Only a finished round leaves the next round of the game dealt
+        if not (self.ended_on_round and game.phase in PHASE_TO_ACTION_TYPE):
+            game.reset()
+            game.start_round()
+
+        self.history = []
+        self.start_scores = game.scores
+        self.start_rounds = game.finished_rounds
+        self.start_games = game.finished_games
+
+        return self.get_state(game.decision_seat), game.decision_seat
+
+    def step(self, action) -> tuple[dict, int]:
+        """Take an action number or name for the seat to decide"""
+        game = self.game
+
+        if self.allow_step_back:
+            self.history.append(game.to_bytes())
+
+        seat, _ = apply_action(
+            game.players[game.decision_seat],
+            ACTION_NUMBERS.get(action, action),
+        )
+
+        return self.get_state(seat), seat
+
+    def step_back(self) -> bool:
+        if not self.history:
+            return False
+
+        self.game.load_bytes(self.history.pop())
+
+        return True
+
+    @property
+    def action_type(self) -> ActionType:
+        return PHASE_TO_ACTION_TYPE[self.game.phase]
+
+    def get_legal_actions(self, seat: int = None) -> np.ndarray:
+        if seat is None:
+            seat = self.game.decision_seat
+
+        return action_mask(self.game, seat, self.action_type).nonzero()[0]
+
+    def get_state(self, seat: int) -> dict:
+        game = self.game
+        legal_actions = self.get_legal_actions(seat).tolist()
+
+        return {
+            "seat": seat,
+            "action_type": self.action_type,
+            "hand": [str(card) for card in game.players[seat].hand],
+            "piles": [
+                [str(card) for card in player.pile] for player in game.players
+            ],
+            "scores": game.scores,
+            "stake": game.stake,
+            "legal_actions": legal_actions,
+            "raw_legal_actions": [
+                ACTION_NAMES[action] for action in legal_actions
+            ],
+        }
+
+    def get_num_players(self) -> int:
+        return self.game.n_players
+
+    @staticmethod
+    def get_num_actions() -> int:
+        return ToepEnv.ACTION_SPACE_SIZE
+
+    def get_player_id(self) -> int:
+        return self.game.decision_seat
+
+    def is_over(self) -> bool:
+        if self.game.finished_games != self.start_games:
+            return True
+
+        return (
+            self.episode_mode == ROUND_EPISODES
+            and self.game.finished_rounds != self.start_rounds
+        )
+
+    def get_payoffs(self) -> np.ndarray:
+        """Score lost over the episode, plus the penalty for losing the game"""
+        game = self.game
+        ended_game = game.finished_games != self.start_games
+        # The next game has already started, its scores are reset
+        end_scores = game.last_game_scores if ended_game else game.scores
+        payoffs = np.array(self.start_scores, dtype=np.float64) - end_scores
+
+        if ended_game:
+            for player in game.players_that_lost:
+                payoffs[player.seat] -= (
+                    end_scores[player.seat] - game.MAX_SCORE + 1
+                ) * self.losing_penalty_multiplier
+
+        return payoffs
+
+
+class ToepRLCardEnv(Env):
+    """RLCard Env of Toepen, see the module docstring for the state.
+
+    :param config:
+        RLCard's "allow_step_back" and "seed", and the n_players,
+        episode_mode and losing_penalty_multiplier of ToepRLCardGame
+    """
+
+    def __init__(self, config: dict = None):
+        config = {**DEFAULT_CONFIG, **(config or {})}
+
+        self.name = "toepen"
+        self.default_game_config = {
+            key: DEFAULT_CONFIG[key]
+            for key in (
+                "n_players",
+                "episode_mode",
+                "losing_penalty_multiplier",
+            )
+        }
+        self.game = ToepRLCardGame(
+            config["n_players"],
+            config["episode_mode"],
+            config["losing_penalty_multiplier"],
+        )
+        self.state_shape = [
+            [state_size(config["n_players"])]
+            for _ in range(config["n_players"])
+        ]
+        # One-hot actions, RLCard's get_action_feature encodes them
+        self.action_shape = [None for _ in range(config["n_players"])]
+
+        super().__init__(config)
+
+    def _extract_state(self, state: dict) -> dict:
+        return {
+            "obs": encode_state(
+                self.game.game, state["seat"], state["action_type"]
+            ),
+            "legal_actions": OrderedDict(
+                (action, None) for action in state["legal_actions"]
+            ),
+            "raw_obs": state,
+            "raw_legal_actions": state["raw_legal_actions"],
+            "action_record": self.action_recorder,
+        }
+
+    def _decode_action(self, action_id: int) -> int:
+        return int(action_id)
+
+    def _get_legal_actions(self) -> OrderedDict:
+        return OrderedDict(
+            (int(action), None) for action in self.game.get_legal_actions()
+        )
+
+    def get_payoffs(self) -> np.ndarray:
+        return self.game.get_payoffs()
+
+    def get_perfect_information(self) -> dict:
+        game = self.game.game
+
+        return {
+            "hands": [
+                [str(card) for card in player.hand] for player in game.players
+            ],
+            "piles": [
+                [str(card) for card in player.pile] for player in game.players
+            ],
+            "deck": [str(card) for card in game.deck],
+            "scores": game.scores,
+            "stake": game.stake,
+            "phase": game.phase.name,
+            "current_player": game.decision_seat,
+            "legal_actions": [
+                ACTION_NAMES[action]
+                for action in self.game.get_legal_actions()
+            ],
+        }
@@ -0,0 +1,229 @@
+"""Bank of mid-game snapshots to start episodes from.
+
+Rare situations barely show up when every episode starts with a fresh deal:
+armoe rounds, high stakes after several toeps, vuile was bluffs. A
+ScenarioCollector watches a game while it is simulated and keeps the
+decision points that match its predicates. It keeps a uniform reservoir
+sample per predicate. Snapshots are ToepGame.to_bytes states, one uint8 row
+each. A ToepEnv given a ScenarioBank starts a share of its episodes from a
+sampled snapshot instead of a new game.
+
+Usage: python -m toeppo.environment.scenario_bank OUTPUT [--steps N]
+"""
+
+import argparse
+import functools
+import random
+
+import numpy as np
+
+from toeppo.environment.toep_game import (
+    PHASE_TO_ACTION_TYPE,
+    Phase,
+    ToepGame,
+    state_struct,
+)
+
+
+def armoe(game: ToepGame) -> bool:
+    return game.armoe
+
+
+def stake_at_least(game: ToepGame, min_stake: int) -> bool:
+    return game.stake >= min_stake
+
+
+def vuile_was_bluff(game: ToepGame) -> bool:
+    """A vuile was was called on a hand that is not one"""
+    return (
+        game.phase is Phase.CHECK_OR_TRUST
+        and not game.players[game.called_vuile_was].hand.vuile_was
+    )
+
+
+PREDICATES = {
+    "armoe": armoe,
+    "high_stake": functools.partial(stake_at_least, min_stake=4),
+    "vuile_was_bluff": vuile_was_bluff,
+}
+
+
+class ScenarioBank:
+    """Snapshots with the index of the predicate they matched.
+
+    Sampling picks a predicate uniformly and then one of its snapshots, so
+    the rarest kind of scenario is started from as often as the others.
+    """
+
+    def __init__(self, states: np.ndarray, labels: np.ndarray, names):
+        if states.ndim != 2 or len(states) != len(labels):
+            raise ValueError(
+                f"Unexpected shapes of states {states.shape} and labels "
+                f"{labels.shape}"
+            )
+
+        self.states = states
+        self.labels = labels
+        self.names = list(names)
+        self.rows = [
+            np.flatnonzero(labels == label) for label in range(len(names))
+        ]
+        self.rows = [rows for rows in self.rows if len(rows)]
+
+    @classmethod
+    def load(cls, path) -> "ScenarioBank":
+        with np.load(path) as data:
+            return cls(data["states"], data["labels"], data["names"].tolist())
+
+    def save(self, path):
+        np.savez(
+            path,
+            states=self.states,
+            labels=self.labels,
+            names=np.array(self.names),
+        )
+
+    def __len__(self):
+        return len(self.states)
+
+    def counts(self) -> dict[str, int]:
+        return {
+            name: int((self.labels == label).sum())
+            for label, name in enumerate(self.names)
+        }
+
+    def sample(self, rng=random) -> bytes:
+        if not self.rows:
+            raise ValueError("The scenario bank is empty")
+
+        rows = self.rows[rng.randrange(len(self.rows))]
+
+        return self.states[rows[rng.randrange(len(rows))]].tobytes()
+
+
+class ScenarioCollector:
+    """Keeps up to capacity snapshots of every predicate, uniformly sampled.
+
+    :param predicates:
+        Names and functions of the game that say whether to keep its state
+    """
+
+    def __init__(
+        self,
+        n_players: int,
+        predicates: dict = None,
+        capacity: int = 10_000,
+        seed: int = None,
+    ):
+        self.n_players = n_players
+        self.predicates = PREDICATES if predicates is None else predicates
+        self.capacity = capacity
+        self.rng = random.Random(seed)
+        self.reservoirs = {name: [] for name in self.predicates}
+        self.matches = dict.fromkeys(self.predicates, 0)
+
+    def observe(self, game: ToepGame):
+        """Call at decision points, e.g. after every action"""
+        state = None
+
+        for name, predicate in self.predicates.items():
+            if not predicate(game):
+                continue
+
+            if state is None:
+                state = game.to_bytes()
+
+            reservoir = self.reservoirs[name]
+            self.matches[name] += 1
+
+            if len(reservoir) < self.capacity:
+                reservoir.append(state)
+            else:
+                slot = self.rng.randrange(self.matches[name])
+
+                if slot < self.capacity:
+                    reservoir[slot] = state
+
+    def to_bank(self) -> ScenarioBank:
+        names = list(self.reservoirs)
+        states = [state for name in names for state in self.reservoirs[name]]
+        state_size = state_struct(self.n_players).size
+
+        return ScenarioBank(
+            np.frombuffer(b"".join(states), dtype=np.uint8).reshape(
+                -1, state_size
+            ),
+            np.repeat(
+                np.arange(len(names), dtype=np.uint8),
+                [len(self.reservoirs[name]) for name in names],
+            ),
+            names,
+        )
+
+
+def collect(
+    n_steps: int,
+    n_players: int = 4,
+    predicates: dict = None,
+    capacity: int = 10_000,
+    seed: int = 0,
+) -> ScenarioBank:
+    """Play random legal actions and collect the matching decision points"""
+    # Imported here, the env imports this module for its reset option
+    from toeppo.environment.toep_env import action_mask, apply_action
+
+    rng = random.Random(seed)
+    collector = ScenarioCollector(n_players, predicates, capacity, seed)
+    game = ToepGame(n_players)
+    game.seed(seed)
+    seat, action_type = game.start_round()
+
+    for _ in range(n_steps):
+        actions = action_mask(game, seat, action_type).nonzero()[0].tolist()
+        seat, action_type = apply_action(
+            game.players[seat], rng.choice(actions)
+        )
+        collector.observe(game)
+
+    return collector.to_bank()
+
+
+def load_scenario(game: ToepGame, bank: ScenarioBank, rng=random):
+    """Load a sampled snapshot into the game, return who decides what"""
+    game.load_bytes(bank.sample(rng))
+
+    return game.decision_seat, PHASE_TO_ACTION_TYPE[game.phase]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--steps", type=int, default=1_000_000)
+    parser.add_argument("--capacity", type=int, default=10_000)
+    parser.add_argument("--min-stake", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--predicates",
+        nargs="+",
+        choices=list(PREDICATES),
+        default=list(PREDICATES),
+    )
+    args = parser.parse_args()
+
+    predicates = {name: PREDICATES[name] for name in args.predicates}
+
+    if "high_stake" in predicates:
+        predicates["high_stake"] = functools.partial(
+            stake_at_least, min_stake=args.min_stake
+        )
+
+    bank = collect(
+        args.steps,
+        predicates=predicates,
+        capacity=args.capacity,
+        seed=args.seed,
+    )
+    bank.save(args.output)
+
+    for name, count in bank.counts().items():
+        print(f"{name}: {count}")
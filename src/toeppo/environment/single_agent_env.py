@@ -0,0 +1,167 @@
+"""Single-agent view of ToepEnv for standard gymnasium tooling.
+
+One seat is played by the learner, the other seats by fixed policies that
+run inside ``step``, so every learner step covers a full orbit of the table
+and opponent decisions never leave the process.
+
+Usage:
+    envs = gymnasium.vector.AsyncVectorEnv(
+        [lambda: ToepSingleAgentEnv(opponents=RandomPolicy())] * 8
+    )
+"""
+
+import gymnasium as gym
+import numpy as np
+
+from .toep_env import ToepEnv
+
+
+class ToepSingleAgentEnv(gym.Env):
+    metadata = {"render_modes": [], "name": "toeppo_single_agent"}
+
+    def __init__(
+        self,
+        opponents,
+        learner_seat: int = None,
+        n_players: int = 4,
+        explore_opponents: bool = False,
+        **env_kwargs,
+    ):
+        """
+        :param opponents:
+            One Policy for all other seats or a list with a Policy per seat,
+            the entry for the learner seat is ignored
+        :param learner_seat:
+            Seat of the learner, a random seat every reset if None
+        :param explore_opponents:
+            Sample opponent actions instead of taking the most likely one
+        """
+        self.env = ToepEnv(n_players, **env_kwargs)
+
+        if isinstance(opponents, (list, tuple)):
+            if len(opponents) != self.env.n_players:
+                raise ValueError("Need one opponent policy per seat")
+            self.opponents = list(opponents)
+        else:
+            self.opponents = [opponents] * self.env.n_players
+
+        self.fixed_learner_seat = learner_seat
+        self.learner_seat = 0 if learner_seat is None else learner_seat
+        self.explore_opponents = explore_opponents
+
+        agent = self.env.possible_agents[0]
+        self.observation_space = self.env.observation_space(agent)
+        self.action_space = self.env.action_space(agent)
+
+    @property
+    def learner_agent(self) -> str:
+        return self.env.possible_agents[self.learner_seat]
+
+    def reset(self, *, seed=None, options=None):
+        super().reset(seed=seed)
+
+        if self.fixed_learner_seat is None:
+            self.learner_seat = int(
+                self.np_random.integers(self.env.n_players)
+            )
+
+        self.env.reset(seed=seed, options=options)
+
+        self.play_opponents()
+
+        return self.env.observe(self.learner_agent), self.get_info()
+
+    def step(self, action):
+        learner_agent = self.learner_agent
+
+        if self.env.awaiting_responses:
+            actions = self.opponent_actions(self.env.responding_agents)
+            actions[learner_agent] = int(action)
+            self.env.step_responses(actions)
+        else:
+            self.env.step(int(action))
+        reward = self.env.rewards[learner_agent]
+        terminated = self.env.terminations[learner_agent]
+        truncated = self.env.truncations[learner_agent]
+
+        if not (terminated or truncated):
+            opponent_reward, terminated, truncated = self.play_opponents()
+            reward += opponent_reward
+
+        return (
+            self.env.observe(learner_agent),
+            float(reward),
+            terminated,
+            truncated,
+            self.get_info(),
+        )
+
+    def play_opponents(self) -> tuple[float, bool, bool]:
+        """Let the other seats act until it is the learner's turn again"""
+        env = self.env
+        learner_agent = self.learner_agent
+        reward = 0.0
+        terminated = truncated = False
+
+        while learner_agent not in env.responding_agents:
+            if env.awaiting_responses:
+                env.step_responses(
+                    self.opponent_actions(env.responding_agents)
+                )
+            else:
+                agent = env.agent_selection
+                policy = self.opponents[env.agent_name_mapping[agent]]
+                action = policy.compute_action(
+                    env.observe(agent), self.explore_opponents, self.np_random
+                )
+
+                env.step(action)
+
+            reward += env.rewards[learner_agent]
+            terminated = env.terminations[learner_agent]
+            truncated = env.truncations[learner_agent]
+
+            if terminated or truncated:
+                break
+
+        return reward, terminated, truncated
+
+    def opponent_actions(self, agents: list[str]) -> dict[str, int]:
+        """Actions of the opponents among agents, one call per opponent policy"""
+        env = self.env
+        policies = {}
+        agents_per_policy = {}
+
+        for agent in agents:
+            if agent == self.learner_agent:
+                continue
+
+            policy = self.opponents[env.agent_name_mapping[agent]]
+            policies[id(policy)] = policy
+            agents_per_policy.setdefault(id(policy), []).append(agent)
+
+        actions = {}
+
+        for key, policy_agents in agents_per_policy.items():
+            observations = [env.observe(agent) for agent in policy_agents]
+            policy_actions = policies[key].compute_actions(
+                np.stack([entry["observation"] for entry in observations]),
+                np.stack([entry["action_mask"] for entry in observations]),
+                self.explore_opponents,
+                self.np_random,
+            )
+            actions.update(zip(policy_agents, policy_actions.tolist()))
+
+        return actions
+
+    def get_info(self) -> dict:
+        return {
+            "learner_seat": self.learner_seat,
+            "action_mask": self.env.observe(self.learner_agent)["action_mask"],
+        }
+
+    def action_masks(self) -> np.ndarray:
+        return self.env.observe(self.learner_agent)["action_mask"]
+
+    def close(self):
+        self.env.close()
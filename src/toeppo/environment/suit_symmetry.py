@@ -0,0 +1,321 @@
+"""Relabeling of suits into a canonical order.
+
+Toepen has no trump, every rule treats the suits alike, so a state with its
+suits permuted is played the same way. The canonical order sorts the suits
+on what is visible of them: the ranks every seat holds of a suit and the
+ranks on every position of the piles. Suits that tie on all of that can be
+swapped without changing anything, so every state maps to one canonical
+state whichever of its 24 relabelings it started as. canonical_state_key
+keys a game on what decisions depend on only, so the order of the deck
+neither breaks ties nor tells states apart.
+
+Cards are ToepEnv card numbers (card index + CARD_NUMBER_OFFSET) with 0 for
+an empty slot, arrays are batched along the first axis and a permutation
+maps every suit index (Suit.value - 1) to its canonical index.
+
+Usage:
+    permutations = canonical_permutations(hands, piles)
+    canonical_hands = sort_hands(permute_numbers(hands, permutations))
+    real_actions = to_real_actions(canonical_actions, permutations)
+"""
+
+import itertools
+
+from gymnasium.spaces import flatdim
+import numpy as np
+
+from toeppo.environment.toep_env import (
+    CARD_NUMBER_OFFSET,
+    CARD_TO_NUMBER,
+    ToepEnv,
+)
+from toeppo.environment.toep_game import (
+    CARDS,
+    CARDS_PER_PLAYER,
+    NOTHING,
+    SUITS,
+    Rank,
+    ToepGame,
+)
+
+N_SUITS = len(SUITS)
+N_RANKS = len(Rank)
+CARD_ACTIONS = np.arange(CARD_NUMBER_OFFSET, ToepEnv.ACTION_SPACE_SIZE)
+CARD_INDICES = CARD_ACTIONS - CARD_NUMBER_OFFSET
+# Sorts after every card number when sorting hands
+EMPTY_LAST = np.iinfo(np.int32).max
+
+# Per card number and suit: the bit of its rank in a rank mask of the suit,
+# and its rank + 1 in the suit, 0 elsewhere and for empty slots
+HAND_RANK_BITS = np.zeros((ToepEnv.ACTION_SPACE_SIZE, N_SUITS), np.int64)
+PILE_RANKS = np.zeros((ToepEnv.ACTION_SPACE_SIZE, N_SUITS), np.int64)
+HAND_RANK_BITS[CARD_ACTIONS, CARD_INDICES // N_RANKS] = 1 << (
+    CARD_INDICES % N_RANKS
+)
+PILE_RANKS[CARD_ACTIONS, CARD_INDICES // N_RANKS] = CARD_INDICES % N_RANKS + 1
+
+# A permutation is looked up by the base N_SUITS number its entries form
+PERMUTATION_CODE_WEIGHTS = N_SUITS ** np.arange(N_SUITS - 1, -1, -1)
+# Canonical action of every real action, and back, for every permutation.
+# Card numbers are the card actions, so these relabel card numbers as well,
+# 0 (an empty slot) is left alone.
+ACTION_MAPS = np.tile(
+    np.arange(ToepEnv.ACTION_SPACE_SIZE), (N_SUITS**N_SUITS, 1)
+)
+REAL_ACTION_MAPS = ACTION_MAPS.copy()
+
+for permutation in itertools.permutations(range(N_SUITS)):
+    code = permutation @ PERMUTATION_CODE_WEIGHTS
+    ACTION_MAPS[code, CARD_ACTIONS] = (
+        np.take(permutation, CARD_INDICES // N_RANKS) * N_RANKS
+        + CARD_INDICES % N_RANKS
+        + CARD_NUMBER_OFFSET
+    )
+    REAL_ACTION_MAPS[code, ACTION_MAPS[code]] = np.arange(
+        ToepEnv.ACTION_SPACE_SIZE
+    )
+
+
+def canonical_permutations(hands: np.ndarray, piles: np.ndarray) -> np.ndarray:
+    """
+    Canonical suit order of every row.
+    :param hands:
+        Card numbers of the visible hands, (batch, seats, cards)
+    :param piles:
+        Card numbers of the piles in the order they were played,
+        (batch, seats, cards)
+    :return:
+        (batch, suits) array with the canonical index of every suit
+    """
+    hands = np.asarray(hands)
+    piles = np.asarray(piles)
+
+    # (features, batch, suits), lexsort sorts on the last feature first
+    features = np.concatenate(
+        [
+            HAND_RANK_BITS[hands]
+            .sum(axis=-2)
+            .reshape(len(hands), -1, N_SUITS),
+            PILE_RANKS[piles].reshape(len(piles), -1, N_SUITS),
+        ],
+        axis=1,
+    ).transpose(1, 0, 2)
+    order = np.lexsort(-features[::-1], axis=-1)
+
+    # order lists the suits from first to last, invert it
+    return order.argsort(axis=1)
+
+
+def permutation_codes(permutations: np.ndarray) -> np.ndarray:
+    return np.asarray(permutations) @ PERMUTATION_CODE_WEIGHTS
+
+
+def permute_numbers(numbers: np.ndarray, permutations: np.ndarray):
+    """Relabel the suits of card numbers, empty slots stay 0"""
+    numbers = np.asarray(numbers)
+    codes = permutation_codes(permutations)
+
+    return ACTION_MAPS[
+        codes[:, None], numbers.reshape(len(numbers), -1)
+    ].reshape(numbers.shape)
+
+
+def sort_hands(numbers: np.ndarray) -> np.ndarray:
+    """Sort the cards of every hand, the order of a hand means nothing"""
+    numbers = np.where(numbers > 0, numbers, EMPTY_LAST)
+    numbers.sort(axis=-1)
+
+    return np.where(numbers != EMPTY_LAST, numbers, 0)
+
+
+def action_maps(permutations: np.ndarray) -> np.ndarray:
+    """(batch, actions) array with the canonical action of every real action"""
+    return ACTION_MAPS[permutation_codes(permutations)]
+
+
+def to_canonical_masks(action_masks, permutations: np.ndarray) -> np.ndarray:
+    action_masks = np.asarray(action_masks)
+    canonical_masks = np.empty_like(action_masks)
+    np.put_along_axis(
+        canonical_masks, action_maps(permutations), action_masks, axis=1
+    )
+
+    return canonical_masks
+
+
+def to_real_actions(actions, permutations: np.ndarray) -> np.ndarray:
+    return REAL_ACTION_MAPS[
+        permutation_codes(permutations), np.asarray(actions).ravel()
+    ]
+
+
+def to_real_probabilities(probabilities, permutations) -> np.ndarray:
+    """Probabilities of the real actions, from those of canonical actions"""
+    return np.take_along_axis(
+        np.asarray(probabilities), action_maps(permutations), axis=1
+    )
+
+
+class ObservationCanonicalizer:
+    """Canonicalizes flattened ToepEnv observations and their masks.
+
+    Reads the one-hot hands and piles out of the flattened observation,
+    relabels and sorts them and writes them back, so observations of any env
+    can be canonicalized after the fact, e.g. for a policy cache.
+    """
+
+    def __init__(self, n_players: int = 4, hand_strength: bool = False):
+        base = ToepEnv.get_observation_space_base(n_players, hand_strength)
+        self.n_players = n_players
+        self.n_numbers = base.player_hands_space.nvec[0]
+        self.slices = {}
+        offset = 0
+
+        # Flattening concatenates the subspaces in the order of the Dict
+        for name, space in base.observation_space_dict.spaces.items():
+            size = flatdim(space)
+            self.slices[name] = slice(offset, offset + size)
+            offset += size
+
+    def read_numbers(self, observations: np.ndarray, name: str):
+        one_hot = observations[:, self.slices[name]]
+
+        return one_hot.reshape(
+            len(observations), self.n_players, CARDS_PER_PLAYER, -1
+        ).argmax(axis=-1)
+
+    def write_numbers(self, observations, name: str, numbers: np.ndarray):
+        one_hot = np.zeros(
+            (*numbers.shape, self.n_numbers), dtype=observations.dtype
+        )
+        np.put_along_axis(one_hot, numbers[..., None], 1, axis=-1)
+        observations[:, self.slices[name]] = one_hot.reshape(
+            len(observations), -1
+        )
+
+    def canonicalize(
+        self, observations: np.ndarray, action_masks: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return:
+            Canonical observations, canonical action masks and the
+            permutations to map canonical actions back with
+        """
+        observations = np.array(observations, copy=True)
+        hands = self.read_numbers(observations, "player_hands")
+        piles = self.read_numbers(observations, "player_piles")
+        permutations = canonical_permutations(hands, piles)
+
+        self.write_numbers(
+            observations,
+            "player_hands",
+            sort_hands(permute_numbers(hands, permutations)),
+        )
+        self.write_numbers(
+            observations, "player_piles", permute_numbers(piles, permutations)
+        )
+
+        return (
+            observations,
+            to_canonical_masks(action_masks, permutations),
+            permutations,
+        )
+
+
+def game_permutation(game: ToepGame, seat: int = None) -> np.ndarray:
+    """Canonical suit order of a game, as seen by seat or by the table"""
+
+    def numbers(cards) -> list[int]:
+        return [card.index + CARD_NUMBER_OFFSET for card in cards] + [0] * (
+            CARDS_PER_PLAYER - len(cards)
+        )
+
+    hands = [
+        numbers(
+            player.hand
+            if seat is None or player.seat == seat or player.play_open
+            else ()
+        )
+        for player in game.players
+    ]
+    piles = [numbers(player.pile) for player in game.players]
+
+    return canonical_permutations([hands], [piles])[0]
+
+
+def canonical_game(game: ToepGame, seat: int = None):
+    """
+    Copy of the game with its suits in canonical order and hands sorted.
+    :param seat:
+        Order the suits on what this seat sees, on every hand if None
+    :return:
+        The canonical game and the permutation of the suits
+    """
+    permutation = game_permutation(game, seat)
+    canonical = ToepGame.from_bytes(game.to_bytes())
+    card_map = [
+        CARDS[
+            permutation[card.index // N_RANKS] * N_RANKS + card.index % N_RANKS
+        ]
+        for card in CARDS
+    ]
+
+    for player in canonical.players:
+        player.hand.set_cards(
+            sorted(
+                (card_map[card.index] for card in player.hand),
+                key=lambda card: card.index,
+            )
+        )
+        player.pile.set_cards(card_map[card.index] for card in player.pile)
+
+    canonical.deck.cards = [card_map[card.index] for card in canonical.deck]
+
+    if canonical.winning_card is not None:
+        canonical.winning_card = card_map[canonical.winning_card.index]
+    if canonical.leading_suit is not None:
+        canonical.leading_suit = SUITS[
+            permutation[canonical.leading_suit.value - 1]
+        ]
+
+    return canonical, permutation
+
+
+def canonical_state_key(game: ToepGame) -> bytes:
+    """Equal for every suit relabeling of the game state, for tables.
+
+    Holds only what decisions depend on: the phase, the seat to decide, the
+    turn, sub round, stake and leading suit, the toep and vuile was seats,
+    and per seat the score, flags, sorted hand and pile. The counters, score
+    history, dealer and deck are left out, so they break no suit ties.
+    """
+    permutation = game_permutation(game)
+    card_map = ACTION_MAPS[permutation_codes(permutation)]
+
+    def seat_byte(seat) -> int:
+        return NOTHING if seat is None else seat
+
+    key = [
+        game.phase.value,
+        seat_byte(game.decision_seat),
+        game.turn,
+        game.sub_round,
+        game.stake,
+        (
+            NOTHING
+            if game.leading_suit is None
+            else permutation[game.leading_suit.value - 1]
+        ),
+        seat_byte(game.last_seat_to_toep),
+        seat_byte(game.called_vuile_was),
+        game.alive_mask,
+        game.looked_mask,
+    ]
+
+    for player in game.players:
+        hand = [card_map[CARD_TO_NUMBER[card]] for card in player.hand]
+        pile = [card_map[CARD_TO_NUMBER[card]] for card in player.pile]
+        key += [player.score, player.play_open, len(hand), *sorted(hand)]
+        key += [len(pile), *pile]
+
+    return bytes(key)
@@ -1,14 +1,65 @@
-from pettingzoo import AECEnv
-import gymnasium as gym
-from gymnasium.spaces import Discrete, MultiDiscrete, flatten
-from gymnasium.wrappers.flatten_observation import FlattenObservation
-from .toep_game import ToepGame, Player, ActionType, CARDS_PER_PLAYER
+from pettingzoo.utils.env import AECEnv
+from gymnasium.spaces import Discrete, flatten
+from .toep_game import (
+    PHASE_TO_ACTION_TYPE,
+    ToepGame,
+    Player,
+    ActionType,
+    Deck,
+    CARDS_PER_PLAYER,
+    seat_mask,
+)
 from .observation_space import ToepObservationSpace
-from pettingzoo.utils import agent_selector, wrappers
-import functools
 import numpy as np
-import copy
+import functools
 import logging
+import struct
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Only envs given a table or bank load these modules
+    from .hand_strength import HandStrengthTable
+    from .deal_bank import DealBank
+    from .scenario_bank import ScenarioBank
+
+# Action numbers of the cards, Deck() lists the cards in index order
+CARD_NUMBER_OFFSET = 7
+NUMBER_TO_CARD = {card.index + CARD_NUMBER_OFFSET: card for card in Deck()}
+CARD_TO_NUMBER = {card: number for number, card in NUMBER_TO_CARD.items()}
+
+# Columns of ToepEnv.statistics, actions 0 to 6 are counted in their own column
+STATISTICS = (
+    "toep",
+    "go",
+    "fold",
+    "call_vuile_was",
+    "no_vuile_was",
+    "check_vuile_was",
+    "believe_vuile_was",
+    "play_card",
+    "invalid_action",
+    "lost_game",
+)
+# Episode modes, an episode is endless by default
+ROUND_EPISODES = "round"
+GAME_EPISODES = "game"
+EPISODE_MODES = (None, ROUND_EPISODES, GAME_EPISODES)
+
+PLAY_CARD_STATISTIC = STATISTICS.index("play_card")
+INVALID_ACTION_STATISTIC = STATISTICS.index("invalid_action")
+LOST_GAME_STATISTIC = STATISTICS.index("lost_game")
+
+
+@functools.lru_cache(maxsize=None)
+def env_state_struct(n_players: int) -> struct.Struct:
+    """Layout of the env part of ToepEnv.to_bytes, the game state follows it"""
+    return struct.Struct(
+        "<3BI"  # players, agent selection, action type, number of moves
+        "Q2B"  # action mask in the infos, terminations and truncations
+        f"{n_players}h"  # previous scores
+        f"{2 * n_players}d"  # rewards and cumulative rewards
+        f"{2 * n_players}f"  # hand strengths
+    )
 
 
 def env(**kwargs):
@@ -17,120 +68,247 @@ def env(**kwargs):
 
 class ToepEnv(AECEnv):
     ACTION_SPACE_SIZE = 39
+    CARD_NUMBER_OFFSET = CARD_NUMBER_OFFSET
     metadata = {
         "is_parallelizable": True,
         "name": "toeppo",
     }
 
+    # 0: toep
+    # 1: go
+    # 2: fold
+    # 3: call vuile was
+    # 4: do not call vuile was
+    # 5: check
+    # 6: trust
+    # 7 - 38 play a certain card
+    ACTION_SPACE = Discrete(ACTION_SPACE_SIZE)
+
+    # Shared by all envs of the process
+    number_to_card_dict = NUMBER_TO_CARD
+    card_to_number_dict = CARD_TO_NUMBER
+    observation_space_bases = {}
+
     def __init__(
-        self, n_players, losing_penalty_multiplier=10, render_mode=None
+        self,
+        n_players,
+        losing_penalty_multiplier=10,
+        render_mode=None,
+        hand_strength_table: "HandStrengthTable" = None,
+        deal_bank: "DealBank" = None,
+        episode_mode: str = None,
+        max_steps: int = None,
+        canonical_suits: bool = False,
+        auto_play_forced: bool = False,
+        scenario_bank: "ScenarioBank" = None,
+        scenario_ratio: float = 0.5,
+        simultaneous_responses: bool = False,
     ):
+        """
+        :param episode_mode:
+            "round" to terminate after every round, scores carry over to the
+            next episode until the game ends, "game" to terminate when a
+            player reaches MAX_SCORE, or None to never terminate
+        :param max_steps:
+            Truncate an episode after this many steps
+        :param canonical_suits:
+            Relabel the suits of every observation and action mask into the
+            canonical order of that agent's view, see suit_symmetry. Card
+            actions are then taken in canonical suits and mapped back, the
+            masks in the infos stay in real suits
+        :param auto_play_forced:
+            Play decisions with a single legal action inside step, until a
+            real decision or the end of a round. Their rewards are part of
+            the step and the infos count them in "forced_moves"
+        :param scenario_bank:
+            Start episodes from snapshots of this bank, see scenario_bank
+        :param scenario_ratio:
+            Share of the resets that start from a snapshot of the bank
+        :param simultaneous_responses:
+            Let all seats that answer a vuile was call or a toep decide at
+            once: the infos hold the mask of every agent in
+            responding_agents and step_responses takes all their actions in
+            one step. step still takes them one at a time
+        """
+        if episode_mode not in EPISODE_MODES:
+            raise ValueError(f"Unknown episode mode {episode_mode}")
+
+        # Everything needed to rebuild an equal env, see __getstate__
+        self.env_kwargs = {
+            "n_players": n_players,
+            "losing_penalty_multiplier": losing_penalty_multiplier,
+            "render_mode": render_mode,
+            "hand_strength_table": hand_strength_table,
+            "deal_bank": deal_bank,
+            "episode_mode": episode_mode,
+            "max_steps": max_steps,
+            "canonical_suits": canonical_suits,
+            "auto_play_forced": auto_play_forced,
+            "scenario_bank": scenario_bank,
+            "scenario_ratio": scenario_ratio,
+            "simultaneous_responses": simultaneous_responses,
+        }
+
         # self.n_players = n_players
         self.n_players = 4
         self.losing_penalty_multiplier = losing_penalty_multiplier
+        self.hand_strength_table = hand_strength_table
+        self.episode_mode = episode_mode
+        self.max_steps = max_steps
+        self.canonical_suits = canonical_suits
+        self.suit_permutations = None
+        self.auto_play_forced = auto_play_forced
+        self.forced_moves = 0
+        # Whether the last episode terminated at the end of a round, only
+        # then does reset continue with the next round of the game
+        self.ended_on_round = False
+        self.scenario_bank = scenario_bank
+        self.scenario_ratio = scenario_ratio
+        self.simultaneous_responses = simultaneous_responses
         self.logger = logging.getLogger(__name__)
 
         # Create the game where we will operate in
-        self.game = ToepGame(self.n_players)
-
-        self.number_to_card_dict = {
-            number: card for number, card in zip(range(7, 39), self.game.deck)
-        }  # NOTE: deck maybe isnt iterable automatically?
+        self.game = ToepGame(self.n_players, deal_bank=deal_bank)
 
-        self.card_to_number_dict = {
-            card: number for number, card in self.number_to_card_dict.items()
-        }
+        # Per seat counts of the episode, see STATISTICS
+        self.statistics = np.zeros(
+            (self.n_players, len(STATISTICS)), dtype=np.int64
+        )
 
-        self.observation_space_base = ToepObservationSpace(
-            self.n_players, CARDS_PER_PLAYER, self.card_to_number_dict
+        self.observation_space_base = self.get_observation_space_base(
+            self.n_players, hand_strength_table is not None
         )
 
         self.possible_agents = [
             "player_" + str(r) for r in range(1, self.n_players + 1)
         ]
+        self.agent_name_mapping = {
+            agent: seat for seat, agent in enumerate(self.possible_agents)
+        }
 
         self.action_spaces = {
-            agent: self.action_space(agent) for agent in self.possible_agents
+            agent: self.ACTION_SPACE for agent in self.possible_agents
         }
         self.observation_spaces = {
-            agent: self.observation_space(agent)
+            agent: self.observation_space_base.observation_space
             for agent in self.possible_agents
         }
         self.render_mode = render_mode
 
-    @functools.lru_cache(maxsize=None)
-    def observation_space(self, agent):
+    @classmethod
+    def get_observation_space_base(
+        cls, n_players: int, hand_strength_features: bool
+    ) -> ToepObservationSpace:
+        # Flattening the spaces is the bulk of constructing an env, do it once per process
+        key = (n_players, hand_strength_features)
+
+        if key not in cls.observation_space_bases:
+            cls.observation_space_bases[key] = ToepObservationSpace(
+                n_players,
+                CARDS_PER_PLAYER,
+                cls.card_to_number_dict,
+                hand_strength_features=hand_strength_features,
+            )
 
-        return self.observation_space_base.observation_space
+        return cls.observation_space_bases[key]
 
-    @functools.lru_cache(maxsize=None)
-    def action_space(self, agent):
-        # 0: toep
-        # 1: go
-        # 2: fold
-        # 3: call vuile was
-        # 4: do not call vuile was
-        # 5: check
-        # 6: trust
-        # 7 - 38 play a certain card
+    def observation_space(self, agent):
+        return self.observation_spaces[agent]
 
-        return Discrete(self.ACTION_SPACE_SIZE)
+    def action_space(self, agent):
+        return self.action_spaces[agent]
 
     def reset(self, *, seed=None, options=None):
 
         self.logger.info("Resetting the environment")
 
-        self.game.reset()
+        if seed is not None:
+            self.game.seed(seed)
 
-        self.previous_scores_dict = self.get_current_scores()
+        game = self.game
 
-        self.agents = self.possible_agents[:]
-        self.agent_to_player_dict = {
-            agent: player
-            for agent, player in zip(self.agents, self.game.players)
-        }
+        if (
+            self.scenario_bank is not None
+            and game.rng.random() < self.scenario_ratio
+        ):
+            from .scenario_bank import load_scenario
 
-        self.player_to_agent_dict = {
-            player: agent
-            for agent, player in self.agent_to_player_dict.items()
-        }
+            first_seat, self.action_type = load_scenario(
+                game, self.scenario_bank, game.rng
+            )
+        elif (
+            self.ended_on_round
+            and seed is None
+            and game.phase in PHASE_TO_ACTION_TYPE
+        ):
+            # The next round of the game is already dealt
+            first_seat = game.decision_seat
+            self.action_type = PHASE_TO_ACTION_TYPE[game.phase]
+        else:
+            game.reset()
+            first_seat, self.action_type = game.start_round()
+
+        self.statistics[:] = 0
+        self.forced_moves = 0
+        self.ended_on_round = False
+
+        self.previous_scores = self.get_current_scores()
+
+        self.agents = self.possible_agents[:]
+        self.hand_strengths = np.zeros((self.n_players, 2), dtype=np.float32)
 
         self.rewards = {agent: 0 for agent in self.agents}
         self._cumulative_rewards = {agent: 0 for agent in self.agents}
         self.terminations = {agent: False for agent in self.agents}
         self.truncations = {agent: False for agent in self.agents}
+        # Seats that terminated or were truncated, the dicts lose done agents
+        self.terminated_mask = 0
+        self.truncated_mask = 0
         # self.state = {agent: NONE for agent in self.agents} # NOTE: not sure what this did in the original code
 
         self.num_moves = (
             0  # NOTE: should probably be replaced with somehting else
         )
 
-        # Start the first round
-        first_player, self.action_type = self.game.start_round()
-
         self.observations = self.get_observations(self.action_type)
-        self.infos = self.get_infos(first_player, self.action_type)
+        self.infos = self.get_infos(first_seat, self.action_type)
 
-        self.agent_selection = self.player_to_agent_dict[first_player]
+        self.agent_selection = self.agents[first_seat]
 
-        self.logger.info(f"First action: {self.action_type}")
+        self.logger.info("First action: %s", self.action_type)
 
         first_mask = self.observations[self.agent_selection]["action_mask"]
-        self.logger.info(f"Mask is: {first_mask}")
+        self.logger.info("Mask is: %s", first_mask)
 
         return self.observations, self.infos
 
     def step(self, action: ActionType):
-        # NOTE: orginal code first check for terminations or truncations, not sure if that is necessary here since all players are done at the same time always
+        # All agents are done at the same time, they leave one by one
+        if (
+            self.terminations[self.agent_selection]
+            or self.truncations[self.agent_selection]
+        ):
+            self._was_dead_step(action)
+            return
+
         self.num_moves += 1
         agent = self.agent_selection
+        seat = self.agent_name_mapping[agent]
 
-        self.logger.info(f"Taking a step: action {action} of {agent}")
-        print(f"Taking a step: action {action} ({self.action_type})of {agent}")
+        if self.canonical_suits:
+            from .suit_symmetry import to_real_actions
+
+            action = int(
+                to_real_actions(
+                    [action], self.suit_permutations[seat : seat + 1]
+                )[0]
+            )
+
+        self.logger.info("Taking a step: action %s of %s", action, agent)
         mask = self.observations[agent]["action_mask"]
-        self.logger.info(f"Mask was: {mask}")
-        print(f"Mask was: {mask}")
-        print(f"Scores: {self.game.scores}")
+        self.logger.info("Mask was: %s", mask)
+
+        self.forced_moves = 0
 
         # NOTE: I do not understand this
         # the agent which stepped last had its _cumulative_rewards accounted for
@@ -156,7 +334,8 @@ class ToepEnv(AECEnv):
 
         # Check for legal action
         if self.invalid_action(action):
-            self.logger.info(f"{action} of {agent} is invalid!")
+            self.logger.info("%s of %s is invalid!", action, agent)
+            self.statistics[seat, INVALID_ACTION_STATISTIC] += 1
 
             self.rewards = self.get_rewards()
             self.rewards[agent] = -1 * self.invalid_action_penalty(
@@ -164,51 +343,188 @@ class ToepEnv(AECEnv):
             )
             self._accumulate_rewards()
 
-            player = self.agent_to_player_dict[agent]
             self.infos = self.get_infos(
-                player, self.action_type, extra_mask=action
+                seat, self.action_type, extra_mask=action
             )
+            self.end_episode(terminated=False)
 
             return
 
         # Convert action to action for player
-        player = self.agent_to_player_dict[agent]
+        player = self.game.players[seat]
 
-        self.logger.info(f"{player} took action {action}")
+        self.logger.info("%s took action %s", player, action)
+        self.statistics[seat, min(action, PLAY_CARD_STATISTIC)] += 1
+        finished_rounds = self.game.finished_rounds
+        finished_games = self.game.finished_games
 
-        next_player, self.action_type = self.handle_action_for_player(
+        next_seat, self.action_type = self.handle_action_for_player(
             player, action
         )
 
+        self.end_step(next_seat, finished_rounds, finished_games)
+
+    def step_responses(self, actions: dict):
+        """
+        Take the answers of all responding agents to a vuile was call or a
+        toep in one step, in turn order. They all decided on the observations
+        from before any of them answered.
+        :param actions:
+            Action of every agent in responding_agents
+        """
+        if not self.awaiting_responses:
+            raise ValueError(
+                "Only answers to a call or toep with simultaneous_responses"
+            )
+
+        if (
+            self.terminations[self.agent_selection]
+            or self.truncations[self.agent_selection]
+        ):
+            raise ValueError("The episode is over, step the done agents")
+
+        responding_agents = self.responding_agents
+
+        if set(actions) != set(responding_agents):
+            raise ValueError(
+                f"Expected actions of {responding_agents}, got {list(actions)}"
+            )
+
+        for agent in responding_agents:
+            if not self.observations[agent]["action_mask"][actions[agent]]:
+                raise ValueError(
+                    f"{actions[agent]} of {agent} is not a legal response"
+                )
+
+        self.logger.info("Taking the responses %s", actions)
+        self.forced_moves = 0
+        finished_rounds = self.game.finished_rounds
+        finished_games = self.game.finished_games
+
+        for agent in responding_agents:
+            seat = self.agent_name_mapping[agent]
+            action = int(actions[agent])
+            self.num_moves += 1
+            self._cumulative_rewards[agent] = 0
+            self.statistics[seat, min(action, PLAY_CARD_STATISTIC)] += 1
+            next_seat, self.action_type = self.handle_action_for_player(
+                self.game.players[seat], action
+            )
+
+        self.end_step(next_seat, finished_rounds, finished_games)
+
+    @property
+    def awaiting_responses(self) -> bool:
+        """Whether all answering seats decide in the next step"""
+        return self.simultaneous_responses and self.action_type in (
+            ActionType.CHECK_OR_TRUST,
+            ActionType.GO_OR_FOLD,
+        )
+
+    @property
+    def responding_agents(self) -> list[str]:
+        """Agents that decide in the next step"""
+        if self.awaiting_responses:
+            return [self.agents[seat] for seat in self.game.responding_seats()]
+
+        return [self.agent_selection]
+
+    def end_step(
+        self, next_seat: int, finished_rounds: int, finished_games: int
+    ):
+        """Observe, reward and select the next agent after the actions of a step"""
+        if self.auto_play_forced:
+            next_seat = self.play_forced_moves(
+                next_seat, finished_rounds, finished_games
+            )
+
+        ended_round = self.game.finished_rounds != finished_rounds
+        ended_game = self.game.finished_games != finished_games
+
         # Select next agent
-        self.agent_selection = self.player_to_agent_dict[next_player]
+        self.agent_selection = self.agents[next_seat]
 
         # Obtain new observations
         self.observations = self.get_observations(self.action_type)
 
         # Get rewards out of the state
-        self.rewards = self.get_rewards()
-
-        for player in self.game.players_that_lost:
-            agent_ = self.player_to_agent_dict[player]
-            self.rewards[agent_] += (
-                -1
-                * (player.score - self.game.MAX_SCORE + 1)
-                * self.losing_penalty_multiplier
-            )
+        if ended_game:
+            # The game has already been reset, score the final scores once
+            final_scores = self.game.last_game_scores
+            self.rewards = self.get_rewards(final_scores)
+
+            for player in self.game.players_that_lost:
+                self.statistics[player.seat, LOST_GAME_STATISTIC] += 1
+                self.rewards[self.agents[player.seat]] += (
+                    -1
+                    * (final_scores[player.seat] - self.game.MAX_SCORE + 1)
+                    * self.losing_penalty_multiplier
+                )
+        else:
+            self.rewards = self.get_rewards()
 
-        self.previous_scores_dict = self.get_current_scores()
+        self.previous_scores = self.get_current_scores()
 
         # Put the action mask in infos
-        self.infos = self.get_infos(next_player, self.action_type)
+        self.infos = self.get_infos(next_seat, self.action_type)
 
         # Adds .rewards to ._cumulative_rewards
         self._accumulate_rewards()
 
+        self.end_episode(
+            terminated=self.episode_mode == ROUND_EPISODES
+            and ended_round
+            or self.episode_mode == GAME_EPISODES
+            and ended_game
+        )
+
         if self.render_mode == "human":
             self.render()
 
-        self.logger.info(f"Next action: {self.action_type}")
+        self.logger.info("Next action: %s", self.action_type)
+
+    def play_forced_moves(
+        self, seat: int, finished_rounds: int, finished_games: int
+    ) -> int:
+        """Play while the seat to move has one legal action, returns the seat that has a choice"""
+        game = self.game
+
+        while (
+            game.finished_rounds == finished_rounds
+            and game.finished_games == finished_games
+            and (self.max_steps is None or self.num_moves < self.max_steps)
+        ):
+            mask = action_mask(game, seat, self.action_type)
+
+            if mask.sum() != 1:
+                break
+
+            action = int(mask.argmax())
+            self.logger.info("%s is forced to take action %s", seat, action)
+            self.statistics[seat, min(action, PLAY_CARD_STATISTIC)] += 1
+            self.num_moves += 1
+            self.forced_moves += 1
+            seat, self.action_type = self.handle_action_for_player(
+                game.players[seat], action
+            )
+
+        return seat
+
+    def end_episode(self, terminated: bool):
+        self.ended_on_round = (
+            terminated and self.episode_mode == ROUND_EPISODES
+        )
+
+        if terminated:
+            self.terminations = dict.fromkeys(self.agents, True)
+            self.terminated_mask = seat_mask(
+                self.agent_name_mapping[agent] for agent in self.agents
+            )
+        elif self.max_steps is not None and self.num_moves >= self.max_steps:
+            self.truncations = dict.fromkeys(self.agents, True)
+            self.truncated_mask = seat_mask(
+                self.agent_name_mapping[agent] for agent in self.agents
+            )
 
     def get_observations(self, action_type: ActionType):
         # NOTE can probably be made more efficient by saving the last space and adjust it
@@ -241,30 +557,38 @@ class ToepEnv(AECEnv):
 
         observation["player_piles"] = np.array(pile_space, dtype=np.int32)
 
-        observations_dict = {}
-        for agent in self.agents:
-            player_to_get_obs = self.agent_to_player_dict[agent]
-
-            # Create a new dictionary for this agent
-            agent_observation = copy.deepcopy(observation)
-
-            # The cards in the players hand and the ones from players that have to play open
-            hand_space = []
-            for player in self.game.players:
-                if player == player_to_get_obs or player.play_open:
-                    adding = [
-                        self.card_to_number_dict[card] for card in player.hand
-                    ]
-                else:
-                    adding = []
-                padding = [0] * (CARDS_PER_PLAYER - len(adding))
-                adding.extend(padding)
-                hand_space.extend(adding)
+        hand_spaces = [
+            self.get_hand_space(seat) for seat in range(len(self.agents))
+        ]
+        masks = [
+            self.get_mask(seat, action_type)
+            for seat in range(len(self.agents))
+        ]
 
+        if self.canonical_suits:
+            hand_spaces, pile_spaces, masks = self.canonicalize_suits(
+                hand_spaces, pile_space, masks
+            )
+
+        observations_dict = {}
+        for seat_to_get_obs, agent in enumerate(self.agents):
+            # Create a new dictionary for this agent, only the hands and hand
+            # strength differ so the shared arrays need no copy
+            agent_observation = dict(observation)
             agent_observation["player_hands"] = np.array(
-                hand_space, dtype=np.int32
+                hand_spaces[seat_to_get_obs], dtype=np.int32
             )
 
+            if self.canonical_suits:
+                agent_observation["player_piles"] = pile_spaces[
+                    seat_to_get_obs
+                ]
+
+            if self.hand_strength_table is not None:
+                agent_observation["hand_strength"] = self.get_hand_strength(
+                    seat_to_get_obs
+                )
+
             try:
                 agent_observation = flatten(
                     self.observation_space_base.observation_space_dict,
@@ -278,11 +602,165 @@ class ToepEnv(AECEnv):
             # Update the dictionary
             observations_dict[agent] = {
                 "observation": agent_observation,
-                "action_mask": self.get_mask(agent, action_type),
+                "action_mask": masks[seat_to_get_obs],
             }
 
         return observations_dict
 
+    def get_hand_space(self, seat_to_get_obs: int) -> list[int]:
+        return hand_space(self.game, seat_to_get_obs)
+
+    def canonicalize_suits(
+        self, hand_spaces: list, pile_space: list, masks: list
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Relabel the suits of every agent's view into canonical order"""
+        # Imported here so envs without the option do not load it
+        from .suit_symmetry import (
+            canonical_permutations,
+            permute_numbers,
+            sort_hands,
+            to_canonical_masks,
+        )
+
+        n_agents = len(hand_spaces)
+        shape = (n_agents, self.n_players, CARDS_PER_PLAYER)
+        hands = np.array(hand_spaces, dtype=np.int32).reshape(shape)
+        piles = np.broadcast_to(
+            np.array(pile_space, dtype=np.int32).reshape(shape[1:]), shape
+        )
+
+        # Kept to map the canonical actions of the agents back in step
+        self.suit_permutations = canonical_permutations(hands, piles)
+
+        return (
+            sort_hands(permute_numbers(hands, self.suit_permutations)).reshape(
+                n_agents, -1
+            ),
+            permute_numbers(piles, self.suit_permutations)
+            .reshape(n_agents, -1)
+            .astype(np.int32),
+            to_canonical_masks(np.stack(masks), self.suit_permutations),
+        )
+
+    def get_hand_strength(self, seat: int) -> np.ndarray:
+        hand = self.game.players[seat].hand
+
+        # Only starting hands are in the table, keep their strength for the rest of the round
+        if len(hand) == CARDS_PER_PLAYER:
+            self.hand_strengths[seat] = self.hand_strength_table.lookup(
+                hand, self.n_players
+            )
+
+        return self.hand_strengths[seat]
+
+    def to_bytes(self) -> bytes:
+        """Encode the env and game state of a reset env in a fixed-size layout.
+
+        The configuration (hand strength table, deal bank, ...) is not part
+        of the state, pass it again to from_bytes.
+        """
+        # Done agents leave the dicts one by one after the episode ends
+        agents = self.possible_agents
+        info = self.infos.get(self.agent_selection, {})
+        info_mask = np.asarray(
+            info.get("action_mask", np.zeros(self.ACTION_SPACE_SIZE)),
+            dtype=np.uint8,
+        )
+
+        env_state = env_state_struct(self.n_players).pack(
+            self.n_players,
+            self.agent_name_mapping[self.agent_selection],
+            self.action_type.value,
+            self.num_moves,
+            int.from_bytes(
+                np.packbits(info_mask, bitorder="little"), "little"
+            ),
+            self.terminated_mask,
+            self.truncated_mask,
+            *self.previous_scores,
+            *(self.rewards.get(agent, 0) for agent in agents),
+            *(self._cumulative_rewards.get(agent, 0) for agent in agents),
+            *self.hand_strengths.ravel().tolist(),
+        )
+
+        return env_state + self.game.to_bytes()
+
+    def load_bytes(self, data: bytes):
+        n_players = self.n_players
+        state_struct = env_state_struct(n_players)
+        (
+            state_n_players,
+            seat,
+            action_type,
+            self.num_moves,
+            info_mask,
+            terminations_mask,
+            truncations_mask,
+            *values,
+        ) = state_struct.unpack_from(data)
+
+        if state_n_players != n_players:
+            raise ValueError(
+                f"State of a {state_n_players} player env, not {n_players}"
+            )
+
+        self.game.load_bytes(data[state_struct.size :])
+
+        self.agents = self.possible_agents[:]
+        self.agent_selection = self.agents[seat]
+        self.action_type = ActionType(action_type)
+        self.previous_scores = list(values[:n_players])
+        rewards = values[n_players : 2 * n_players]
+        cumulative_rewards = values[2 * n_players : 3 * n_players]
+        self.hand_strengths = np.array(
+            values[3 * n_players :], dtype=np.float32
+        ).reshape(n_players, 2)
+
+        self.rewards = dict(zip(self.agents, rewards))
+        self._cumulative_rewards = dict(zip(self.agents, cumulative_rewards))
+        self.terminated_mask = terminations_mask
+        self.truncated_mask = truncations_mask
+        self.terminations = {
+            agent: bool(terminations_mask & (1 << seat))
+            for seat, agent in enumerate(self.agents)
+        }
+        self.truncations = {
+            agent: bool(truncations_mask & (1 << seat))
+            for seat, agent in enumerate(self.agents)
+        }
+        self.ended_on_round = (
+            self.episode_mode == ROUND_EPISODES
+            and any(self.terminations.values())
+            and not any(self.truncations.values())
+        )
+
+        self.observations = self.get_observations(self.action_type)
+        self.infos = self.get_infos(seat, self.action_type)
+        # The infos mask differs from the observation after an invalid action
+        self.infos[self.agent_selection]["action_mask"] = np.unpackbits(
+            np.frombuffer(info_mask.to_bytes(8, "little"), dtype=np.uint8),
+            count=self.ACTION_SPACE_SIZE,
+            bitorder="little",
+        ).astype(np.int8)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, **env_kwargs) -> "ToepEnv":
+        env = cls(n_players=data[0], **env_kwargs)
+        env.load_bytes(data)
+
+        return env
+
+    def __getstate__(self):
+        state = self.to_bytes() if hasattr(self, "agent_selection") else None
+
+        return {"env_kwargs": self.env_kwargs, "state": state}
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state["env_kwargs"])
+
+        if state["state"] is not None:
+            self.load_bytes(state["state"])
+
     def observe(self, agent):
         return self.observations[agent]
 
@@ -294,79 +772,37 @@ class ToepEnv(AECEnv):
 
     def handle_action_for_player(
         self, player: Player, action_number
-    ) -> tuple[Player, ActionType]:
-        match action_number:
-            case 0:
-                new_player, action_type = player.toep()
-            case 1:
-                new_player, action_type = player.go_on()
-            case 2:
-                new_player, action_type = player.fold()
-            case 3:
-                new_player, action_type = player.call_vuile_was()
-            case 4:
-                new_player, action_type = player.dont_call_vuile_was()
-            case 5:
-                new_player, action_type = player.look_at_called_vuile_was()
-            case 6:
-                new_player, action_type = player.believe_vuile_was()
-            case _:
-                card = self.number_to_card_dict[action_number]
-                new_player, action_type = player.play_card(card)
-
-        return new_player, action_type
-
-    def get_score_change(self) -> dict:
-        current_scores = self.get_current_scores()
-
-        score_changes_dict = {
-            player: current_scores[player] - self.previous_scores_dict[player]
-            for player in self.game.players
-        }
+    ) -> tuple[int, ActionType]:
+        return apply_action(player, action_number)
+
+    def get_score_change(self, current_scores: list[int] = None) -> list[int]:
+        if current_scores is None:
+            current_scores = self.get_current_scores()
+
+        score_changes = [
+            current_score - previous_score
+            for current_score, previous_score in zip(
+                current_scores, self.previous_scores
+            )
+        ]
 
-        return score_changes_dict
+        return score_changes
 
-    def get_current_scores(self) -> dict:
-        return {player: player.score for player in self.game.players}
+    def get_current_scores(self) -> list[int]:
+        return [player.score for player in self.game.players]
 
-    def get_rewards(self) -> dict:
-        score_change_dict = self.get_score_change()
+    def get_rewards(self, current_scores: list[int] = None) -> dict:
+        score_changes = self.get_score_change(current_scores)
 
         rewards_dict = {
-            self.player_to_agent_dict[player]: -1 * change
-            for player, change in score_change_dict.items()
+            agent: -1 * change
+            for agent, change in zip(self.agents, score_changes)
         }
 
         return rewards_dict
 
-    def get_mask(self, agent, action_type: ActionType, extra_mask=None):
-        player = self.agent_to_player_dict[agent]
-        mask = np.zeros(self.ACTION_SPACE_SIZE, dtype=np.int8)
-
-        match action_type:
-            case ActionType.GO_OR_FOLD:
-                mask[1] = 1
-                mask[2] = 1
-            case ActionType.CALL_VUILE_WAS:
-                mask[3] = 1
-                mask[4] = 1
-            case ActionType.CHECK_OR_TRUST:
-                mask[5] = 1
-                mask[6] = 1
-            case ActionType.PLAY_CARD:
-                legal_cards = player.legal_cards_to_play()
-                legal_numbers = [
-                    self.card_to_number_dict[card] for card in legal_cards
-                ]
-
-                if (
-                    self.game.last_player_to_toep != player
-                    and self.game.max_score < self.game.MAX_SCORE - 1
-                ):
-                    mask[0] = 1
-
-                for number in legal_numbers:
-                    mask[number] = 1
+    def get_mask(self, seat: int, action_type: ActionType, extra_mask=None):
+        mask = action_mask(self.game, seat, action_type)
 
         if extra_mask is not None:
             mask[extra_mask] = 0
@@ -375,24 +811,35 @@ class ToepEnv(AECEnv):
 
     def get_infos(
         self,
-        next_player: Player,
+        next_seat: int,
         action_type: ActionType,
         extra_mask: int = None,
     ):
         empty_mask = np.zeros(self.ACTION_SPACE_SIZE)
-        next_agent = self.player_to_agent_dict[next_player]
-        next_agent_mask = self.get_mask(next_agent, action_type, extra_mask)
+        next_agent = self.agents[next_seat]
+        next_agent_mask = self.get_mask(next_seat, action_type, extra_mask)
 
         infos = {}
 
-        for agent in self.agents:
+        # Every answering agent decides now, on the same state
+        if self.awaiting_responses:
+            responding_seats = self.game.responding_seats()
+        else:
+            responding_seats = ()
+
+        for seat, agent in enumerate(self.agents):
             infos[agent] = {}
 
             if agent == next_agent:
                 infos[agent]["action_mask"] = next_agent_mask
+            elif seat in responding_seats:
+                infos[agent]["action_mask"] = self.get_mask(seat, action_type)
             else:
                 infos[agent]["action_mask"] = empty_mask
 
+            if self.auto_play_forced:
+                infos[agent]["forced_moves"] = self.forced_moves
+
         return infos
 
     def invalid_action(self, action: ActionType):
@@ -428,6 +875,8 @@ class ToepEnv(AECEnv):
         env = ToepEnv(**env_kwargs, render_mode=internal_render_mode)
         # This wrapper is only for environments which print results to the terminal
         if render_mode == "ansi":
+            from pettingzoo.utils import wrappers
+
             env = wrappers.CaptureStdoutWrapper(env)
         # this wrapper helps error handling for discrete action spaces
         # env = wrappers.AssertOutOfBoundsWrapper(env)
@@ -452,3 +901,99 @@ def action_type_to_int(action_type: ActionType) -> int:
             return 2
         case ActionType.PLAY_CARD:
             return 3
+
+
+def apply_action(player: Player, action_number) -> tuple[int, ActionType]:
+    match action_number:
+        case 0:
+            return player.toep()
+        case 1:
+            return player.go_on()
+        case 2:
+            return player.fold()
+        case 3:
+            return player.call_vuile_was()
+        case 4:
+            return player.dont_call_vuile_was()
+        case 5:
+            return player.look_at_called_vuile_was()
+        case 6:
+            return player.believe_vuile_was()
+        case _:
+            return player.play_card(NUMBER_TO_CARD[action_number])
+
+
+def action_mask(
+    game: ToepGame, seat: int, action_type: ActionType
+) -> np.ndarray:
+    mask = np.zeros(ToepEnv.ACTION_SPACE_SIZE, dtype=np.int8)
+
+    match action_type:
+        case ActionType.GO_OR_FOLD:
+            mask[1] = 1
+            mask[2] = 1
+        case ActionType.CALL_VUILE_WAS:
+            mask[3] = 1
+            mask[4] = 1
+        case ActionType.CHECK_OR_TRUST:
+            mask[5] = 1
+            mask[6] = 1
+        case ActionType.PLAY_CARD:
+            if (
+                game.last_seat_to_toep != seat
+                and game.max_score < game.MAX_SCORE - 1
+            ):
+                mask[0] = 1
+
+            for card in game.players[seat].legal_cards_to_play():
+                mask[card.index + CARD_NUMBER_OFFSET] = 1
+
+    return mask
+
+
+def hand_space(game: ToepGame, seat_to_get_obs: int) -> list[int]:
+    # The cards in the players hand and the ones from players that have to play open
+    hand_space = []
+    for seat, player in enumerate(game.players):
+        if seat == seat_to_get_obs or player.play_open:
+            adding = [CARD_TO_NUMBER[card] for card in player.hand]
+        else:
+            adding = []
+        padding = [0] * (CARDS_PER_PLAYER - len(adding))
+        adding.extend(padding)
+        hand_space.extend(adding)
+
+    return hand_space
+
+
+def seat_observation(
+    game: ToepGame,
+    seat: int,
+    action_type: ActionType,
+    observation_space_base: ToepObservationSpace,
+) -> np.ndarray:
+    """Flattened ToepEnv observation of one seat, for callers that drive a
+    ToepGame themselves. Equal to what get_observations gives that seat
+    without canonical suits and hand strengths.
+    """
+    observation = observation_space_base.empty_space()
+    observation["sub_round_number"] = np.array(game.sub_round, dtype=np.int32)
+    observation["turn_number"] = np.array(game.turn, dtype=np.int32)
+    observation["action_type"] = np.array(
+        action_type_to_int(action_type), dtype=np.int32
+    )
+    observation["player_scores"] = np.array(game.scores, dtype=np.int32)
+
+    pile_space = []
+
+    for player in game.players:
+        adding = [CARD_TO_NUMBER[card] for card in player.pile]
+        adding.extend([0] * (CARDS_PER_PLAYER - len(adding)))
+        pile_space.extend(adding)
+
+    observation["player_piles"] = np.array(pile_space, dtype=np.int32)
+    observation["player_hands"] = np.array(
+        hand_space(game, seat), dtype=np.int32
+    )
+
+    return flatten(observation_space_base.observation_space_dict, observation)
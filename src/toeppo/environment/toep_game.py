@@ -1,14 +1,19 @@
 from enum import Enum, auto
-import itertools
 import random
 import math
 import copy
+import functools
 import logging
+import struct
 
 from toeppo.errors import NotEnoughPlayersError, TooManyPlayersError
 
 # Action space: Toep, Fold, Mee, Lay card (x32)
 CARDS_PER_PLAYER = 4
+NUMBER_OF_CARDS = 32
+
+# Stands in for a missing seat or card in serialized states
+NOTHING = 0xFF
 
 
 class Suit(Enum):
@@ -29,6 +34,10 @@ class Rank(Enum):
     TEN = auto()
 
 
+SUITS = tuple(Suit)
+RANKS = tuple(Rank)
+
+
 class ActionType(Enum):
     PLAY_CARD = auto()
     GO_OR_FOLD = auto()
@@ -37,6 +46,31 @@ class ActionType(Enum):
     LOST = auto()
 
 
+class Phase(Enum):
+    # Phases waiting for a decision of ToepGame.decision_seat
+    CALL_VUILE_WAS = auto()
+    CHECK_OR_TRUST = auto()
+    PLAY_CARD = auto()
+    GO_OR_FOLD = auto()
+    # Phases the game resolves by itself, see ToepGame.PHASE_HANDLERS
+    START_ROUND = auto()
+    END_GAME = auto()
+    START_SUB_ROUND = auto()
+    END_SUB_ROUND = auto()
+    END_ROUND = auto()
+    SCORE_ROUND = auto()
+    END_VUILE_WAS = auto()
+    END_GO_OR_FOLD = auto()
+
+
+PHASE_TO_ACTION_TYPE = {
+    Phase.CALL_VUILE_WAS: ActionType.CALL_VUILE_WAS,
+    Phase.CHECK_OR_TRUST: ActionType.CHECK_OR_TRUST,
+    Phase.PLAY_CARD: ActionType.PLAY_CARD,
+    Phase.GO_OR_FOLD: ActionType.GO_OR_FOLD,
+}
+
+
 class Card:
     rank_to_value = {
         Rank.JACK: 3,
@@ -52,6 +86,13 @@ class Card:
     def __init__(self, suit: Suit, rank: Rank):
         self.suit = suit
         self.rank = rank
+        # Position of the card in a fresh Deck
+        self.index = (suit.value - 1) * len(Rank) + rank.value - 1
+
+    @classmethod
+    def from_index(cls, index: int) -> "Card":
+        # Cards are never changed, so decks and hands can share them
+        return CARDS[index]
 
     @property
     def value(self):
@@ -61,12 +102,16 @@ class Card:
         return f"{self.rank.name} of {self.suit.name}"
 
     def __hash__(self) -> int:
-        return hash(f"{self.suit}{self.rank}")
+        return self.index
 
     def __eq__(self, other):
         return self.suit == other.suit and self.rank == other.rank
 
 
+# Every card in index order
+CARDS = tuple(Card(suit, rank) for suit in SUITS for rank in RANKS)
+
+
 class CardCollection:
 
     def __init__(self):
@@ -75,18 +120,21 @@ class CardCollection:
     def add_card(self, card: Card):
         self.cards.append(card)
 
-    def remove_card(self, card: Card):
+    def remove_card(self, card: Card) -> Card:
+        """Returns the card that was removed"""
         try:
             self.cards.remove(card)
         except ValueError:
             print(f"The player does not have {card}")
-            self.cards.pop()
+            return self.cards.pop()
+
+        return card
 
     def clear(self):
         self.cards = []
 
-    def shuffle(self):
-        random.shuffle(self.cards)
+    def shuffle(self, rng=random):
+        rng.shuffle(self.cards)
 
     def __getitem__(self, index):
         return self.cards[index]
@@ -100,30 +148,41 @@ class CardCollection:
 
 class Deck(CardCollection):
     def __init__(self):
-        ranks = Rank.__members__.values()
-        suits = Suit.__members__.values()
-
-        self.cards = [
-            Card(suit, rank) for suit, rank in itertools.product(suits, ranks)
-        ]
+        self.cards = list(CARDS)
 
     def draw_card(self):
         return self.cards.pop()
 
+    def put_at_bottom(self, card: Card):
+        self.cards.insert(0, card)
+
     @classmethod
-    def shuffled_deck(cls):
+    def shuffled_deck(cls, rng=random):
         deck = cls()
-        deck.shuffle()
+        deck.shuffle(rng)
+        return deck
+
+    @classmethod
+    def from_indices(cls, card_indices):
+        """Deck with the cards in the given order, the last index is drawn first"""
+        deck = cls.__new__(cls)
+        deck.cards = [Card.from_index(index) for index in card_indices]
         return deck
 
 
 class PlayerPile(CardCollection):
     """"""
 
+    def set_cards(self, cards):
+        self.cards = list(cards)
+
 
 class PlayerHand(CardCollection):
     """"""
 
+    def set_cards(self, cards):
+        self.cards = list(cards)
+
     @property
     def vuile_was(self):
         if len(self) < CARDS_PER_PLAYER:
@@ -142,10 +201,15 @@ class PlayerHand(CardCollection):
 
 
 class Player:
-    def __init__(self, name):
+    # Overridden to hash hands and piles, see zobrist.py
+    pile_class = PlayerPile
+    hand_class = PlayerHand
+
+    def __init__(self, name, seat: int = 0):
         self.name = name
-        self.pile = PlayerPile()
-        self.hand = PlayerHand()
+        self.seat = seat
+        self.pile = self.pile_class()
+        self.hand = self.hand_class()
         self.score = 0
         self.pussy_points = 0
         self.active = False
@@ -156,8 +220,8 @@ class Player:
         self.game = game
 
     def reset_cards(self):
-        self.pile = PlayerPile()
-        self.hand = PlayerHand()
+        self.pile = self.pile_class()
+        self.hand = self.hand_class()
 
     def legal_cards_to_play(self):
         cards_list = [card for card in self.hand]
@@ -192,36 +256,114 @@ class Player:
         self.pile.add_card(card)
         self.hand.remove_card(card)
 
-        return self.game.handle_played_card(self, card)
+        return self.game.handle_played_card(self.seat, card)
 
     def toep(self):
-        return self.game.handle_toep(self)
+        return self.game.handle_toep(self.seat)
 
     def fold(self):
-        return self.game.handle_fold(self)
+        return self.game.handle_fold(self.seat)
 
     def go_on(self):
-        return self.game.handle_go(self)
+        return self.game.handle_go(self.seat)
 
     def look_at_called_vuile_was(self):
-        return self.game.handle_looked_vuile_was(self)
+        return self.game.handle_looked_vuile_was(self.seat)
 
     def believe_vuile_was(self):
-        return self.game.handle_believed_vuile_was(self)
+        return self.game.handle_believed_vuile_was(self.seat)
 
     def call_vuile_was(self):
-        return self.game.handle_called_vuile_was(self)
+        return self.game.handle_called_vuile_was(self.seat)
 
     def dont_call_vuile_was(self):
-        return self.game.handle_not_called_vuile_was(self)
+        return self.game.handle_not_called_vuile_was(self.seat)
+
+
+@functools.lru_cache(maxsize=None)
+def state_struct(n_players: int) -> struct.Struct:
+    """Layout of ToepGame.to_bytes, the same size for every state of a game"""
+    return struct.Struct(
+        "<B"  # n_players
+        "13B"  # phase, seats, winning card, turn, sub round, leading suit, flags
+        "H4B"  # stake, alive, looked, lost and play open seat masks
+        "2I"  # finished games and rounds
+        f"B{NUMBER_OF_CARDS}s"  # deck size and cards
+        # Per seat: hand, pile, score, score at the start of the round,
+        # points of the last round, final score of the last game and pussy
+        # points
+        + f"{CARDS_PER_PLAYER}s{CARDS_PER_PLAYER}s4hH" * n_players
+    )
+
+
+def cards_to_bytes(cards) -> bytes:
+    return bytes(card.index for card in cards).ljust(
+        CARDS_PER_PLAYER, bytes([NOTHING])
+    )
+
+
+def cards_from_bytes(data: bytes) -> list[Card]:
+    return [Card.from_index(index) for index in data if index != NOTHING]
+
+
+def seat_mask(seats) -> int:
+    mask = 0
+
+    for seat in seats:
+        mask |= 1 << seat
+
+    return mask
+
+
+def _closest_alive_seat(
+    alive_mask: int, seat: int, direction: int, n_players: int
+) -> int:
+    for offset in range(1, n_players + 1):
+        candidate = (seat + direction * offset) % n_players
+        if alive_mask & (1 << candidate):
+            return candidate
+
+    return -1
+
+
+@functools.lru_cache(maxsize=None)
+def seat_tables(n_players: int) -> tuple[tuple, tuple]:
+    """Turn order tables for every possible alive-seat bitmask.
+
+    ``next_seat[alive_mask][seat]`` is the first alive seat after ``seat``
+    going around the table, ``last_seat[alive_mask][seat]`` the first alive
+    seat before it. Seats do not need to be alive themselves to be looked up,
+    an empty mask maps every seat to -1.
+    """
+    next_seat = tuple(
+        tuple(
+            _closest_alive_seat(alive_mask, seat, 1, n_players)
+            for seat in range(n_players)
+        )
+        for alive_mask in range(1 << n_players)
+    )
+    last_seat = tuple(
+        tuple(
+            _closest_alive_seat(alive_mask, seat, -1, n_players)
+            for seat in range(n_players)
+        )
+        for alive_mask in range(1 << n_players)
+    )
+
+    return next_seat, last_seat
 
 
 class ToepGame:
     MAX_SCORE = 15
 
-    def __init__(self, n_players: int):
+    # Overridden to hash the players, see zobrist.py
+    player_class = Player
+
+    def __init__(self, n_players: int, deal_bank=None):
         self.logger = logging.getLogger(__name__)
         self.n_players = n_players
+        self.deal_bank = deal_bank
+        self.rng = random
 
         self.deck = Deck()
 
@@ -231,25 +373,44 @@ class ToepGame:
             raise TooManyPlayersError()
 
         self.players = [
-            Player(f"player_{str(i)}") for i in range(1, self.n_players + 1)
+            self.player_class(f"player_{str(seat + 1)}", seat=seat)
+            for seat in range(self.n_players)
         ]
         self.set_players_game()
 
+        self.next_seat_table, self.last_seat_table = seat_tables(
+            self.n_players
+        )
+        self.all_seats_mask = (1 << self.n_players) - 1
+        self.set_alive_mask(self.all_seats_mask)
+
         self.set_up_for_new_game()
 
         self.reset_players_that_lost = True
+        self.players_that_lost = []
+        self.looked_mask = 0
+        self.last_seat_of_sub_round = None
+        self.winning_seat = None
+        self.winning_card = None
+        self.finished_games = 0
+        self.finished_rounds = 0
+        self.round_start_scores = [0] * self.n_players
+        self.last_round_points = [0] * self.n_players
+        self.last_game_scores = [0] * self.n_players
 
     def set_up_for_new_game(self):
         self.reset_players_score()
 
-        self.dealing_player = self.players[0]
-        self.active_player = None
+        self.dealing_seat = 0
+        self.active_seat = None
+        self.decision_seat = None
+        self.phase = Phase.START_ROUND
         self.turn = 0
         self.sub_round = 0
         self.leading_suit = None
         self.stake = 0
         self.called_vuile_was = None
-        self.last_player_to_toep = None
+        self.last_seat_to_toep = None
 
     def reset_players_score(self):
         for player in self.players:
@@ -259,117 +420,207 @@ class ToepGame:
         for player in self.players:
             player.enter_game(self)
 
-    def start_round(self) -> tuple[Player, ActionType]:
-        self.logger.info(f"Starting a round, scores: {self.scores}")
+    def seed(self, seed=None):
+        """Shuffle with a private random generator instead of the global one"""
+        self.rng = random.Random(seed)
+
+    def set_alive_mask(self, alive_mask: int):
+        self.alive_mask = alive_mask
+        self.n_alive = alive_mask.bit_count()
+        self.next_seat = self.next_seat_table[alive_mask]
+        self.last_seat = self.last_seat_table[alive_mask]
+
+    def is_alive(self, seat: int) -> bool:
+        return bool(self.alive_mask & (1 << seat))
+
+    def start_round(self) -> tuple[int, ActionType]:
+        return self.advance(Phase.START_ROUND)
+
+    def advance(self, phase: Phase) -> tuple[int, ActionType]:
+        """Resolve automatic phases until a seat has to make a decision.
+
+        Every automatic phase handler returns the phase that follows it, the
+        loop stops at the first phase that waits for ``self.decision_seat``.
+        """
+        phase_handlers = self.PHASE_HANDLERS
+
+        while phase in phase_handlers:
+            phase = phase_handlers[phase](self)
+
+        self.phase = phase
+
+        return self.decision_seat, PHASE_TO_ACTION_TYPE[phase]
+
+    # Automatic phases
+    def deal_round(self) -> Phase:
+        self.logger.info("Starting a round, scores: %s", self.scores)
 
         if not self.reset_players_that_lost:
             self.reset_players_that_lost = True
         else:
             self.players_that_lost = []
 
-        if self.ended_game:
-            self.logger.info(f"{self.losing_players} lost")
-
-            self.reset()
+        max_score = self.max_score
 
-            return self.start_round()
-
-            # return (
-            #     self.losing_players,
-            #     ActionType.LOST,
-            # )  # TODO: this returns a list now, not the best code since all other functions return a single player. Maybe just check in the environment for a lost game?
+        if max_score >= self.MAX_SCORE:
+            return Phase.END_GAME
 
         self.reset_players()
 
-        self.deck = Deck.shuffled_deck()
+        if self.deal_bank is None:
+            self.deck = Deck.shuffled_deck(self.rng)
+        else:
+            self.deck = self.deal_bank.next_deck()
+
+        self.round_start_scores = self.scores
         self.distribute_cards()
         self.sub_round = 0
         self.turn = 0
         self.stake = 1
-        self.alive_players = copy.copy(self.players)
-        self.update_players_dict()
-        self.active_player = self.next_player_dict[self.dealing_player]
-        self.last_player_to_toep = None
-        self.players_that_looked = []
-
-        if not self.armoe:
-            return self.start_vuile_was_round()
-        else:
-            return self.start_sub_round()
+        self.set_alive_mask(self.all_seats_mask)
+        self.active_seat = self.next_seat[self.dealing_seat]
+        self.last_seat_to_toep = None
+        self.looked_mask = 0
+
+        if max_score == self.MAX_SCORE - 1:  # armoe
+            return Phase.START_SUB_ROUND
 
-    def start_vuile_was_round(self) -> tuple[Player, ActionType]:
         self.logger.info("Starting a vuile was round")
+        self.decision_seat = self.active_seat
+
+        return Phase.CALL_VUILE_WAS
 
-        return self.active_player, ActionType.CALL_VUILE_WAS
+    def end_game(self) -> Phase:
+        self.logger.info("%s lost", self.losing_players)
 
-    def start_sub_round(self) -> tuple[Player, ActionType]:
+        self.last_game_scores = self.scores
+        self.finished_games += 1
+        self.reset()
+
+        return Phase.START_ROUND
+
+    def start_sub_round(self) -> Phase:
         self.logger.info("Starting a sub round")
 
-        self.last_player_of_sub_round = self.last_player_dict[
-            self.active_player
-        ]
+        self.last_seat_of_sub_round = self.last_seat[self.active_seat]
         self.sub_round += 1
         self.turn = 1
         self.leading_suit = None
+        self.decision_seat = self.active_seat
 
-        return self.active_player, ActionType.PLAY_CARD
+        return Phase.PLAY_CARD
 
-    def determine_sub_round_winner(self) -> tuple[Player, Card]:
+    def determine_sub_round_winner(self) -> tuple[int, Card]:
         # Compare the last played cards of alive players
-        best_player: Player = self.alive_players[0]
-        try:
-            best_card: Card = best_player.pile[-1]
-        except IndexError:
-            print(
-                f"{best_player} with pile {best_player.pile} and hand {best_player.hand} gives isssues. Active players are {self.alive_players}"
-            )
-            raise IndexError()
+        players = self.players
+        alive_mask = self.alive_mask
+        best_seat = None
+
+        for seat in range(self.n_players):
+            if not alive_mask & (1 << seat):
+                continue
 
-        for player in self.alive_players[1:]:
-            last_card: Card = player.pile[-1]
+            last_card: Card = players[seat].pile[-1]
 
-            if (
+            if best_seat is None:
+                best_seat = seat
+                best_card = last_card
+            elif (
                 last_card.suit == self.leading_suit
                 and last_card.value > best_card.value
             ):
-                best_player = player
+                best_seat = seat
                 best_card = last_card
 
-        return best_player, best_card
+        return best_seat, best_card
 
-    def end_sub_round(self) -> tuple[Player, ActionType]:
-        self.winning_player, self.winning_card = (
+    def end_sub_round(self) -> Phase:
+        self.winning_seat, self.winning_card = (
             self.determine_sub_round_winner()
         )
 
-        self.logger.info(f"{self.winning_player} won the sub round")
+        self.logger.info(
+            "%s won the sub round", self.players[self.winning_seat]
+        )
 
-        self.dealing_player = self.winning_player
+        self.dealing_seat = self.winning_seat
 
         if self.sub_round == CARDS_PER_PLAYER:
-            return self.end_round()
+            return Phase.END_ROUND
         else:
-            return self.start_sub_round()
+            return Phase.START_SUB_ROUND
 
-    def end_round(self, compare: bool = True) -> tuple[Player, ActionType]:
-        self.logger.info("Ending a round")
-
-        if compare and self.winning_card.rank == Rank.JACK:
+    def end_round(self) -> Phase:
+        if self.winning_card.rank == Rank.JACK:
             self.stake *= 2
 
+        return Phase.SCORE_ROUND
+
+    def score_round(self) -> Phase:
+        self.logger.info("Ending a round")
+
         self.give_scores_at_end_of_round()
 
-        return self.start_round()
+        self.last_round_points = [
+            player.score - start_score
+            for player, start_score in zip(
+                self.players, self.round_start_scores
+            )
+        ]
+        self.finished_rounds += 1
+
+        return Phase.START_ROUND
 
     def give_scores_at_end_of_round(self):
-        for player in self.alive_players:
-            if player != self.winning_player:
-                player.score += self.stake
+        for seat in range(self.n_players):
+            if not self.alive_mask & (1 << seat):
+                continue
+
+            if seat != self.winning_seat:
+                self.players[seat].score += self.stake
             else:
-                self.logger.info(f"{player} won the round")
+                self.logger.info("%s won the round", self.players[seat])
+
+    def end_vuile_was_round(self) -> Phase:
+        caller = self.players[self.called_vuile_was]
+
+        if caller.hand.vuile_was:
+            self.give_new_cards(caller)
+
+            for seat in range(self.n_players):
+                if self.looked_mask & (1 << seat):
+                    self.players[seat].score += 1
+        else:
+            caller.score += 1
+            caller.play_open = True
+
+        # The sub round will either start here if the dealer called vuile was or in self.handle_not_called_vuile_was if the dealer did not
+        if self.called_vuile_was == self.dealing_seat:
+            return Phase.START_SUB_ROUND
+
+        self.decision_seat = self.next_seat[self.called_vuile_was]
+
+        return Phase.CALL_VUILE_WAS
+
+    def end_go_or_fold_round(self) -> Phase:
+        if self.n_alive == 1:
+            self.winning_seat = self.alive_mask.bit_length() - 1
+            return Phase.SCORE_ROUND
+
+        # NOTE: had this here before, but the round should always finish even if players get to MAX_SCORE
+        # if self.ended_game:
+        #     return (
+        #         self.start_round()
+        #     )  # NOTE this probably isnt the best solution
+
+        self.stake += 1
+        self.last_seat_to_toep = self.active_seat
+        self.decision_seat = self.active_seat
+
+        return Phase.PLAY_CARD
 
     def reset_players(self):
-        self.last_player_to_toep = None
+        self.last_seat_to_toep = None
 
         for player in self.players:
             player.reset_cards()
@@ -381,164 +632,142 @@ class ToepGame:
                 drawn_card = self.deck.draw_card()
                 player.hand.add_card(drawn_card)
 
-    def handle_looked_vuile_was(
-        self, player: Player
-    ) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} looked at the vuile was")
+    def give_new_cards(self, player: Player):
+        old_hand = player.hand
+        player.hand = player.hand_class()
 
-        self.players_that_looked.append(player)
+        for _ in range(CARDS_PER_PLAYER):
+            drawn_card = self.deck.draw_card()
+            player.hand.add_card(drawn_card)
 
-        if player == self.last_player_dict[self.called_vuile_was]:
-            return self.handle_vuile_was_end(player)
-        else:
-            return self.next_player_dict[player], ActionType.CHECK_OR_TRUST
+        # Returned cards go under the deck so they are not drawn again
+        for card in old_hand:
+            self.deck.put_at_bottom(card)
 
-    def handle_called_vuile_was(
-        self, player: Player
-    ) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} called a vuile was")
+    # Decisions
+    def handle_called_vuile_was(self, seat: int) -> tuple[int, ActionType]:
+        self.logger.info("%s called a vuile was", self.players[seat])
 
-        self.players_that_looked = []
-        self.called_vuile_was = player
+        self.looked_mask = 0
+        self.called_vuile_was = seat
+        self.decision_seat = self.next_seat[seat]
 
-        return self.next_player_dict[player], ActionType.CHECK_OR_TRUST
+        return self.advance(Phase.CHECK_OR_TRUST)
 
-    def handle_not_called_vuile_was(
-        self, player: Player
-    ) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} did not call a vuile was")
+    def handle_not_called_vuile_was(self, seat: int) -> tuple[int, ActionType]:
+        self.logger.info("%s did not call a vuile was", self.players[seat])
 
-        if player == self.dealing_player:
-            return self.start_sub_round()
-        else:
-            return self.next_player_dict[player], ActionType.CALL_VUILE_WAS
+        if seat == self.dealing_seat:
+            return self.advance(Phase.START_SUB_ROUND)
 
-    def handle_believed_vuile_was(
-        self, player: Player
-    ) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} believed the vuile was")
+        self.decision_seat = self.next_seat[seat]
 
-        if player == self.last_player_dict[self.called_vuile_was]:
-            return self.handle_vuile_was_end(player)
+        return self.advance(Phase.CALL_VUILE_WAS)
 
-        return self.next_player_dict[player], ActionType.CHECK_OR_TRUST
+    def handle_looked_vuile_was(self, seat: int) -> tuple[int, ActionType]:
+        self.logger.info("%s looked at the vuile was", self.players[seat])
 
-    def handle_vuile_was_end(
-        self, last_player: Player
-    ) -> tuple[Player, ActionType]:
-        if self.called_vuile_was.hand.vuile_was:
-            self.give_new_cards(self.called_vuile_was)
+        self.looked_mask |= 1 << seat
 
-            for player in self.players_that_looked:
-                player.score += 1
-        else:
-            self.called_vuile_was.score += 1
-            self.called_vuile_was.play_open = True
+        return self.handle_checked_or_trusted(seat)
 
-        # The sub round will either start here if the dealer called vuile was or in self.handle_dont_called_vuile_was if the dealer did not
-        if last_player == self.last_player_dict[self.dealing_player]:
-            return self.start_sub_round()
-        else:
-            return (
-                self.next_player_dict[self.called_vuile_was],
-                ActionType.CALL_VUILE_WAS,
-            )
+    def handle_believed_vuile_was(self, seat: int) -> tuple[int, ActionType]:
+        self.logger.info("%s believed the vuile was", self.players[seat])
 
-    def give_new_cards(self, player: Player):
-        for card in player.hand:
-            self.deck.add_card(card)
+        return self.handle_checked_or_trusted(seat)
 
-        player.hand = PlayerHand()
+    def handle_checked_or_trusted(self, seat: int) -> tuple[int, ActionType]:
+        if seat == self.last_seat[self.called_vuile_was]:
+            return self.advance(Phase.END_VUILE_WAS)
 
-        for _ in range(CARDS_PER_PLAYER):
-            drawn_card = self.deck.draw_card()
-            player.hand.add_card(drawn_card)
+        self.decision_seat = self.next_seat[seat]
+
+        return self.advance(Phase.CHECK_OR_TRUST)
 
     def handle_played_card(
-        self, player: Player, card: Card
-    ) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} played a {card}")
+        self, seat: int, card: Card
+    ) -> tuple[int, ActionType]:
+        self.logger.info("%s played a %s", self.players[seat], card)
 
-        self.active_player = self.next_player_dict[self.active_player]
+        self.active_seat = self.next_seat[seat]
 
         if self.turn == 1:
             self.leading_suit = card.suit
 
         self.turn += 1
 
-        if player == self.last_player_of_sub_round:
-            return self.end_sub_round()
-        else:
-            self.active_player = self.next_player_dict[player]
+        if seat == self.last_seat_of_sub_round:
+            return self.advance(Phase.END_SUB_ROUND)
 
-        return self.next_player_dict[player], ActionType.PLAY_CARD
+        self.decision_seat = self.active_seat
 
-    def handle_fold(self, player: Player) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} folded")
-        next_player = self.next_player_dict[player]
+        return self.advance(Phase.PLAY_CARD)
 
-        player.score += self.stake
+    def handle_toep(self, seat: int) -> tuple[int, ActionType]:
+        self.logger.info("%s toeps", self.players[seat])
 
-        if self.last_player_to_toep is None:
-            player.pussy_points += 1  # TODO: punish this person
+        self.decision_seat = self.next_seat[seat]
 
-        self.alive_players.remove(player)
+        return self.advance(Phase.GO_OR_FOLD)
 
-        if player == self.last_player_of_sub_round:
-            self.last_player_of_sub_round = self.last_player_dict[player]
+    def handle_go(self, seat: int) -> tuple[int, ActionType]:
+        self.logger.info("%s goes with the toep", self.players[seat])
 
-        if player == self.last_player_dict[self.active_player]:
-            self.update_players_dict()
-            return self.handle_ended_go_or_fold_round()
-        else:
-            self.update_players_dict()
-            return next_player, ActionType.GO_OR_FOLD
+        if seat == self.last_seat[self.active_seat]:
+            return self.advance(Phase.END_GO_OR_FOLD)
 
-    def handle_go(self, player: Player) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} goes with the toep")
+        self.decision_seat = self.next_seat[seat]
 
-        if player == self.last_player_dict[self.active_player]:
-            return self.handle_ended_go_or_fold_round()
+        return self.advance(Phase.GO_OR_FOLD)
 
-        return self.next_player_dict[player], ActionType.GO_OR_FOLD
+    def handle_fold(self, seat: int) -> tuple[int, ActionType]:
+        self.logger.info("%s folded", self.players[seat])
+        player = self.players[seat]
 
-    def handle_toep(self, player: Player) -> tuple[Player, ActionType]:
-        self.logger.info(f"{player} toeps")
+        player.score += self.stake
 
-        return self.next_player_dict[player], ActionType.GO_OR_FOLD
+        if self.last_seat_to_toep is None:
+            player.pussy_points += 1  # TODO: punish this person
 
-    def handle_ended_go_or_fold_round(self) -> tuple[Player, ActionType]:
-        if len(self.alive_players) == 1:
-            self.winning_player = self.alive_players[0]
-            return self.end_round(compare=False)
+        ends_go_or_fold_round = seat == self.last_seat[self.active_seat]
 
-        # NOTE: had this here before, but the round should always finish even if players get to MAX_SCORE
-        # if self.ended_game:
-        #     return (
-        #         self.start_round()
-        #     )  # NOTE this probably isnt the best solution
+        if seat == self.last_seat_of_sub_round:
+            self.last_seat_of_sub_round = self.last_seat[seat]
 
-        self.stake += 1
-        self.last_player_to_toep = self.active_player
+        self.decision_seat = self.next_seat[seat]
+        self.set_alive_mask(self.alive_mask & ~(1 << seat))
+
+        if ends_go_or_fold_round:
+            return self.advance(Phase.END_GO_OR_FOLD)
 
-        return self.active_player, ActionType.PLAY_CARD
+        return self.advance(Phase.GO_OR_FOLD)
 
-    def update_players_dict(self):
-        self.next_player_dict = {
-            player: self.alive_players[index + 1]
-            for index, player in enumerate(self.alive_players[:-1])
-        }
-        self.next_player_dict[self.alive_players[-1]] = self.alive_players[0]
+    def responding_seats(self) -> list[int]:
+        """Seats that still answer the current vuile was call or toep, in turn order"""
+        match self.phase:
+            case Phase.CHECK_OR_TRUST:
+                calling_seat = self.called_vuile_was
+            case Phase.GO_OR_FOLD:
+                calling_seat = self.active_seat
+            case _:
+                return []
 
-        self.last_player_dict = {}
-        for index, player in enumerate(self.alive_players):
-            prev_index = (index - 1) % len(
-                self.alive_players
-            )  # Get the index of the previous player in a circular manner
-            self.last_player_dict[player] = self.alive_players[prev_index]
+        seats = []
+        seat = self.decision_seat
 
-        self.logger.info(f"Next player dict: {self.next_player_dict}")
-        self.logger.info(f"Last player dict: {self.last_player_dict}")
+        while seat != calling_seat:
+            seats.append(seat)
+            seat = self.next_seat[seat]
+
+        return seats
+
+    @property
+    def alive_players(self) -> list[Player]:
+        return [
+            player
+            for player in self.players
+            if self.alive_mask & (1 << player.seat)
+        ]
 
     @property
     def max_score(self) -> int:
@@ -575,8 +804,8 @@ class ToepGame:
             return False
 
     @property
-    def scores(self) -> dict:
-        return {player: player.score for player in self.players}
+    def scores(self) -> list[int]:
+        return [player.score for player in self.players]
 
     def reset(self) -> None:
         players_that_lost = copy.copy(self.losing_players)
@@ -585,3 +814,170 @@ class ToepGame:
 
         self.players_that_lost = players_that_lost
         self.reset_players_that_lost = False
+
+    # Serialization
+    def to_bytes(self) -> bytes:
+        """Encode the game state in a fixed-size layout, see state_struct.
+
+        The random generator and the deal bank are not part of the state.
+        """
+
+        def seat_byte(seat):
+            return NOTHING if seat is None else seat
+
+        players = self.players
+        deck = bytes(card.index for card in self.deck)
+        per_seat = []
+
+        for player, start_score, round_points, game_score in zip(
+            players,
+            self.round_start_scores,
+            self.last_round_points,
+            self.last_game_scores,
+        ):
+            per_seat.extend(
+                (
+                    cards_to_bytes(player.hand),
+                    cards_to_bytes(player.pile),
+                    player.score,
+                    start_score,
+                    round_points,
+                    game_score,
+                    player.pussy_points,
+                )
+            )
+
+        return state_struct(self.n_players).pack(
+            self.n_players,
+            self.phase.value,
+            seat_byte(self.decision_seat),
+            seat_byte(self.active_seat),
+            seat_byte(self.dealing_seat),
+            seat_byte(self.last_seat_of_sub_round),
+            seat_byte(self.last_seat_to_toep),
+            seat_byte(self.called_vuile_was),
+            seat_byte(self.winning_seat),
+            NOTHING if self.winning_card is None else self.winning_card.index,
+            self.turn,
+            self.sub_round,
+            0 if self.leading_suit is None else self.leading_suit.value,
+            int(self.reset_players_that_lost),
+            self.stake,
+            self.alive_mask,
+            self.looked_mask,
+            seat_mask(player.seat for player in self.players_that_lost),
+            seat_mask(player.seat for player in players if player.play_open),
+            self.finished_games,
+            self.finished_rounds,
+            len(deck),
+            deck,
+            *per_seat,
+        )
+
+    def load_bytes(self, data: bytes):
+        def seat_or_none(value):
+            return None if value == NOTHING else value
+
+        if data[0] != self.n_players:
+            raise ValueError(
+                f"State of a {data[0]} player game does not fit a {self.n_players} player game"
+            )
+
+        (
+            _,
+            phase,
+            decision_seat,
+            active_seat,
+            dealing_seat,
+            last_seat_of_sub_round,
+            last_seat_to_toep,
+            called_vuile_was,
+            winning_seat,
+            winning_card,
+            self.turn,
+            self.sub_round,
+            leading_suit,
+            flags,
+            self.stake,
+            alive_mask,
+            self.looked_mask,
+            lost_mask,
+            play_open_mask,
+            self.finished_games,
+            self.finished_rounds,
+            deck_size,
+            deck,
+            *per_seat,
+        ) = state_struct(self.n_players).unpack(data)
+
+        self.phase = Phase(phase)
+        self.decision_seat = seat_or_none(decision_seat)
+        self.active_seat = seat_or_none(active_seat)
+        self.dealing_seat = dealing_seat
+        self.last_seat_of_sub_round = seat_or_none(last_seat_of_sub_round)
+        self.last_seat_to_toep = seat_or_none(last_seat_to_toep)
+        self.called_vuile_was = seat_or_none(called_vuile_was)
+        self.winning_seat = seat_or_none(winning_seat)
+        self.winning_card = (
+            None if winning_card == NOTHING else Card.from_index(winning_card)
+        )
+        self.leading_suit = None if leading_suit == 0 else Suit(leading_suit)
+        self.reset_players_that_lost = bool(flags & 1)
+        self.set_alive_mask(alive_mask)
+        self.deck = Deck.from_indices(deck[:deck_size])
+
+        self.round_start_scores = []
+        self.last_round_points = []
+        self.last_game_scores = []
+
+        for seat, player in enumerate(self.players):
+            (
+                hand,
+                pile,
+                score,
+                start_score,
+                round_points,
+                game_score,
+                pussy_points,
+            ) = per_seat[7 * seat : 7 * seat + 7]
+
+            player.hand = player.hand_class()
+            player.hand.set_cards(cards_from_bytes(hand))
+            player.pile = player.pile_class()
+            player.pile.set_cards(cards_from_bytes(pile))
+
+            player.score = score
+            player.pussy_points = pussy_points
+            player.play_open = bool(play_open_mask & (1 << seat))
+            self.round_start_scores.append(start_score)
+            self.last_round_points.append(round_points)
+            self.last_game_scores.append(game_score)
+
+        self.players_that_lost = [
+            player for player in self.players if lost_mask & (1 << player.seat)
+        ]
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ToepGame":
+        game = cls(data[0])
+        game.load_bytes(data)
+
+        return game
+
+    def __getstate__(self):
+        return self.to_bytes()
+
+    def __setstate__(self, state: bytes):
+        self.__init__(state[0])
+        self.load_bytes(state)
+
+    PHASE_HANDLERS = {
+        Phase.START_ROUND: deal_round,
+        Phase.END_GAME: end_game,
+        Phase.START_SUB_ROUND: start_sub_round,
+        Phase.END_SUB_ROUND: end_sub_round,
+        Phase.END_ROUND: end_round,
+        Phase.SCORE_ROUND: score_round,
+        Phase.END_VUILE_WAS: end_vuile_was_round,
+        Phase.END_GO_OR_FOLD: end_go_or_fold_round,
+    }
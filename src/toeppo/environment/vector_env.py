@@ -0,0 +1,302 @@
+"""Subprocess pool of ToepEnv tables sharing one block of memory.
+
+Every worker process owns a slice of the tables. Observations, action masks,
+rewards and actions of all tables live in a single
+``multiprocessing.shared_memory`` block that the workers write into
+directly, the pipes to the workers only carry one-byte step, reset and close
+commands and their acknowledgements, so nothing is pickled per step.
+
+Usage:
+    with ToepVectorEnv(n_workers=8, envs_per_worker=16) as envs:
+        observations, action_masks, seats = envs.reset(seed=0)
+        while training:
+            actions = policy.compute_actions(observations, action_masks)
+            observations, action_masks, rewards, dones, seats = envs.step(
+                actions
+            )
+"""
+
+import contextlib
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import traceback
+
+import numpy as np
+
+from .toep_env import ToepEnv
+
+STEP = b"s"
+RESET = b"r"
+CLOSE = b"c"
+ACK = b"a"
+ERROR = b"e"
+
+ALIGNMENT = 8
+
+
+def buffer_layout(n_envs: int, observation_size: int, n_players: int):
+    """Offsets, dtypes and shapes of all arrays in the shared block"""
+    arrays = [
+        ("observations", np.float32, (n_envs, observation_size)),
+        ("action_masks", np.int8, (n_envs, ToepEnv.ACTION_SPACE_SIZE)),
+        ("rewards", np.float32, (n_envs, n_players)),
+        ("agent_seats", np.int32, (n_envs,)),
+        ("dones", np.uint8, (n_envs,)),
+        ("actions", np.int32, (n_envs,)),
+        ("seeds", np.int64, (n_envs,)),
+    ]
+    layout = {}
+    offset = 0
+
+    for name, dtype, shape in arrays:
+        layout[name] = (offset, dtype, shape)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += -(-size // ALIGNMENT) * ALIGNMENT
+
+    return layout, offset
+
+
+def buffer_views(buffer, layout) -> dict[str, np.ndarray]:
+    return {
+        name: np.ndarray(shape, dtype, buffer=buffer, offset=offset)
+        for name, (offset, dtype, shape) in layout.items()
+    }
+
+
+def write_table(env: ToepEnv, index: int, arrays: dict[str, np.ndarray]):
+    agent = env.agent_selection
+    observation = env.observe(agent)
+
+    arrays["observations"][index] = observation["observation"]
+    arrays["action_masks"][index] = observation["action_mask"]
+    arrays["agent_seats"][index] = env.agent_name_mapping[agent]
+
+
+def worker(
+    connection,
+    shared_memory_name: str,
+    layout,
+    env_indices: range,
+    env_kwargs: dict,
+):
+    memory = shared_memory.SharedMemory(name=shared_memory_name)
+    arrays = buffer_views(memory.buf, layout)
+
+    try:
+        envs = [ToepEnv(**env_kwargs) for _ in env_indices]
+
+        while True:
+            command = connection.recv_bytes()
+
+            if command == STEP:
+                for index, env in zip(env_indices, envs):
+                    step_table(env, index, arrays)
+            elif command == RESET:
+                for index, env in zip(env_indices, envs):
+                    seed = int(arrays["seeds"][index])
+                    env.reset(seed=seed if seed >= 0 else None)
+                    arrays["rewards"][index] = 0.0
+                    arrays["dones"][index] = 0
+                    write_table(env, index, arrays)
+            elif command == CLOSE:
+                break
+
+            connection.send_bytes(ACK)
+    except Exception:
+        connection.send_bytes(ERROR + traceback.format_exc().encode())
+    finally:
+        del arrays
+        memory.close()
+        connection.close()
+
+
+def step_table(env: ToepEnv, index: int, arrays: dict[str, np.ndarray]):
+    env.step(int(arrays["actions"][index]))
+
+    rewards = arrays["rewards"][index]
+    for seat, agent in enumerate(env.possible_agents):
+        rewards[seat] = env.rewards[agent]
+
+    done = all(env.terminations.values()) or all(env.truncations.values())
+    arrays["dones"][index] = done
+
+    if done:
+        env.reset()
+
+    write_table(env, index, arrays)
+
+
+class ToepVectorEnv:
+    """Steps many ToepEnv tables in worker processes.
+
+    Every table reports the observation and action mask of the seat whose
+    turn it is, ``agent_seats`` holds which seat that is. Rewards cover all
+    seats of a table for the last step. Finished tables are reset by their
+    worker and flagged in ``dones``.
+
+    The returned arrays are views on shared memory that the next call
+    overwrites, copy them to keep them.
+    """
+
+    def __init__(
+        self,
+        n_workers: int,
+        envs_per_worker: int = 1,
+        env_kwargs: dict = None,
+        start_method: str = None,
+    ):
+        env_kwargs = {"n_players": 4, **(env_kwargs or {})}
+
+        probe_env = ToepEnv(**env_kwargs)
+        probe_env.reset()
+
+        agent = probe_env.possible_agents[0]
+        observation_size = probe_env.observe(agent)["observation"].shape[0]
+
+        self.n_workers = n_workers
+        self.num_envs = n_workers * envs_per_worker
+        self.n_players = probe_env.n_players
+
+        layout, size = buffer_layout(
+            self.num_envs, observation_size, self.n_players
+        )
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.arrays = buffer_views(self.memory.buf, layout)
+        self.arrays["seeds"][:] = -1
+
+        context = mp.get_context(start_method)
+        self.connections = []
+        self.processes = []
+
+        for worker_index in range(n_workers):
+            start = worker_index * envs_per_worker
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=worker,
+                args=(
+                    child_connection,
+                    self.memory.name,
+                    layout,
+                    range(start, start + envs_per_worker),
+                    env_kwargs,
+                ),
+                daemon=True,
+            )
+            process.start()
+            child_connection.close()
+
+            self.connections.append(parent_connection)
+            self.processes.append(process)
+
+        self.waiting = False
+        self.closed = False
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self.arrays["observations"]
+
+    @property
+    def action_masks(self) -> np.ndarray:
+        return self.arrays["action_masks"]
+
+    @property
+    def rewards(self) -> np.ndarray:
+        return self.arrays["rewards"]
+
+    @property
+    def agent_seats(self) -> np.ndarray:
+        return self.arrays["agent_seats"]
+
+    @property
+    def dones(self) -> np.ndarray:
+        return self.arrays["dones"]
+
+    def broadcast(self, command: bytes):
+        for connection in self.connections:
+            connection.send_bytes(command)
+
+    def wait_for_workers(self):
+        # Every worker replies, read them all so none is left for the next
+        # command to read
+        errors = []
+
+        for connection in self.connections:
+            reply = connection.recv_bytes()
+
+            if reply != ACK:
+                errors.append(reply[len(ERROR) :].decode())
+
+        if errors:
+            self.waiting = False
+            raise RuntimeError("Toep worker failed:\n" + "\n".join(errors))
+
+    def reset(self, seed: int = None):
+        if seed is None:
+            self.arrays["seeds"][:] = -1
+        else:
+            self.arrays["seeds"][:] = np.arange(seed, seed + self.num_envs)
+
+        self.broadcast(RESET)
+        self.wait_for_workers()
+
+        return self.observations, self.action_masks, self.agent_seats
+
+    def step_async(self, actions):
+        if self.waiting:
+            raise RuntimeError("Call step_wait before stepping again")
+
+        self.arrays["actions"][:] = actions
+        self.broadcast(STEP)
+        self.waiting = True
+
+    def step_wait(self):
+        self.wait_for_workers()
+        self.waiting = False
+
+        return (
+            self.observations,
+            self.action_masks,
+            self.rewards,
+            self.dones,
+            self.agent_seats,
+        )
+
+    def step(self, actions):
+        self.step_async(actions)
+
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+
+        if self.waiting:
+            with contextlib.suppress(RuntimeError):
+                self.step_wait()
+
+        for connection in self.connections:
+            with contextlib.suppress(BrokenPipeError, OSError):
+                connection.send_bytes(CLOSE)
+                connection.close()
+
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        self.arrays = None
+        # Views handed out to the caller keep the mapping alive until they are collected
+        with contextlib.suppress(BufferError):
+            self.memory.close()
+        self.memory.unlink()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        with contextlib.suppress(Exception):
+            self.close()
@@ -0,0 +1,299 @@
+"""Incremental Zobrist hashes of game states and information sets.
+
+Hashing is opt-in: a plain ToepGame keeps no hashes and pays nothing for
+them. HashedToepGame is a ToepGame whose state_hash and
+information_set_hash(seat) are kept up to date as the game is played. Game
+and player fields go through a HashedAttribute descriptor that XORs the old
+and new key on assignment, hands and piles XOR the key of a card when it
+moves. Reading the hashes is a handful of XORs over the players.
+
+The information set leaves out hands that are neither the seat's own nor
+played open. Code that replaces whole hands uses set_cards, and rehash()
+recomputes everything from scratch after in-place edits.
+
+Usage:
+    game = HashedToepGame(4)
+    game.start_round()
+    table[game.information_set_hash(game.decision_seat)] = value
+"""
+
+import functools
+import hashlib
+
+from toeppo.environment.toep_game import (
+    CARDS_PER_PLAYER,
+    NUMBER_OF_CARDS,
+    Card,
+    Player,
+    PlayerHand,
+    PlayerPile,
+    ToepGame,
+)
+
+MAX_SEATS = NUMBER_OF_CARDS // CARDS_PER_PLAYER
+
+
+def zobrist_key(*parts) -> int:
+    """Random looking 64-bit key of a part of the state, equal in every process"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+
+    return int.from_bytes(digest, "little")
+
+
+# Zobrist keys of a card in a hand per seat, and on a pile per seat and position
+HAND_KEYS = tuple(
+    tuple(zobrist_key("hand", seat, index) for index in range(NUMBER_OF_CARDS))
+    for seat in range(MAX_SEATS)
+)
+PILE_KEYS = tuple(
+    tuple(
+        tuple(
+            zobrist_key("pile", seat, position, index)
+            for index in range(NUMBER_OF_CARDS)
+        )
+        for position in range(CARDS_PER_PLAYER)
+    )
+    for seat in range(MAX_SEATS)
+)
+OBSERVER_KEYS = tuple(
+    zobrist_key("observer", seat) for seat in range(MAX_SEATS)
+)
+
+
+MISSING = object()
+# Bound on the memoized keys of one attribute, values are rarely new objects
+MAX_MEMOIZED_KEYS = 4096
+
+
+class HashedAttribute:
+    """Attribute that keeps the Zobrist hash of its owner up to date.
+
+    Only __set__ is defined, so reading stays a plain instance attribute
+    lookup. Every assignment XORs the key of the old value out of the
+    ``field_hash`` of the owner and the key of the new value in.
+    """
+
+    def __init__(self, per_seat: bool = False):
+        # Player attributes are keyed by the seat of the player as well
+        self.per_seat = per_seat
+        # Keys by id of the value, hashing enums and cards is slow. The
+        # value is kept along, so the id cannot be reused by another object
+        self.keys = [{} for _ in range(MAX_SEATS if per_seat else 1)]
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def key(self, instance, value) -> int:
+        seat = instance.seat if self.per_seat else 0
+        entry = self.keys[seat].get(id(value))
+
+        if entry is None or entry[0] is not value:
+            return self.memoize(seat, value)
+
+        return entry[1]
+
+    def memoize(self, seat: int, value) -> int:
+        keys = self.keys[seat]
+
+        if len(keys) >= MAX_MEMOIZED_KEYS:
+            keys.clear()
+
+        # Derived from the value only, so equal values get equal keys
+        key = zobrist_key(self.name, seat, value)
+        keys[id(value)] = (value, key)
+
+        return key
+
+    def __set__(self, instance, value):
+        attributes = instance.__dict__
+        name = self.name
+        old = attributes.get(name, MISSING)
+
+        # Handlers often set what is already there, e.g. the phase
+        if old is value:
+            return
+
+        # Inlined key lookups, this runs several times per game step
+        seat = instance.seat if self.per_seat else 0
+        keys = self.keys[seat]
+        entry = keys.get(id(value))
+        change = (
+            self.memoize(seat, value)
+            if entry is None or entry[0] is not value
+            else entry[1]
+        )
+
+        if old is not MISSING:
+            entry = keys.get(id(old))
+            change ^= (
+                self.memoize(seat, old)
+                if entry is None or entry[0] is not old
+                else entry[1]
+            )
+
+        attributes["field_hash"] ^= change
+        attributes[name] = value
+
+
+def field_hash(instance) -> int:
+    """Hash of all hashed attributes of instance, from scratch"""
+    value = 0
+
+    for owner in type(instance).__mro__:
+        for attribute in vars(owner).values():
+            if (
+                isinstance(attribute, HashedAttribute)
+                and attribute.name in instance.__dict__
+            ):
+                value ^= attribute.key(
+                    instance, instance.__dict__[attribute.name]
+                )
+
+    return value
+
+
+class HashedPlayerPile(PlayerPile):
+    """Cards a seat played, ``hash`` is the Zobrist hash of them"""
+
+    def __init__(self, seat: int = 0):
+        super().__init__()
+        self.keys = PILE_KEYS[seat]
+        self.hash = 0
+
+    def add_card(self, card: Card):
+        self.hash ^= self.keys[len(self.cards)][card.index]
+        self.cards.append(card)
+
+    def remove_card(self, card: Card) -> Card:
+        card = super().remove_card(card)
+        self.rehash()
+
+        return card
+
+    def clear(self):
+        self.cards = []
+        self.hash = 0
+
+    def set_cards(self, cards):
+        self.cards = list(cards)
+        self.rehash()
+
+    def rehash(self):
+        self.hash = 0
+
+        for position, card in enumerate(self.cards):
+            self.hash ^= self.keys[position][card.index]
+
+
+class HashedPlayerHand(PlayerHand):
+    """Cards a seat holds, ``hash`` is the Zobrist hash of them"""
+
+    def __init__(self, seat: int = 0):
+        super().__init__()
+        self.keys = HAND_KEYS[seat]
+        self.hash = 0
+
+    def add_card(self, card: Card):
+        self.hash ^= self.keys[card.index]
+        self.cards.append(card)
+
+    def remove_card(self, card: Card) -> Card:
+        card = super().remove_card(card)
+        self.hash ^= self.keys[card.index]
+
+        return card
+
+    def clear(self):
+        self.cards = []
+        self.hash = 0
+
+    def set_cards(self, cards):
+        self.cards = list(cards)
+        self.rehash()
+
+    def rehash(self):
+        self.hash = 0
+
+        for card in self.cards:
+            self.hash ^= self.keys[card.index]
+
+
+class HashedPlayer(Player):
+    score = HashedAttribute(per_seat=True)
+    play_open = HashedAttribute(per_seat=True)
+
+    def __init__(self, name, seat: int = 0):
+        self.field_hash = 0
+        # The keys of cards in hands and piles depend on the seat
+        self.pile_class = functools.partial(HashedPlayerPile, seat)
+        self.hand_class = functools.partial(HashedPlayerHand, seat)
+        super().__init__(name, seat)
+
+    @property
+    def information_set_hash(self) -> int:
+        return self.game.information_set_hash(self.seat)
+
+
+class HashedToepGame(ToepGame):
+    """ToepGame that keeps Zobrist hashes of its state up to date"""
+
+    player_class = HashedPlayer
+
+    # Everything to_bytes stores but the counters, the score history and
+    # the deck, see state_hash
+    phase = HashedAttribute()
+    decision_seat = HashedAttribute()
+    active_seat = HashedAttribute()
+    dealing_seat = HashedAttribute()
+    last_seat_of_sub_round = HashedAttribute()
+    last_seat_to_toep = HashedAttribute()
+    called_vuile_was = HashedAttribute()
+    winning_seat = HashedAttribute()
+    winning_card = HashedAttribute()
+    turn = HashedAttribute()
+    sub_round = HashedAttribute()
+    leading_suit = HashedAttribute()
+    stake = HashedAttribute()
+    alive_mask = HashedAttribute()
+    looked_mask = HashedAttribute()
+
+    def __init__(self, n_players: int, deal_bank=None):
+        self.field_hash = 0
+        super().__init__(n_players, deal_bank)
+
+    @property
+    def state_hash(self) -> int:
+        """64-bit Zobrist hash of the state, kept up to date on every change.
+
+        Equal states have equal hashes. The game counters, the score history
+        and the order of the deck are not part of the state here.
+        """
+        state_hash = self.field_hash
+
+        for player in self.players:
+            state_hash ^= (
+                player.field_hash ^ player.hand.hash ^ player.pile.hash
+            )
+
+        return state_hash
+
+    def information_set_hash(self, seat: int) -> int:
+        """Hash of the state as seat sees it, without the hidden hands"""
+        information_set_hash = self.field_hash ^ OBSERVER_KEYS[seat]
+
+        for player in self.players:
+            information_set_hash ^= player.field_hash ^ player.pile.hash
+
+            if player.seat == seat or player.play_open:
+                information_set_hash ^= player.hand.hash
+
+        return information_set_hash
+
+    def rehash(self):
+        """Hash the state from scratch, after changing cards in place"""
+        self.field_hash = field_hash(self)
+
+        for player in self.players:
+            player.field_hash = field_hash(player)
+            player.hand.rehash()
+            player.pile.rehash()
@@ -0,0 +1,165 @@
+"""Load generator for the game server.
+
+Opens one connection per table, joins a new table with one client seat and
+plays random legal actions, joining a new table whenever a game ends until
+the time is up. Reports decisions per second and the latency between
+sending an action and getting the next observation, which includes the bot
+decisions of the rest of the table.
+
+Usage: python -m toeppo.server.load_generator [--tables N] [--duration S]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+from toeppo.server.game_server import DEFAULT_PORT
+
+
+async def play(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    stop_time: float,
+    rng: random.Random,
+    latencies: list[float],
+    n_players: int,
+) -> tuple[int, int]:
+    """Play games until stop_time, returns the decisions and games played"""
+
+    def send(message: dict):
+        writer.write(json.dumps(message).encode() + b"\n")
+
+    decisions = games = 0
+    sent_at = None
+    send({"op": "join", "n_players": n_players, "clients": 1})
+
+    while line := await reader.readline():
+        message = json.loads(line)
+
+        match message["type"]:
+            case "observation":
+                if sent_at is not None:
+                    latencies.append(time.perf_counter() - sent_at)
+
+                sent_at = time.perf_counter()
+                send(
+                    {
+                        "op": "act",
+                        "action": rng.choice(message["legal_actions"]),
+                    }
+                )
+                decisions += 1
+            case "end":
+                games += 1
+                sent_at = None
+
+                if time.perf_counter() >= stop_time:
+                    break
+
+                send({"op": "join", "n_players": n_players, "clients": 1})
+            case "error":
+                raise RuntimeError(message["error"])
+
+        await writer.drain()
+
+    return decisions, games
+
+
+async def run_client(
+    connect, stop_time: float, seed: int, latencies: list, n_players: int
+) -> tuple[int, int]:
+    reader, writer = await connect()
+
+    try:
+        return await play(
+            reader,
+            writer,
+            stop_time,
+            random.Random(seed),
+            latencies,
+            n_players,
+        )
+    finally:
+        writer.close()
+
+
+async def generate_load(
+    n_tables: int,
+    duration: float,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    path=None,
+    n_players: int = 4,
+    seed: int = 0,
+) -> dict:
+    if path is None:
+
+        async def connect():
+            return await asyncio.open_connection(host, port)
+
+    else:
+
+        async def connect():
+            return await asyncio.open_unix_connection(path)
+
+    latencies = []
+    start = time.perf_counter()
+    stop_time = start + duration
+
+    results = await asyncio.gather(
+        *(
+            run_client(connect, stop_time, seed + i, latencies, n_players)
+            for i in range(n_tables)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    decisions = sum(result[0] for result in results)
+    games = sum(result[1] for result in results)
+    summary = {
+        "tables": n_tables,
+        "seconds": elapsed,
+        "decisions": decisions,
+        "games": games,
+        "decisions_per_second": decisions / elapsed,
+    }
+
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        summary.update(p50_ms=p50, p95_ms=p95, p99_ms=p99)
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="Unix socket path")
+    parser.add_argument("--tables", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    summary = asyncio.run(
+        generate_load(
+            args.tables,
+            args.duration,
+            args.host,
+            args.port,
+            args.unix,
+            args.players,
+            args.seed,
+        )
+    )
+
+    for name, value in summary.items():
+        print(
+            f"{name}: {value:.2f}"
+            if isinstance(value, float)
+            else f"{name}: {value}"
+        )
@@ -0,0 +1,579 @@
+"""Monte Carlo CFR+ solver for reduced Toepen variants.
+
+Plays single rounds of ToepGame with two players and a 12-card deck. Every
+iteration deals a random hand and, for every seat in turn, walks all actions
+of that seat and one sampled action of the other seats (external sampling),
+updating the regrets of the information sets on the way. Regrets are
+floored at zero after every traversal and the average strategy is weighted
+by iteration, as in CFR+.
+
+The solver is limited to that smallest variant, two players need at least
+12 cards with the redraws of vuile was. Information sets are the full
+history a seat observed, without abstraction, and even this variant has a
+lot of them: about 1700 new ones per iteration after 200 iterations, 340
+thousand by then. A third player or more cards multiply the tree beyond
+what the in-memory tables hold.
+
+Worker processes run batches of iterations and send back the changes of
+the information sets they visited, which are summed into the tables and
+floored again. A worker plays CFR+ on its own view, the tables as they were
+at the start of the batch plus its own changes. The tables are NumPy arrays
+with a row per information set, found through a dict of compact byte keys,
+and are checkpointed to a .npz file.
+
+Usage: python -m toeppo.training.cfr OUTPUT [--iterations N] [--resume]
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import random
+
+import numpy as np
+
+from toeppo.environment.toep_env import action_mask, apply_action
+from toeppo.environment.toep_game import (
+    CARDS_PER_PLAYER,
+    PHASE_TO_ACTION_TYPE,
+    Card,
+    Deck,
+    Phase,
+    Rank,
+    Suit,
+    ToepGame,
+)
+
+# Toep or one of the cards in hand
+MAX_ACTIONS = CARDS_PER_PLAYER + 1
+
+# Markers in information set keys, above every action number
+REDRAWN = 0xFD
+REVEALED = 0xFE
+
+# The largest variant the solver takes, see the module docstring
+MAX_PLAYERS = 2
+MAX_CARDS = 12
+
+DEFAULT_SUITS = (Suit.HEARTS, Suit.SPADES)
+DEFAULT_RANKS = (
+    Rank.JACK,
+    Rank.QUEEN,
+    Rank.ACE,
+    Rank.SEVEN,
+    Rank.NINE,
+    Rank.TEN,
+)
+
+
+def reduced_deck(suits=DEFAULT_SUITS, ranks=DEFAULT_RANKS) -> list[int]:
+    return [Card(suit, rank).index for suit in suits for rank in ranks]
+
+
+def hand_bytes(cards) -> bytes:
+    return bytes(sorted(card.index for card in cards))
+
+
+class ShuffledDeals:
+    """Takes the place of a DealBank, shuffles a subset of the deck every round"""
+
+    def __init__(self, card_indices, rng: random.Random):
+        self.card_indices = list(card_indices)
+        self.rng = rng
+
+    def next_deck(self) -> Deck:
+        self.rng.shuffle(self.card_indices)
+
+        return Deck.from_indices(self.card_indices)
+
+
+class InfoSetTable:
+    """Regrets and strategy sums of every information set seen so far"""
+
+    def __init__(self, capacity: int = 1024):
+        self.rows: dict[bytes, int] = {}
+        self.keys: list[bytes] = []
+        self.n_actions = np.zeros(capacity, dtype=np.uint8)
+        self.regrets = np.zeros((capacity, MAX_ACTIONS))
+        self.strategy_sums = np.zeros((capacity, MAX_ACTIONS))
+        self.iterations = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def row(self, key: bytes, n_actions: int) -> int:
+        row = self.rows.get(key)
+
+        if row is None:
+            row = len(self.keys)
+
+            if row == len(self.n_actions):
+                self.grow(2 * row)
+
+            self.rows[key] = row
+            self.keys.append(key)
+            self.n_actions[row] = n_actions
+
+        return row
+
+    def grow(self, capacity: int):
+        for name in ("n_actions", "regrets", "strategy_sums"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def strategy(self, key: bytes, n_actions: int) -> np.ndarray:
+        """Current strategy by regret matching"""
+        return regret_matching(self.row_regrets(key, n_actions))
+
+    def row_regrets(self, key: bytes, n_actions: int) -> np.ndarray:
+        """Regrets of the legal actions, zero for a new information set"""
+        row = self.rows.get(key)
+
+        if row is None:
+            return np.zeros(n_actions)
+
+        return self.regrets[row, :n_actions]
+
+    def average_strategy(self, key: bytes) -> np.ndarray:
+        """
+        Probabilities of the legal actions of an information set, in
+        increasing action number
+        """
+        row = self.rows.get(key)
+
+        if row is None:
+            raise KeyError(key)
+
+        n_actions = self.n_actions[row]
+        sums = self.strategy_sums[row, :n_actions]
+        total = sums.sum()
+
+        if total > 0:
+            return sums / total
+
+        return np.full(n_actions, 1 / n_actions)
+
+    def add_changes(
+        self,
+        regret_changes: dict[bytes, np.ndarray],
+        strategy_sum_changes: dict[bytes, np.ndarray],
+    ):
+        for key, change in regret_changes.items():
+            row = self.row(key, len(change))
+            self.regrets[row, : len(change)] += change
+
+        for key, change in strategy_sum_changes.items():
+            row = self.row(key, len(change))
+            self.strategy_sums[row, : len(change)] += change
+
+    def floor_regrets(self):
+        np.maximum(self.regrets, 0.0, out=self.regrets)
+
+    def save(self, path):
+        """Write the tables to a .npz file, replacing it only when complete"""
+        size = len(self)
+        temporary_path = f"{path}.tmp"
+
+        with open(temporary_path, "wb") as file:
+            np.savez(
+                file,
+                keys=np.frombuffer(b"".join(self.keys), dtype=np.uint8),
+                key_lengths=np.array(
+                    [len(key) for key in self.keys], dtype=np.uint16
+                ),
+                n_actions=self.n_actions[:size],
+                regrets=self.regrets[:size],
+                strategy_sums=self.strategy_sums[:size],
+                iterations=self.iterations,
+            )
+
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path) -> "InfoSetTable":
+        with np.load(path) as data:
+            return cls.from_arrays(
+                data["keys"].tobytes(),
+                data["key_lengths"],
+                data["n_actions"],
+                data["regrets"],
+                data["strategy_sums"],
+                int(data["iterations"]),
+            )
+
+    @classmethod
+    def from_arrays(
+        cls,
+        keys: bytes,
+        key_lengths,
+        n_actions,
+        regrets,
+        strategy_sums,
+        iterations: int,
+    ) -> "InfoSetTable":
+        table = cls(max(len(n_actions), 1))
+        offsets = [0, *itertools.accumulate(np.asarray(key_lengths).tolist())]
+        table.keys = [
+            keys[start:end] for start, end in zip(offsets, offsets[1:])
+        ]
+        table.rows = {key: row for row, key in enumerate(table.keys)}
+        table.n_actions[: len(n_actions)] = n_actions
+        table.regrets[: len(regrets)] = regrets
+        table.strategy_sums[: len(strategy_sums)] = strategy_sums
+        table.iterations = iterations
+
+        return table
+
+    def __getstate__(self):
+        # Only pickle the used rows, the dict is rebuilt from the keys
+        size = len(self)
+
+        return (
+            b"".join(self.keys),
+            [len(key) for key in self.keys],
+            self.n_actions[:size],
+            self.regrets[:size],
+            self.strategy_sums[:size],
+            self.iterations,
+        )
+
+    def __setstate__(self, state: tuple):
+        self.__dict__.update(self.from_arrays(*state).__dict__)
+
+
+class CFRSolver:
+    """External sampling MCCFR+ on single rounds of a reduced ToepGame.
+
+    The solver starts from a fixed InfoSetTable and collects its updates in
+    ``regret_changes`` and ``strategy_sum_changes``, which
+    InfoSetTable.add_changes merges. It plays the strategy of the table plus
+    its own regret changes, floored after every traversal.
+
+    An information set key holds the acting seat, the dealing seat and the
+    history the seat observed: its dealt cards, every action of the round,
+    the outcome of vuile was calls with the open hand of a false caller, and
+    its own new cards after a true call.
+    """
+
+    def __init__(
+        self,
+        table: InfoSetTable,
+        n_players: int = 2,
+        card_indices=None,
+        seed: int = None,
+    ):
+        card_indices = reduced_deck() if card_indices is None else card_indices
+
+        # A true vuile was is redrawn from the cards that were not dealt
+        if len(card_indices) < (n_players + 1) * CARDS_PER_PLAYER:
+            raise ValueError(
+                f"{len(card_indices)} cards are too few for {n_players} players"
+            )
+        if n_players > MAX_PLAYERS or len(card_indices) > MAX_CARDS:
+            raise ValueError(
+                f"The solver is limited to {MAX_PLAYERS} players and "
+                f"{MAX_CARDS} cards"
+            )
+
+        self.table = table
+        self.n_players = n_players
+        self.rng = random.Random(seed)
+        self.game = ToepGame(
+            n_players, deal_bank=ShuffledDeals(card_indices, self.rng)
+        )
+        self.dealing_seat = 0
+        self.finished_rounds = 0
+        self.regret_changes: dict[bytes, np.ndarray] = {}
+        self.strategy_sum_changes: dict[bytes, np.ndarray] = {}
+        # Regrets changed since they were last floored
+        self.updated_keys: set[bytes] = set()
+
+    def run(self, iterations: int, first_iteration: int = 1):
+        for iteration in range(first_iteration, first_iteration + iterations):
+            for traverser in range(self.n_players):
+                histories = self.deal()
+                self.traverse(traverser, histories, iteration)
+                self.floor_regrets()
+
+    def strategy(self, key: bytes, n_actions: int) -> np.ndarray:
+        """Regret matching on the table regrets plus the changes of the solver"""
+        change = self.regret_changes.get(key)
+
+        if change is None:
+            return self.table.strategy(key, n_actions)
+
+        return regret_matching(self.table.row_regrets(key, n_actions) + change)
+
+    def floor_regrets(self):
+        """Keep the table regrets plus the changes at zero or above, as CFR+"""
+        for key in self.updated_keys:
+            change = self.regret_changes[key]
+            np.maximum(
+                change,
+                -self.table.row_regrets(key, len(change)),
+                out=change,
+            )
+
+        self.updated_keys.clear()
+
+    def deal(self) -> tuple[bytes, ...]:
+        game = self.game
+
+        game.set_up_for_new_game()
+        self.dealing_seat = game.dealing_seat = self.rng.randrange(
+            self.n_players
+        )
+        self.finished_rounds = game.finished_rounds
+        game.start_round()
+
+        return tuple(hand_bytes(player.hand) for player in game.players)
+
+    def traverse(
+        self, traverser: int, histories: tuple[bytes, ...], weight: int
+    ) -> float:
+        """Expected utility of the traverser, sampling the actions of others"""
+        game = self.game
+
+        if game.finished_rounds != self.finished_rounds:
+            return self.utility(traverser)
+
+        seat = game.decision_seat
+        actions = np.flatnonzero(
+            action_mask(game, seat, PHASE_TO_ACTION_TYPE[game.phase])
+        ).tolist()
+        n_actions = len(actions)
+        key = bytes((seat, self.dealing_seat)) + histories[seat]
+        strategy = self.strategy(key, n_actions)
+
+        if seat != traverser:
+            add_change(self.strategy_sum_changes, key, weight * strategy)
+            action = actions[self.sample(strategy)]
+
+            return self.traverse(
+                traverser, self.play(seat, action, histories), weight
+            )
+
+        if n_actions == 1:
+            return self.traverse(
+                traverser, self.play(seat, actions[0], histories), weight
+            )
+
+        state = game.to_bytes()
+        values = np.empty(n_actions)
+
+        for index, action in enumerate(actions):
+            if index:
+                game.load_bytes(state)
+
+            values[index] = self.traverse(
+                traverser, self.play(seat, action, histories), weight
+            )
+
+        value = float(strategy @ values)
+        add_change(self.regret_changes, key, values - value)
+        self.updated_keys.add(key)
+
+        return value
+
+    def play(
+        self, seat: int, action: int, histories: tuple[bytes, ...]
+    ) -> tuple[bytes, ...]:
+        game = self.game
+        checking_vuile_was = game.phase is Phase.CHECK_OR_TRUST
+
+        apply_action(game.players[seat], action)
+        event = bytes((action,))
+
+        if checking_vuile_was and game.phase is not Phase.CHECK_OR_TRUST:
+            caller_seat = game.called_vuile_was
+            caller = game.players[caller_seat]
+
+            if caller.play_open:
+                event += bytes((REVEALED,)) + hand_bytes(caller.hand)
+            else:
+                event += bytes((REDRAWN,))
+
+                return tuple(
+                    history
+                    + event
+                    + (
+                        hand_bytes(caller.hand)
+                        if seat_ == caller_seat
+                        else b""
+                    )
+                    for seat_, history in enumerate(histories)
+                )
+
+        return tuple(history + event for history in histories)
+
+    def utility(self, seat: int) -> float:
+        """Points the other seats lost on average minus the points of seat"""
+        points = self.game.last_round_points
+
+        return (sum(points) - points[seat]) / (self.n_players - 1) - points[
+            seat
+        ]
+
+    def sample(self, strategy: np.ndarray) -> int:
+        threshold = self.rng.random()
+        cumulative = 0.0
+
+        for index, probability in enumerate(strategy.tolist()):
+            cumulative += probability
+            if threshold < cumulative:
+                return index
+
+        return len(strategy) - 1
+
+
+def regret_matching(regrets: np.ndarray) -> np.ndarray:
+    positive_regrets = np.maximum(regrets, 0.0)
+    total = positive_regrets.sum()
+
+    if total > 0:
+        return positive_regrets / total
+
+    return np.full(len(regrets), 1 / len(regrets))
+
+
+def add_change(changes: dict[bytes, np.ndarray], key: bytes, change):
+    if key in changes:
+        changes[key] += change
+    else:
+        changes[key] = change
+
+
+# Tables of the current batch in the worker processes, see solve
+shared_table: InfoSetTable = None
+
+
+def share_table(table: InfoSetTable):
+    global shared_table
+    shared_table = table
+
+
+def run_batch(
+    n_players: int,
+    card_indices,
+    first_iteration: int,
+    iterations: int,
+    seed: int,
+) -> tuple[dict, dict]:
+    solver = CFRSolver(shared_table, n_players, card_indices, seed)
+    solver.run(iterations, first_iteration)
+
+    return solver.regret_changes, solver.strategy_sum_changes
+
+
+def solve(
+    path,
+    iterations: int,
+    n_players: int = 2,
+    card_indices=None,
+    processes: int = None,
+    batch_iterations: int = 1000,
+    checkpoint_every: int = 100_000,
+    seed: int = 0,
+    table: InfoSetTable = None,
+) -> InfoSetTable:
+    """
+    Run CFR iterations in worker processes and checkpoint the tables to path.
+    Workers play a batch of iterations against the tables as they were at
+    the start of the batch, their changes are merged when all are done.
+    :param batch_iterations:
+        Iterations every worker runs per batch
+    :param checkpoint_every:
+        Iterations between writing the tables to path
+    :param table:
+        Tables to continue from, for example InfoSetTable.load(path)
+    """
+    logger = logging.getLogger(__name__)
+    table = InfoSetTable() if table is None else table
+    processes = processes or os.cpu_count()
+    last_checkpoint = table.iterations
+    # Forked workers inherit the tables instead of unpickling a copy. The
+    # pool is forked again for every batch on purpose: that is what gives
+    # the workers the tables merged after the last batch, copy-on-write. A
+    # pool kept alive would need the whole table pickled into every task.
+    # The executor cannot address its workers to send each one the merged
+    # changes. Forking a pool takes tens of milliseconds against seconds
+    # for a batch.
+    context = mp.get_context(
+        "fork" if "fork" in mp.get_all_start_methods() else None
+    )
+
+    while table.iterations < iterations:
+        remaining = iterations - table.iterations
+        batch = min(batch_iterations, -(-remaining // processes))
+        first_iterations = [
+            table.iterations + worker * batch + 1
+            for worker in range(processes)
+        ]
+
+        with ProcessPoolExecutor(
+            processes,
+            mp_context=context,
+            initializer=share_table,
+            initargs=(table,),
+        ) as executor:
+            results = list(
+                executor.map(
+                    run_batch,
+                    [n_players] * processes,
+                    [card_indices] * processes,
+                    first_iterations,
+                    [batch] * processes,
+                    [(seed << 32) + first for first in first_iterations],
+                )
+            )
+
+        for regret_changes, strategy_sum_changes in results:
+            table.add_changes(regret_changes, strategy_sum_changes)
+
+        table.floor_regrets()
+        table.iterations += batch * processes
+
+        if table.iterations - last_checkpoint >= checkpoint_every:
+            table.save(path)
+            last_checkpoint = table.iterations
+            logger.info(
+                "%s iterations, %s information sets",
+                table.iterations,
+                len(table),
+            )
+
+    table.save(path)
+
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--batch-iterations", type=int, default=1000)
+    parser.add_argument("--checkpoint-every", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--resume", action="store_true", help="Continue from OUTPUT"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    # Only the progress of the solver, the games log every action
+    logging.getLogger(__name__).setLevel(logging.INFO)
+
+    solve(
+        args.output,
+        args.iterations,
+        processes=args.processes,
+        batch_iterations=args.batch_iterations,
+        checkpoint_every=args.checkpoint_every,
+        seed=args.seed,
+        table=InfoSetTable.load(args.output) if args.resume else None,
+    )
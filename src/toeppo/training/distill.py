@@ -0,0 +1,374 @@
+"""Distills an exported policy into a much smaller student network.
+
+The teacher plays ToepEnv tables with exploration while its action
+probabilities are recorded for every observation. A small MLP is then
+trained in NumPy to match them, minimizing the KL divergence from the
+teacher to the student over the legal actions only. The student is an
+ExportedPolicy, so it is saved, loaded and run like any exported policy.
+
+Usage: python -m toeppo.training.distill TEACHER OUTPUT [--hidden 64]
+"""
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from toeppo.agents.exported_policy import ExportedPolicy
+from toeppo.agents.policy import Policy, masked_softmax
+from toeppo.environment.vector_env import ToepVectorEnv
+
+# Derivative of the activation, given its output
+ACTIVATION_GRADIENTS = {
+    "tanh": lambda hidden: 1.0 - hidden**2,
+    "relu": lambda hidden: (hidden > 0.0).astype(np.float32),
+    "linear": lambda hidden: 1.0,
+}
+
+
+def collect_teacher_targets(
+    teacher: Policy,
+    n_samples: int,
+    n_workers: int = 2,
+    envs_per_worker: int = 32,
+    seed: int = 0,
+    env_kwargs: dict = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Play with the teacher and record what it does.
+    :return:
+        Observations, action masks and teacher action probabilities of
+        n_samples decisions
+    """
+    rng = np.random.default_rng(seed)
+
+    with ToepVectorEnv(n_workers, envs_per_worker, env_kwargs) as envs:
+        observations, action_masks, _ = envs.reset(seed=seed)
+        n_envs = envs.num_envs
+        n_steps = -(-n_samples // n_envs)
+
+        recorded_observations = np.empty(
+            (n_steps * n_envs, observations.shape[1]), dtype=np.float32
+        )
+        recorded_masks = np.empty(
+            (n_steps * n_envs, action_masks.shape[1]), dtype=np.int8
+        )
+        probabilities = np.empty(recorded_masks.shape, dtype=np.float32)
+
+        for step in range(n_steps):
+            batch = slice(step * n_envs, (step + 1) * n_envs)
+            recorded_observations[batch] = observations
+            recorded_masks[batch] = action_masks
+            probabilities[batch] = teacher.action_probabilities(
+                observations, action_masks
+            )
+
+            # Sample the teacher's own distribution so the states match its play
+            cumulative = probabilities[batch].cumsum(axis=1)
+            draws = rng.random((n_envs, 1)) * cumulative[:, -1:]
+            actions = np.minimum(
+                (cumulative <= draws).sum(axis=1), cumulative.shape[1] - 1
+            )
+            observations, action_masks, _, _, _ = envs.step(actions)
+
+    return (
+        recorded_observations[:n_samples],
+        recorded_masks[:n_samples],
+        probabilities[:n_samples],
+    )
+
+
+def masked_log_softmax(
+    logits: np.ndarray, action_masks: np.ndarray
+) -> np.ndarray:
+    """Log probabilities of the legal actions, zero for illegal actions"""
+    legal = action_masks > 0
+    masked_logits = np.where(legal, logits, -np.inf)
+    masked_logits -= masked_logits.max(axis=1, keepdims=True)
+    log_sums = np.log(np.exp(masked_logits).sum(axis=1, keepdims=True))
+
+    return np.where(legal, masked_logits - log_sums, 0.0)
+
+
+def masked_kl(
+    teacher_probabilities: np.ndarray,
+    student_logits: np.ndarray,
+    action_masks: np.ndarray,
+) -> np.ndarray:
+    """KL divergence from the teacher to the student per row, over legal actions"""
+    student_log_probabilities = masked_log_softmax(
+        student_logits, action_masks
+    )
+    teacher_log_probabilities = np.log(
+        np.maximum(teacher_probabilities, np.finfo(np.float32).tiny)
+    )
+    terms = teacher_probabilities * (
+        teacher_log_probabilities - student_log_probabilities
+    )
+
+    return np.where(action_masks > 0, terms, 0.0).sum(axis=1)
+
+
+def init_student(
+    observation_size: int,
+    hidden_sizes: tuple[int, ...],
+    n_actions: int,
+    activation: str,
+    rng: np.random.Generator,
+) -> ExportedPolicy:
+    sizes = [observation_size, *hidden_sizes, n_actions]
+    gain = 2.0 if activation == "relu" else 1.0
+    weights = [
+        rng.normal(0.0, np.sqrt(gain / n_in), (n_in, n_out))
+        for n_in, n_out in zip(sizes[:-1], sizes[1:])
+    ]
+    biases = [np.zeros(n_out) for n_out in sizes[1:]]
+
+    return ExportedPolicy(weights, biases, activation)
+
+
+def train_student(
+    observations: np.ndarray,
+    action_masks: np.ndarray,
+    teacher_probabilities: np.ndarray,
+    hidden_sizes: tuple[int, ...] = (64,),
+    activation: str = "relu",
+    epochs: int = 20,
+    batch_size: int = 256,
+    learning_rate: float = 1e-3,
+    seed: int = 0,
+) -> ExportedPolicy:
+    """
+    Fit a student MLP to the teacher probabilities with Adam.
+    :param hidden_sizes:
+        Widths of the hidden layers of the student
+    """
+    if activation not in ACTIVATION_GRADIENTS:
+        raise ValueError(f"Cannot train a student with {activation}")
+
+    logger = logging.getLogger(__name__)
+    rng = np.random.default_rng(seed)
+    student = init_student(
+        observations.shape[1],
+        hidden_sizes,
+        action_masks.shape[1],
+        activation,
+        rng,
+    )
+    activation_gradient = ACTIVATION_GRADIENTS[activation]
+    parameters = [*student.weights, *student.biases]
+    first_moments = [np.zeros_like(parameter) for parameter in parameters]
+    second_moments = [np.zeros_like(parameter) for parameter in parameters]
+    beta_1, beta_2, epsilon = 0.9, 0.999, 1e-8
+    updates = 0
+
+    for epoch in range(epochs):
+        order = rng.permutation(len(observations))
+        losses = []
+
+        for start in range(0, len(order), batch_size):
+            rows = order[start : start + batch_size]
+            masks = action_masks[rows]
+            targets = teacher_probabilities[rows]
+
+            # Forward, keeping the input of every layer
+            layer_inputs = [observations[rows]]
+
+            for weight, bias in zip(student.weights[:-1], student.biases[:-1]):
+                layer_inputs.append(
+                    student.activation_fn(layer_inputs[-1] @ weight + bias)
+                )
+
+            logits = (
+                layer_inputs[-1] @ student.weights[-1] + student.biases[-1]
+            )
+            losses.append(masked_kl(targets, logits, masks).mean())
+
+            # The KL gradient of the logits is the difference of the distributions
+            gradient = (masked_softmax(logits, masks) - targets) / len(rows)
+            weight_gradients = []
+            bias_gradients = []
+
+            for layer in reversed(range(len(student.weights))):
+                weight_gradients.append(layer_inputs[layer].T @ gradient)
+                bias_gradients.append(gradient.sum(axis=0))
+
+                if layer > 0:
+                    gradient = (
+                        gradient @ student.weights[layer].T
+                    ) * activation_gradient(layer_inputs[layer])
+
+            gradients = [*weight_gradients[::-1], *bias_gradients[::-1]]
+            updates += 1
+
+            for parameter, gradient, first, second in zip(
+                parameters, gradients, first_moments, second_moments
+            ):
+                first *= beta_1
+                first += (1 - beta_1) * gradient
+                second *= beta_2
+                second += (1 - beta_2) * gradient**2
+                step = learning_rate * np.sqrt(1 - beta_2**updates)
+                step /= 1 - beta_1**updates
+                parameter -= step * first / (np.sqrt(second) + epsilon)
+
+        logger.info("Epoch %s: masked KL %.4f", epoch, np.mean(losses))
+
+    return student
+
+
+def agreement(
+    student: Policy,
+    observations: np.ndarray,
+    action_masks: np.ndarray,
+    teacher_probabilities: np.ndarray,
+) -> float:
+    """Fraction of decisions where the student picks the teacher's best action"""
+    teacher_actions = np.where(
+        action_masks > 0, teacher_probabilities, -1.0
+    ).argmax(axis=1)
+    student_actions = student.compute_actions(observations, action_masks)
+
+    return float((student_actions == teacher_actions).mean())
+
+
+def decisions_per_second(
+    policy: Policy,
+    observations: np.ndarray,
+    action_masks: np.ndarray,
+    batch_size: int,
+    min_seconds: float = 1.0,
+) -> float:
+    decisions = 0
+    start = time.perf_counter()
+
+    while (elapsed := time.perf_counter() - start) < min_seconds:
+        offset = decisions % max(len(observations) - batch_size, 1)
+        batch = slice(offset, offset + batch_size)
+        policy.compute_actions(observations[batch], action_masks[batch])
+        # Fewer than batch_size when there are fewer observations
+        decisions += len(observations[batch])
+
+    return decisions / elapsed
+
+
+def benchmark(
+    teacher: Policy,
+    student: Policy,
+    observations: np.ndarray,
+    action_masks: np.ndarray,
+    teacher_probabilities: np.ndarray,
+    batch_sizes: tuple[int, ...] = (1, 256),
+) -> dict:
+    """Decisions per second of both policies against teacher agreement"""
+    results = {
+        "agreement": agreement(
+            student, observations, action_masks, teacher_probabilities
+        ),
+        "masked_kl": float(
+            masked_kl(
+                teacher_probabilities,
+                student.logits(observations),
+                action_masks,
+            ).mean()
+        ),
+    }
+
+    for batch_size in batch_sizes:
+        for name, policy in (("teacher", teacher), ("student", student)):
+            results[f"{name}_decisions_per_second_{batch_size}"] = (
+                decisions_per_second(
+                    policy, observations, action_masks, batch_size
+                )
+            )
+
+    return results
+
+
+def distill(
+    teacher: ExportedPolicy,
+    output_path,
+    n_samples: int = 100_000,
+    validation_fraction: float = 0.1,
+    seed: int = 0,
+    deal_bank=None,
+    **train_kwargs,
+) -> dict:
+    """Collect, train, save the student to output_path and benchmark it"""
+    logger = logging.getLogger(__name__)
+    observations, action_masks, probabilities = collect_teacher_targets(
+        teacher, n_samples, seed=seed
+    )
+    n_train = int(len(observations) * (1 - validation_fraction))
+    logger.info("Collected %s decisions", len(observations))
+
+    student = train_student(
+        observations[:n_train],
+        action_masks[:n_train],
+        probabilities[:n_train],
+        seed=seed,
+        **train_kwargs,
+    )
+    student.save(output_path)
+
+    results = benchmark(
+        teacher,
+        student,
+        observations[n_train:],
+        action_masks[n_train:],
+        probabilities[n_train:],
+    )
+
+    if deal_bank is not None:
+        # Imported here so distilling does not need the evaluation module
+        from toeppo.agents.evaluation import duplicate_evaluation
+
+        strength = duplicate_evaluation(student, teacher, deal_bank)
+        results["advantage_over_teacher"] = strength.mean
+        results["advantage_standard_error"] = strength.standard_error
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("teacher", help="Exported teacher .npz")
+    parser.add_argument("output", help="Student .npz to write")
+    parser.add_argument("--samples", type=int, default=100_000)
+    parser.add_argument("--hidden", type=int, nargs="+", default=[64])
+    parser.add_argument("--activation", default="relu")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--deal-bank", default=None, help="Also compare strength on a bank"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    logging.getLogger(__name__).setLevel(logging.INFO)
+
+    deal_bank = None
+
+    if args.deal_bank is not None:
+        from toeppo.environment.deal_bank import DealBank
+
+        deal_bank = DealBank.load(args.deal_bank)
+
+    results = distill(
+        ExportedPolicy.load(args.teacher),
+        args.output,
+        n_samples=args.samples,
+        seed=args.seed,
+        deal_bank=deal_bank,
+        hidden_sizes=tuple(args.hidden),
+        activation=args.activation,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+    )
+
+    for name, value in results.items():
+        print(f"{name}: {value:.4f}")
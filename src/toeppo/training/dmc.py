@@ -0,0 +1,82 @@
+"""Trains Toepen agents with RLCard's Deep Monte Carlo, without Ray.
+
+DMC plays episodes of ToepRLCardEnv in local actor processes with the
+current models and fits, per seat, a network of the state and the one-hot
+action to the payoff of the episode. The learner runs on CPU unless a CUDA
+device is given, and checkpoints to SAVEDIR/XPID. This is the Ray-free
+counterpart of the RLlib setup in training.py.
+
+Usage: python -m toeppo.training.dmc [--num-actors 5] [--episode-mode round]
+"""
+
+import argparse
+import logging
+
+from rlcard.agents.dmc_agent import DMCTrainer
+
+from toeppo.environment.rlcard_env import ToepRLCardEnv
+from toeppo.environment.toep_env import EPISODE_MODES
+
+
+def train(
+    n_players: int = 4,
+    episode_mode: str = "round",
+    losing_penalty_multiplier: int = 10,
+    seed: int = 0,
+    **trainer_kwargs,
+):
+    """Start DMC on a new env, trainer_kwargs go to RLCard's DMCTrainer"""
+    env = ToepRLCardEnv(
+        {
+            "seed": seed,
+            "n_players": n_players,
+            "episode_mode": episode_mode,
+            "losing_penalty_multiplier": losing_penalty_multiplier,
+        }
+    )
+    trainer = DMCTrainer(env, **trainer_kwargs)
+    trainer.start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument(
+        "--episode-mode",
+        choices=[mode for mode in EPISODE_MODES if mode is not None],
+        default="round",
+    )
+    parser.add_argument("--losing-penalty-multiplier", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-actors", type=int, default=5)
+    parser.add_argument(
+        "--cuda", default="", help="CUDA devices, empty for CPU only"
+    )
+    parser.add_argument("--training-device", default="0")
+    parser.add_argument("--num-actor-devices", type=int, default=1)
+    parser.add_argument("--total-frames", type=int, default=10**11)
+    parser.add_argument("--savedir", default="experiments/dmc_result")
+    parser.add_argument("--xpid", default="toepen")
+    parser.add_argument(
+        "--save-interval", type=int, default=30, help="Minutes"
+    )
+    parser.add_argument("--load-model", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+
+    train(
+        n_players=args.players,
+        episode_mode=args.episode_mode,
+        losing_penalty_multiplier=args.losing_penalty_multiplier,
+        seed=args.seed,
+        cuda=args.cuda,
+        training_device=args.training_device,
+        num_actor_devices=args.num_actor_devices,
+        num_actors=args.num_actors,
+        total_frames=args.total_frames,
+        savedir=args.savedir,
+        xpid=args.xpid,
+        save_interval=args.save_interval,
+        load_model=args.load_model,
+    )
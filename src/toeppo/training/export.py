@@ -0,0 +1,113 @@
+"""Exports trained TorchActionMaskModel policies to NumPy weight files.
+
+The exported files are loaded with ``toeppo.agents.exported_policy``, which
+only needs NumPy, so evaluation and demos do not have to start Ray.
+
+Usage: python -m toeppo.training.export CHECKPOINT OUTPUT_DIR [POLICY_ID ...]
+"""
+
+import argparse
+import os
+import re
+
+from toeppo.agents.exported_policy import ExportedPolicy
+
+HIDDEN_LAYER_PATTERN = re.compile(
+    r"^internal_model\._hidden_layers\.(\d+)\._model\.0\.(weight|bias)$"
+)
+LOGITS_LAYER_PREFIX = "internal_model._logits._model.0."
+
+
+def policy_from_weights(weights: dict, activation="tanh") -> ExportedPolicy:
+    """Builds an ExportedPolicy out of the state dict of a TorchActionMaskModel"""
+    hidden_layers = {}
+
+    for name, array in weights.items():
+        match = HIDDEN_LAYER_PATTERN.match(name)
+
+        if match is not None:
+            hidden_layers.setdefault(int(match[1]), {})[match[2]] = array
+
+    if LOGITS_LAYER_PREFIX + "weight" not in weights:
+        raise ValueError(
+            "Weights do not belong to a TorchActionMaskModel without a final linear layer"
+        )
+
+    layers = [hidden_layers[index] for index in sorted(hidden_layers)]
+    layers.append(
+        {
+            "weight": weights[LOGITS_LAYER_PREFIX + "weight"],
+            "bias": weights[LOGITS_LAYER_PREFIX + "bias"],
+        }
+    )
+
+    # Torch stores linear weights as (out_features, in_features)
+    return ExportedPolicy(
+        [layer["weight"].T for layer in layers],
+        [layer["bias"] for layer in layers],
+        activation,
+    )
+
+
+def export_checkpoint(
+    checkpoint_path,
+    output_dir,
+    policy_ids: list[str] = None,
+    custom_model: str = "pa_model2",
+) -> dict[str, str]:
+    """
+    Export the policies of an RLlib checkpoint to one .npz file per policy.
+    :param checkpoint_path:
+        Algorithm or policy checkpoint of a run using TorchActionMaskModel
+    :param output_dir:
+        Directory to write <policy_id>.npz files to
+    :param policy_ids:
+        Policies to export, all policies in the checkpoint if None
+    :param custom_model:
+        Name TorchActionMaskModel was registered under during training
+    """
+    # Ray is only needed to read the checkpoint, not to use the export
+    from ray.rllib.models import ModelCatalog
+    from ray.rllib.policy.policy import Policy
+
+    from toeppo.training.training import TorchActionMaskModel
+
+    ModelCatalog.register_custom_model(custom_model, TorchActionMaskModel)
+
+    policies = Policy.from_checkpoint(checkpoint_path, policy_ids=policy_ids)
+
+    if isinstance(policies, Policy):
+        policy_id = os.path.basename(os.path.normpath(checkpoint_path))
+        policies = {policy_id: policies}
+
+    os.makedirs(output_dir, exist_ok=True)
+    exported_paths = {}
+
+    for policy_id, policy in policies.items():
+        activation = policy.config["model"].get("fcnet_activation", "tanh")
+        exported_policy = policy_from_weights(policy.get_weights(), activation)
+
+        path = os.path.join(output_dir, f"{policy_id}.npz")
+        exported_policy.save(path)
+        exported_paths[policy_id] = path
+
+    return exported_paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("checkpoint")
+    parser.add_argument("output_dir")
+    parser.add_argument("policy_ids", nargs="*")
+    parser.add_argument("--custom-model", default="pa_model2")
+    args = parser.parse_args()
+
+    paths = export_checkpoint(
+        args.checkpoint,
+        args.output_dir,
+        args.policy_ids or None,
+        args.custom_model,
+    )
+
+    for policy_id, path in paths.items():
+        print(f"Exported {policy_id} to {path}")
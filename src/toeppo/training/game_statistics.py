@@ -0,0 +1,72 @@
+"""Custom metrics of how agents play, from the counters of ToepEnv.
+
+ToepEnv counts toeps, folds, vuile was calls and checks, card plays, invalid
+actions and lost games per seat in one NumPy array. The callbacks only read
+that array when an episode ends, so rollouts do no extra work per step. That
+needs episodes that end: the env must have the "round" or "game" episode
+mode, an endless env is refused when its first episode starts.
+
+Usage:
+    config = config.callbacks(GameStatisticsCallbacks)
+    # or next to other callbacks
+    config = config.callbacks(
+        make_multi_callbacks([OpponentPoolCallbacks, GameStatisticsCallbacks])
+    )
+"""
+
+from ray.rllib.algorithms.callbacks import DefaultCallbacks
+
+from toeppo.environment.toep_env import (
+    INVALID_ACTION_STATISTIC,
+    STATISTICS,
+)
+
+TOEP_STATISTIC = STATISTICS.index("toep")
+
+
+class GameStatisticsCallbacks(DefaultCallbacks):
+    def on_episode_start(
+        self,
+        *,
+        worker,
+        base_env,
+        policies,
+        episode,
+        env_index=None,
+        **kwargs,
+    ):
+        env = self.get_env(base_env, env_index)
+
+        if env.episode_mode is None:
+            raise ValueError(
+                "Game statistics are recorded when an episode ends, give "
+                "ToepEnv the round or game episode mode"
+            )
+
+    def on_episode_end(
+        self,
+        *,
+        worker,
+        base_env,
+        policies,
+        episode,
+        env_index=None,
+        **kwargs,
+    ):
+        env = self.get_env(base_env, env_index)
+        totals = env.statistics.sum(axis=0)
+        # Every valid or invalid action, lost games are not moves
+        moves = max(int(totals[: INVALID_ACTION_STATISTIC + 1].sum()), 1)
+
+        for name, total in zip(STATISTICS, totals.tolist()):
+            episode.custom_metrics[name] = total
+
+        episode.custom_metrics["invalid_action_rate"] = (
+            totals[INVALID_ACTION_STATISTIC] / moves
+        )
+        episode.custom_metrics["toep_rate"] = totals[TOEP_STATISTIC] / moves
+
+    @staticmethod
+    def get_env(base_env, env_index):
+        # PettingZooEnv keeps the ToepEnv it wraps in .env
+        return base_env.get_sub_environments()[env_index or 0].env
@@ -0,0 +1,201 @@
+"""League self-play: one learning policy against frozen snapshots of itself.
+
+Every episode one seat, derived from the episode id, is played by the
+learner and the other seats by opponent policies whose weights are sampled
+from an OpponentPool. Only the learner is in ``policies_to_train``, so RLlib
+never computes losses for the opponents.
+
+Usage:
+    config = config.multi_agent(
+        **league_multi_agent_config(obs_space, act_space)
+    ).callbacks(OpponentPoolCallbacks)
+"""
+
+import numpy as np
+from ray.rllib.algorithms.callbacks import DefaultCallbacks
+
+from toeppo.training.opponent_pool import OpponentPool
+
+LEARNER_POLICY_ID = "learner"
+N_PLAYERS = 4
+
+
+def opponent_policy_ids(n_players: int = N_PLAYERS) -> list[str]:
+    return [f"opponent_{i}" for i in range(1, n_players)]
+
+
+def learner_seat(episode_id: int, n_players: int = N_PLAYERS) -> int:
+    return episode_id % n_players
+
+
+def agent_seat(agent_id: str) -> int:
+    # Agents are called player_1 up to player_n
+    return int(agent_id.rsplit("_", 1)[1]) - 1
+
+
+def league_policy_mapping_fn(agent_id, episode, worker=None, **kwargs):
+    seat = agent_seat(agent_id)
+    learner = learner_seat(episode.episode_id)
+
+    if seat == learner:
+        return LEARNER_POLICY_ID
+
+    # Opponents are numbered by their position relative to the learner
+    return f"opponent_{(seat - learner) % N_PLAYERS}"
+
+
+def league_multi_agent_config(observation_space, action_space) -> dict:
+    policies = {LEARNER_POLICY_ID: (None, observation_space, action_space, {})}
+
+    for policy_id in opponent_policy_ids():
+        policies[policy_id] = (None, observation_space, action_space, {})
+
+    return {
+        "policies": policies,
+        "policy_mapping_fn": league_policy_mapping_fn,
+        "policies_to_train": [LEARNER_POLICY_ID],
+    }
+
+
+def freeze_policy(policy):
+    """Stop autograd from tracking an opponent so no gradients are ever kept"""
+    model = getattr(policy, "model", None)
+
+    if model is not None and hasattr(model, "requires_grad_"):
+        model.requires_grad_(False)
+
+
+class OpponentPoolCallbacks(DefaultCallbacks):
+    """Snapshots the learner into an OpponentPool and reseats the opponents.
+
+    Subclass and override the class attributes to configure the league.
+    """
+
+    snapshot_interval = 10  # Training iterations between snapshots
+    pool_size = 20
+    prioritization_power = 2.0
+    seed = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Only used on the driver
+        self.pool = None
+        self.rng = np.random.default_rng(self.seed)
+
+        # Snapshot ids of the opponent seats, sent to the workers with the
+        # weights so episodes are credited to the snapshots they played
+        self.current_opponents = []
+
+        # Only used on rollout workers, wins and games per snapshot id
+        self.outcomes = {}
+        self.learner_wins = 0
+        self.learner_games = 0
+
+    def on_algorithm_init(self, *, algorithm, **kwargs):
+        self.pool = OpponentPool(self.pool_size, self.prioritization_power)
+        self.snapshot_learner(algorithm)
+        self.sample_opponents(algorithm)
+
+    def on_episode_start(
+        self, *, worker, base_env, policies, episode, env_index=None, **kwargs
+    ):
+        game = self.get_game(base_env, env_index)
+        episode.user_data["finished_games"] = game.finished_games
+        episode.user_data["opponents"] = set(self.current_opponents)
+
+    def on_episode_step(
+        self,
+        *,
+        worker,
+        base_env,
+        policies=None,
+        episode,
+        env_index=None,
+        **kwargs,
+    ):
+        game = self.get_game(base_env, env_index)
+
+        if game.finished_games == episode.user_data["finished_games"]:
+            return
+
+        episode.user_data["finished_games"] = game.finished_games
+
+        seat = learner_seat(episode.episode_id)
+        lost = any(player.seat == seat for player in game.players_that_lost)
+
+        self.learner_games += 1
+        self.learner_wins += int(not lost)
+
+        for snapshot_id in episode.user_data["opponents"]:
+            wins, games = self.outcomes.get(snapshot_id, (0, 0))
+            self.outcomes[snapshot_id] = (wins + int(not lost), games + 1)
+
+    def on_train_result(self, *, algorithm, result, **kwargs):
+        worker_outcomes = algorithm.workers.foreach_worker(
+            lambda worker: (
+                worker.callbacks.pop_outcomes(),
+                worker.callbacks.pop_learner_record(),
+            )
+        )
+        wins = sum(record[0] for _, record in worker_outcomes)
+        games = sum(record[1] for _, record in worker_outcomes)
+
+        for outcomes, _ in worker_outcomes:
+            for snapshot_id, record in outcomes.items():
+                self.pool.record_result(snapshot_id, *record)
+
+        if algorithm.iteration % self.snapshot_interval == 0:
+            self.snapshot_learner(algorithm)
+
+        self.sample_opponents(algorithm)
+
+        result.setdefault("custom_metrics", {})
+        result["custom_metrics"]["opponent_pool_size"] = len(self.pool)
+        if games > 0:
+            result["custom_metrics"]["learner_win_rate"] = wins / games
+
+    def pop_outcomes(self) -> dict[str, tuple[int, int]]:
+        """Learner wins and games per opponent snapshot id since the last pop"""
+        outcomes = self.outcomes
+        self.outcomes = {}
+
+        return outcomes
+
+    def pop_learner_record(self) -> tuple[int, int]:
+        record = (self.learner_wins, self.learner_games)
+        self.learner_wins = 0
+        self.learner_games = 0
+
+        return record
+
+    def snapshot_learner(self, algorithm):
+        weights = algorithm.get_policy(LEARNER_POLICY_ID).get_weights()
+        self.pool.add(weights, algorithm.iteration)
+
+    def sample_opponents(self, algorithm):
+        opponent_ids = opponent_policy_ids()
+        self.current_opponents = self.pool.sample(len(opponent_ids), self.rng)
+
+        weights = {
+            policy_id: self.pool[snapshot_id]
+            for policy_id, snapshot_id in zip(
+                opponent_ids, self.current_opponents
+            )
+        }
+
+        current_opponents = list(self.current_opponents)
+
+        def set_opponent_weights(worker):
+            worker.set_weights(weights)
+            worker.callbacks.current_opponents = current_opponents
+
+            for policy_id in opponent_ids:
+                freeze_policy(worker.get_policy(policy_id))
+
+        algorithm.workers.foreach_worker(set_opponent_weights)
+
+    @staticmethod
+    def get_game(base_env, env_index):
+        # PettingZooEnv keeps the ToepEnv it wraps in .env
+        return base_env.get_sub_environments()[env_index or 0].env.game
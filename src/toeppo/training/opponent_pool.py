@@ -0,0 +1,117 @@
+from collections import OrderedDict
+import hashlib
+
+import numpy as np
+
+
+def weights_digest(weights: dict) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+
+    for name in sorted(weights):
+        array = np.ascontiguousarray(weights[name])
+        digest.update(name.encode())
+        digest.update(str(array.dtype).encode())
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+
+    return digest.hexdigest()
+
+
+class Snapshot:
+    def __init__(self, snapshot_id: str, weights: dict, iteration: int):
+        self.snapshot_id = snapshot_id
+        self.weights = weights
+        self.iteration = iteration
+        self.wins = 0
+        self.games = 0
+
+    @property
+    def win_rate(self) -> float:
+        """Win rate of the learner against this snapshot, smoothed so unplayed snapshots sit at 0.5"""
+        return (self.wins + 1) / (self.games + 2)
+
+    def __repr__(self):
+        return f"Snapshot({self.snapshot_id[:8]}, iteration={self.iteration}, win_rate={self.win_rate:.2f})"
+
+
+class OpponentPool:
+    """Bounded store of frozen policy weights to sample opponents from.
+
+    Identical weights are only stored once. When the pool is full the least
+    recently added or sampled snapshot is evicted. Opponents are sampled with
+    prioritized fictitious self-play: the lower the learner's win rate against
+    a snapshot, the more often that snapshot is picked.
+    """
+
+    def __init__(self, max_size: int = 20, prioritization_power: float = 2.0):
+        if max_size < 1:
+            raise ValueError("The opponent pool needs room for a snapshot")
+
+        self.max_size = max_size
+        self.prioritization_power = prioritization_power
+        self.snapshots: OrderedDict[str, Snapshot] = OrderedDict()
+
+    def add(self, weights: dict, iteration: int = 0) -> str:
+        snapshot_id = weights_digest(weights)
+
+        if snapshot_id in self.snapshots:
+            self.snapshots.move_to_end(snapshot_id)
+            return snapshot_id
+
+        frozen_weights = {}
+        for name, array in weights.items():
+            frozen_array = np.array(array, copy=True)
+            frozen_array.setflags(write=False)
+            frozen_weights[name] = frozen_array
+
+        self.snapshots[snapshot_id] = Snapshot(
+            snapshot_id, frozen_weights, iteration
+        )
+
+        while len(self.snapshots) > self.max_size:
+            self.snapshots.popitem(last=False)
+
+        return snapshot_id
+
+    def __getitem__(self, snapshot_id: str) -> dict:
+        self.snapshots.move_to_end(snapshot_id)
+
+        return self.snapshots[snapshot_id].weights
+
+    def __contains__(self, snapshot_id: str) -> bool:
+        return snapshot_id in self.snapshots
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def record_result(self, snapshot_id: str, wins: int, games: int):
+        if snapshot_id not in self.snapshots:
+            return  # Evicted in the meantime
+
+        snapshot = self.snapshots[snapshot_id]
+        snapshot.wins += wins
+        snapshot.games += games
+
+    def priorities(self) -> np.ndarray:
+        win_rates = np.array(
+            [snapshot.win_rate for snapshot in self.snapshots.values()]
+        )
+        priorities = (1.0 - win_rates) ** self.prioritization_power
+
+        return priorities / priorities.sum()
+
+    def sample(self, n: int, rng: np.random.Generator = None) -> list[str]:
+        if not self.snapshots:
+            raise ValueError("Cannot sample from an empty opponent pool")
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        snapshot_ids = list(self.snapshots)
+        indices = rng.choice(len(snapshot_ids), size=n, p=self.priorities())
+        sampled = [snapshot_ids[index] for index in indices]
+
+        for snapshot_id in sampled:
+            self.snapshots.move_to_end(snapshot_id)
+
+        return sampled
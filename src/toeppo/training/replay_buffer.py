@@ -0,0 +1,344 @@
+"""Compact prioritized replay of ToepEnv transitions.
+
+A flattened ToepEnv observation is almost all one-hot encodings of small
+integers: card numbers, scores, the turn and the action type. The buffer
+stores those integers as uint8 and every 39-entry action mask as the bits of
+a uint64, in arrays allocated once for the whole capacity, and rebuilds the
+float model input only for the transitions that are sampled. That is about
+a hundred bytes per transition instead of the 15 kB of two float32
+observations.
+
+Transitions are sampled in proportion to their priority ** alpha through a
+sum segment tree, a min segment tree gives the largest importance weight to
+normalize with.
+
+Usage:
+    space_base = ToepEnv.get_observation_space_base(4, False)
+    buffer = CompactReplayBuffer(1_000_000, space_base)
+    buffer.add(observations, masks, actions, rewards, next_observations,
+               next_masks, dones)
+    batch = buffer.sample(256, beta=0.4)
+    buffer.update_priorities(batch["indices"], abs(td_errors) + 1e-6)
+"""
+
+import numpy as np
+from gymnasium.spaces import Box, Discrete, MultiDiscrete
+
+from toeppo.environment.observation_space import ToepObservationSpace
+
+MASK_SIZE = 39
+
+
+class ObservationCodec:
+    """Converts flattened observations to uint8 codes and back.
+
+    Every Discrete and MultiDiscrete entry of the observation Dict becomes
+    one code, the index of its one-hot; Box entries are kept as float32.
+    """
+
+    def __init__(self, observation_space_base: ToepObservationSpace):
+        code_offsets = []
+        box_columns = []
+        offset = 0
+
+        # Flattening concatenates the subspaces in the order of the Dict
+        for space in observation_space_base.observation_space_dict.values():
+            match space:
+                case Discrete():
+                    sizes = [space.n]
+                case MultiDiscrete():
+                    sizes = space.nvec.ravel().tolist()
+                case Box():
+                    box_columns.extend(range(offset, offset + space.shape[0]))
+                    offset += space.shape[0]
+                    continue
+                case _:
+                    raise TypeError(f"Cannot encode {space}")
+
+            if max(sizes) > 256:
+                raise ValueError(f"Values of {space} do not fit in uint8")
+
+            for size in sizes:
+                code_offsets.append(offset)
+                offset += size
+
+        self.size = offset
+        self.code_offsets = np.array(code_offsets)
+        self.box_columns = np.array(box_columns, dtype=np.intp)
+        self.n_codes = len(code_offsets)
+        self.n_box = len(box_columns)
+        self.code_columns = np.setdiff1d(np.arange(offset), self.box_columns)
+
+    def encode(self, observations: np.ndarray):
+        """:return: uint8 codes and float32 Box values of every observation"""
+        observations = np.asarray(observations)
+        _, columns = np.nonzero(observations[:, self.code_columns])
+        # Every code has exactly one 1 and they come in order
+        columns = self.code_columns[columns].reshape(len(observations), -1)
+        codes = (columns - self.code_offsets).astype(np.uint8)
+
+        return codes, observations[:, self.box_columns].astype(np.float32)
+
+    def decode(self, codes: np.ndarray, box_values: np.ndarray = None):
+        observations = np.zeros((len(codes), self.size), dtype=np.float32)
+        rows = np.arange(len(codes))[:, None]
+        observations[rows, self.code_offsets + codes] = 1.0
+
+        if self.n_box:
+            observations[:, self.box_columns] = box_values
+
+        return observations
+
+
+def pack_masks(action_masks: np.ndarray) -> np.ndarray:
+    bits = np.packbits(
+        np.asarray(action_masks, dtype=bool), axis=1, bitorder="little"
+    )
+    padded = np.zeros((len(bits), 8), dtype=np.uint8)
+    padded[:, : bits.shape[1]] = bits
+
+    return padded.view("<u8").ravel()
+
+
+def unpack_masks(packed: np.ndarray) -> np.ndarray:
+    bits = np.ascontiguousarray(packed, dtype="<u8").view(np.uint8)
+
+    return np.unpackbits(
+        bits.reshape(len(packed), 8),
+        axis=1,
+        count=MASK_SIZE,
+        bitorder="little",
+    ).astype(np.int8)
+
+
+class SegmentTree:
+    """Binary tree over a power of two leaves, every node combines its children"""
+
+    def __init__(self, capacity: int, operation, neutral: float):
+        self.n_leaves = 1 << max(capacity - 1, 1).bit_length()
+        self.operation = operation
+        self.neutral = neutral
+        self.nodes = np.full(2 * self.n_leaves, neutral, dtype=np.float64)
+
+    def update(self, indices: np.ndarray, values: np.ndarray):
+        # The walk up the tree starts from the first updated node
+        if len(indices) == 0:
+            return
+
+        nodes = np.asarray(indices) + self.n_leaves
+        self.nodes[nodes] = values
+        nodes = np.unique(nodes // 2)
+
+        while nodes[0] >= 1:
+            self.nodes[nodes] = self.operation(
+                self.nodes[2 * nodes], self.nodes[2 * nodes + 1]
+            )
+
+            if nodes[0] == 1:
+                break
+
+            nodes = np.unique(nodes // 2)
+
+    @property
+    def root(self) -> float:
+        return self.nodes[1]
+
+
+class SumSegmentTree(SegmentTree):
+    def __init__(self, capacity: int):
+        super().__init__(capacity, np.add, 0.0)
+
+    def find_prefix_sums(self, prefix_sums: np.ndarray) -> np.ndarray:
+        """Leaves at which the running sum of the leaves passes every prefix sum"""
+        nodes = np.ones(len(prefix_sums), dtype=np.int64)
+        prefix_sums = np.array(prefix_sums, dtype=np.float64)
+
+        while nodes[0] < self.n_leaves:
+            left = 2 * nodes
+            left_sums = self.nodes[left]
+            go_right = prefix_sums >= left_sums
+            prefix_sums -= np.where(go_right, left_sums, 0.0)
+            nodes = left + go_right
+
+        return nodes - self.n_leaves
+
+
+class MinSegmentTree(SegmentTree):
+    def __init__(self, capacity: int):
+        super().__init__(capacity, np.minimum, np.inf)
+
+
+class CompactReplayBuffer:
+    """Ring buffer of transitions, sampled by priority.
+
+    :param alpha:
+        How much priorities count, 0 samples uniformly
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        observation_space_base: ToepObservationSpace,
+        alpha: float = 0.6,
+    ):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.codec = ObservationCodec(observation_space_base)
+        n_codes, n_box = self.codec.n_codes, self.codec.n_box
+
+        self.codes = np.zeros((capacity, n_codes), dtype=np.uint8)
+        self.next_codes = np.zeros((capacity, n_codes), dtype=np.uint8)
+        self.box_values = np.zeros((capacity, n_box), dtype=np.float32)
+        self.next_box_values = np.zeros((capacity, n_box), dtype=np.float32)
+        self.masks = np.zeros(capacity, dtype=np.uint64)
+        self.next_masks = np.zeros(capacity, dtype=np.uint64)
+        self.actions = np.zeros(capacity, dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=bool)
+
+        self.sum_tree = SumSegmentTree(capacity)
+        self.min_tree = MinSegmentTree(capacity)
+        self.max_priority = 1.0
+        self.position = 0
+        self.size = 0
+        self.added = 0
+        self.sampled = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (
+            self.codes,
+            self.next_codes,
+            self.box_values,
+            self.next_box_values,
+            self.masks,
+            self.next_masks,
+            self.actions,
+            self.rewards,
+            self.dones,
+        )
+
+        return sum(array.nbytes for array in arrays)
+
+    def add(
+        self,
+        observations: np.ndarray,
+        action_masks: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        next_observations: np.ndarray,
+        next_action_masks: np.ndarray,
+        dones: np.ndarray,
+        priorities: np.ndarray = None,
+    ) -> np.ndarray:
+        """Add a batch of transitions, new ones get the highest priority so far.
+
+        :return: The indices they were stored at
+        """
+        n = len(actions)
+
+        if n > self.capacity:
+            raise ValueError(
+                f"Cannot add {n} transitions to a buffer of {self.capacity}"
+            )
+
+        indices = (self.position + np.arange(n)) % self.capacity
+        self.codes[indices], self.box_values[indices] = self.codec.encode(
+            observations
+        )
+        (
+            self.next_codes[indices],
+            self.next_box_values[indices],
+        ) = self.codec.encode(next_observations)
+        self.masks[indices] = pack_masks(action_masks)
+        self.next_masks[indices] = pack_masks(next_action_masks)
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.dones[indices] = dones
+
+        if priorities is None:
+            priorities = np.full(n, self.max_priority)
+
+        self.update_priorities(indices, priorities)
+
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        self.added += n
+
+        return indices
+
+    def update_priorities(self, indices, priorities):
+        priorities = np.asarray(priorities, dtype=np.float64)
+
+        if len(priorities) == 0:
+            return
+
+        if np.any(priorities <= 0):
+            raise ValueError("Priorities have to be positive")
+
+        self.max_priority = max(self.max_priority, priorities.max())
+        scaled = priorities**self.alpha
+        self.sum_tree.update(indices, scaled)
+        self.min_tree.update(indices, scaled)
+
+    def sample(
+        self,
+        batch_size: int,
+        beta: float = 0.4,
+        rng: np.random.Generator = None,
+    ) -> dict[str, np.ndarray]:
+        """
+        Sample transitions by priority and decode them into model input.
+        :param beta:
+            How much importance weights correct for the prioritization, 1
+            corrects fully
+        """
+        if self.size == 0:
+            raise ValueError("Cannot sample from an empty replay buffer")
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        total = self.sum_tree.root
+        # One draw from every equal slice of the total, for a spread out batch
+        prefix_sums = (np.arange(batch_size) + rng.random(batch_size)) * (
+            total / batch_size
+        )
+        indices = np.minimum(
+            self.sum_tree.find_prefix_sums(prefix_sums), self.size - 1
+        )
+
+        probabilities = self.sum_tree.nodes[indices + self.sum_tree.n_leaves]
+        probabilities /= total
+        max_weight = (self.min_tree.root / total * self.size) ** -beta
+        weights = (probabilities * self.size) ** -beta / max_weight
+        self.sampled += batch_size
+
+        return {
+            "observations": self.codec.decode(
+                self.codes[indices], self.box_values[indices]
+            ),
+            "action_masks": unpack_masks(self.masks[indices]),
+            "actions": self.actions[indices].astype(np.int64),
+            "rewards": self.rewards[indices],
+            "next_observations": self.codec.decode(
+                self.next_codes[indices], self.next_box_values[indices]
+            ),
+            "next_action_masks": unpack_masks(self.next_masks[indices]),
+            "dones": self.dones[indices],
+            "weights": weights.astype(np.float32),
+            "indices": indices,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "capacity": self.capacity,
+            "added": self.added,
+            "sampled": self.sampled,
+            "bytes_per_transition": self.nbytes / self.capacity,
+            "max_priority": self.max_priority,
+        }
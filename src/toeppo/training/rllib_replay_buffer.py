@@ -0,0 +1,130 @@
+"""RLlib replay buffer that stores Toep transitions compactly.
+
+Wraps CompactReplayBuffer for the DQN training path, as the underlying
+buffer of RLlib's multi-agent prioritized replay buffer. RLlib stores the
+preprocessed observations of ToepEnv, the Dict flattened in key order: the
+action mask followed by the observation. Both are stored compactly and
+rebuilt only for the sampled batch.
+
+Usage:
+    config.training(replay_buffer_config={
+        "type": "MultiAgentPrioritizedReplayBuffer",
+        "capacity": 1_000_000,
+        "underlying_buffer_config": {"type": ToepReplayBuffer},
+    })
+"""
+
+import numpy as np
+from ray.rllib.policy.sample_batch import SampleBatch
+from ray.rllib.utils.replay_buffers.replay_buffer import (
+    ReplayBuffer,
+    StorageUnit,
+)
+
+from toeppo.environment.toep_env import ToepEnv
+from toeppo.training.replay_buffer import CompactReplayBuffer
+
+
+class ToepReplayBuffer(ReplayBuffer):
+    """Prioritized timestep replay of ToepEnv transitions.
+
+    :param alpha:
+        How much priorities count, 0 samples uniformly
+    :param hand_strength:
+        Whether the env observations include hand strength features
+    """
+
+    def __init__(
+        self,
+        capacity: int = 10_000,
+        storage_unit: str = "timesteps",
+        alpha: float = 0.6,
+        n_players: int = 4,
+        hand_strength: bool = False,
+        **kwargs,
+    ):
+        ReplayBuffer.__init__(self, capacity, storage_unit, **kwargs)
+
+        if self.storage_unit != StorageUnit.TIMESTEPS:
+            raise ValueError("ToepReplayBuffer only stores timesteps")
+
+        self.compact = CompactReplayBuffer(
+            capacity,
+            ToepEnv.get_observation_space_base(n_players, hand_strength),
+            alpha,
+        )
+        self.mask_size = ToepEnv.ACTION_SPACE_SIZE
+        self.rng = np.random.default_rng()
+
+    def __len__(self) -> int:
+        return len(self.compact)
+
+    def add(self, batch: SampleBatch, weight: float = None, **kwargs):
+        observations = np.asarray(batch[SampleBatch.OBS])
+        next_observations = np.asarray(batch[SampleBatch.NEXT_OBS])
+        priorities = None
+
+        if weight is not None:
+            priorities = np.full(len(observations), weight)
+
+        self.compact.add(
+            observations[:, self.mask_size :],
+            observations[:, : self.mask_size],
+            batch[SampleBatch.ACTIONS],
+            batch[SampleBatch.REWARDS],
+            next_observations[:, self.mask_size :],
+            next_observations[:, : self.mask_size],
+            batch[SampleBatch.TERMINATEDS],
+            priorities,
+        )
+        self._num_timesteps_added += len(observations)
+        self._num_timesteps_added_wrap = len(self.compact)
+
+    def sample(
+        self, num_items: int, beta: float = 0.4, **kwargs
+    ) -> SampleBatch:
+        if len(self.compact) == 0:
+            return None
+
+        sample = self.compact.sample(num_items, beta, self.rng)
+        self._num_timesteps_sampled += num_items
+
+        return SampleBatch(
+            {
+                SampleBatch.OBS: np.concatenate(
+                    [sample["action_masks"], sample["observations"]], axis=1
+                ).astype(np.float32),
+                SampleBatch.NEXT_OBS: np.concatenate(
+                    [
+                        sample["next_action_masks"],
+                        sample["next_observations"],
+                    ],
+                    axis=1,
+                ).astype(np.float32),
+                SampleBatch.ACTIONS: sample["actions"],
+                SampleBatch.REWARDS: sample["rewards"],
+                SampleBatch.TERMINATEDS: sample["dones"],
+                SampleBatch.TRUNCATEDS: np.zeros(num_items, dtype=bool),
+                "weights": sample["weights"],
+                "batch_indexes": sample["indices"],
+            }
+        )
+
+    def update_priorities(self, idxes, priorities):
+        self.compact.update_priorities(idxes, priorities)
+
+    def stats(self, debug: bool = False) -> dict:
+        stats = super().stats(debug)
+        stats.update(self.compact.stats())
+
+        return stats
+
+    def get_state(self) -> dict:
+        # The compact arrays are small enough to checkpoint as they are
+        return {"compact": self.compact, **self.stats()}
+
+    def set_state(self, state: dict):
+        self.compact = state["compact"]
+        self._num_timesteps_added = state["added_count"]
+        self._num_timesteps_added_wrap = len(self.compact)
+        self._num_timesteps_sampled = state["sampled_count"]
@@ -3,27 +3,19 @@
 Author: Rohan (https://github.com/Rohan138)
 """
 
-from toeppo.environment.toep_env import ToepEnv
-
 import logging
 import os
 
-import ray
+# Only what the model classes need is imported here, the training entry point
+# imports the rest so importing the models stays cheap
 from gymnasium.spaces import Box, Discrete
-from ray import tune
-from ray.rllib.algorithms.dqn import DQNConfig
 from ray.rllib.algorithms.dqn.dqn_torch_model import DQNTorchModel
-from ray.rllib.env import PettingZooEnv
-from ray.rllib.models import ModelCatalog
+from ray.rllib.models.torch.torch_modelv2 import TorchModelV2
 from ray.rllib.models.torch.fcnet import FullyConnectedNetwork as TorchFC
 from ray.rllib.utils.framework import try_import_torch
-from ray.rllib.utils.torch_utils import FLOAT_MAX
-from ray.tune.registry import register_env
-
-from pettingzoo.classic import leduc_holdem_v4
+from ray.rllib.utils.torch_utils import FLOAT_MAX, FLOAT_MIN
 
 torch, nn = try_import_torch()
-logging.basicConfig(level=logging.DEBUG, filename="test.log")
 
 
 class TorchMaskedActions(DQNTorchModel):
@@ -80,7 +72,71 @@ class TorchMaskedActions(DQNTorchModel):
         return self.action_embed_model.value_function()
 
 
+class TorchActionMaskModel(TorchModelV2, nn.Module):
+    """Fully connected policy on the "observation" entry, masked by "action_mask".
+
+    Only the policy branch of ``internal_model`` is needed to act, which is
+    what ``toeppo.training.export`` writes out for Ray-free inference.
+    """
+
+    def __init__(
+        self,
+        obs_space,
+        action_space,
+        num_outputs,
+        model_config,
+        name,
+        **kwargs,
+    ):
+        orig_space = getattr(obs_space, "original_space", obs_space)
+
+        TorchModelV2.__init__(
+            self,
+            obs_space,
+            action_space,
+            num_outputs,
+            model_config,
+            name,
+            **kwargs,
+        )
+        nn.Module.__init__(self)
+
+        self.internal_model = TorchFC(
+            orig_space["observation"],
+            action_space,
+            num_outputs,
+            model_config,
+            name + "_internal",
+        )
+
+    def forward(self, input_dict, state, seq_lens):
+        action_mask = input_dict["obs"]["action_mask"]
+
+        logits, _ = self.internal_model(
+            {"obs": input_dict["obs"]["observation"]}
+        )
+        inf_mask = torch.clamp(torch.log(action_mask), min=FLOAT_MIN)
+
+        return logits + inf_mask, state
+
+    def value_function(self):
+        return self.internal_model.value_function()
+
+
 if __name__ == "__main__":
+    import ray
+    from ray import tune
+    from ray.rllib.algorithms.dqn import DQNConfig
+    from ray.rllib.env import PettingZooEnv
+    from ray.rllib.models import ModelCatalog
+    from ray.tune.registry import register_env
+
+    from toeppo.environment.toep_env import ROUND_EPISODES, ToepEnv
+    from toeppo.training.game_statistics import GameStatisticsCallbacks
+    from toeppo.training.rllib_replay_buffer import ToepReplayBuffer
+
+    logging.basicConfig(level=logging.DEBUG, filename="test.log")
+
     ray.init()
 
     alg_name = "DQN"
@@ -88,13 +144,15 @@ if __name__ == "__main__":
     # function that outputs the environment you wish to register.
 
     def env_creator():
-        env = ToepEnv.env(n_players=4)
+        # Episodes have to end for the game statistics to be recorded
+        env = ToepEnv.env(n_players=4, episode_mode=ROUND_EPISODES)
         return env
 
     env_name = "toep_model"
     register_env(env_name, lambda config: PettingZooEnv(env_creator()))
 
     test_env = PettingZooEnv(env_creator())
+    assert test_env.env.episode_mode is not None, "Episodes have to end"
     obs_space = test_env.observation_space
     act_space = test_env.action_space
 
@@ -107,6 +165,11 @@ if __name__ == "__main__":
             hiddens=[],
             dueling=False,
             model={"custom_model": "toep_model"},
+            replay_buffer_config={
+                "type": "MultiAgentPrioritizedReplayBuffer",
+                "capacity": 1_000_000,
+                "underlying_buffer_config": {"type": ToepReplayBuffer},
+            },
         )
         .multi_agent(
             policies={
@@ -133,6 +196,7 @@ if __name__ == "__main__":
             }
         )
         .environment(disable_env_checking=True)
+        .callbacks(GameStatisticsCallbacks)
     )
 
     tune.run(
@@ -0,0 +1,208 @@
+"""Allocation budgets of the ToepGame and ToepEnv step loop.
+
+Plays fixed-seed random games under tracemalloc and reports, per step and
+per round, the blocks and bytes that were allocated and still alive when the
+step or round ended, plus the transient peak. Exits with status 1 when the
+mean per step or per round exceeds a budget, or the peak of any single step
+or round exceeds its max peak budget, and prints the lines that allocated
+the most.
+
+Usage: python tests/allocation_budget.py [--steps N] [--env-step-blocks N]
+    [--env-step-max-peak-bytes N]
+"""
+
+import argparse
+import collections
+import random
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+
+from toeppo.environment.toep_env import ToepEnv, action_mask, apply_action
+from toeppo.environment.toep_game import ToepGame
+
+# Budgets on the mean blocks, bytes and peak bytes and on the highest peak,
+# a little above what the loop uses now
+BUDGETS = {
+    "game_step_blocks": 2,
+    "game_step_bytes": 200,
+    "game_step_peak_bytes": 300,
+    "game_step_max_peak_bytes": 4_000,
+    "game_round_blocks": 40,
+    "game_round_bytes": 2_000,
+    "game_round_peak_bytes": 2_000,
+    "game_round_max_peak_bytes": 2_500,
+    "env_step_blocks": 60,
+    "env_step_bytes": 70_000,
+    "env_step_peak_bytes": 85_000,
+    "env_step_max_peak_bytes": 100_000,
+    "env_round_blocks": 130,
+    "env_round_bytes": 75_000,
+    "env_round_peak_bytes": 160_000,
+    "env_round_max_peak_bytes": 180_000,
+}
+MEASUREMENTS = ("blocks", "bytes", "peak_bytes", "max_peak_bytes")
+
+
+@dataclass
+class Allocations:
+    blocks: list[int] = field(default_factory=list)
+    bytes: list[int] = field(default_factory=list)
+    peaks: list[int] = field(default_factory=list)
+    lines: collections.Counter = field(default_factory=collections.Counter)
+
+    def start(self):
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        peak = tracemalloc.get_traced_memory()[1]
+        # Leave out the bookkeeping of this script
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, __file__)]
+        )
+
+        self.blocks.append(len(snapshot.traces))
+        self.bytes.append(sum(trace.size for trace in snapshot.traces))
+        self.peaks.append(peak)
+
+        for statistic in snapshot.statistics("lineno"):
+            self.lines[str(statistic.traceback)] += statistic.size
+
+    def mean(self, values: list[int]) -> float:
+        return sum(values) / max(len(values), 1)
+
+    def summary(self) -> dict:
+        return {
+            "count": len(self.blocks),
+            "blocks": self.mean(self.blocks),
+            "bytes": self.mean(self.bytes),
+            "peak_bytes": self.mean(self.peaks),
+            "max_peak_bytes": max(self.peaks, default=0),
+        }
+
+
+def random_action(mask, rng: random.Random) -> int:
+    return rng.choice(mask.nonzero()[0].tolist())
+
+
+def measure_game(n_steps: int, seed: int, per_round: bool) -> Allocations:
+    allocations = Allocations()
+    rng = random.Random(seed)
+    game = ToepGame(4)
+    game.seed(seed)
+    seat, action_type = game.start_round()
+    finished_rounds = game.finished_rounds
+    allocations.start()
+
+    for _ in range(n_steps):
+        if not per_round:
+            action = random_action(action_mask(game, seat, action_type), rng)
+            allocations.start()
+            seat, action_type = apply_action(game.players[seat], action)
+            allocations.stop()
+            continue
+
+        # Choosing only allocates temporaries, they do not outlive the round
+        action = random_action(action_mask(game, seat, action_type), rng)
+        seat, action_type = apply_action(game.players[seat], action)
+
+        if game.finished_rounds != finished_rounds:
+            finished_rounds = game.finished_rounds
+            allocations.stop()
+            allocations.start()
+
+    return allocations
+
+
+def measure_env(n_steps: int, seed: int, per_round: bool) -> Allocations:
+    allocations = Allocations()
+    rng = random.Random(seed)
+    env = ToepEnv(4)
+    env.reset(seed=seed)
+    finished_rounds = env.game.finished_rounds
+    allocations.start()
+
+    for _ in range(n_steps):
+        agent = env.agent_selection
+        mask = env.observations[agent]["action_mask"]
+
+        if not per_round:
+            action = random_action(mask, rng)
+            allocations.start()
+            env.step(action)
+            allocations.stop()
+            continue
+
+        action = random_action(mask, rng)
+        env.step(action)
+
+        if env.game.finished_rounds != finished_rounds:
+            finished_rounds = env.game.finished_rounds
+            allocations.stop()
+            allocations.start()
+
+    return allocations
+
+
+def check_budgets(n_steps: int, seed: int, budgets: dict, top: int) -> bool:
+    within_budget = True
+    measures = {"game": measure_game, "env": measure_env}
+
+    for name, measure in measures.items():
+        for unit, per_round in (("step", False), ("round", True)):
+            tracemalloc.start()
+            allocations = measure(n_steps, seed, per_round)
+            tracemalloc.stop()
+            summary = allocations.summary()
+
+            print(
+                f"{name} per {unit} ({summary['count']}): "
+                f"{summary['blocks']:.1f} blocks, "
+                f"{summary['bytes']:.0f} bytes, "
+                f"peak {summary['peak_bytes']:.0f} bytes "
+                f"(max {summary['max_peak_bytes']})"
+            )
+
+            over_budget = [
+                (measurement, budgets[f"{name}_{unit}_{measurement}"])
+                for measurement in MEASUREMENTS
+                if summary[measurement]
+                > budgets[f"{name}_{unit}_{measurement}"]
+            ]
+
+            for measurement, budget in over_budget:
+                print(
+                    f"  over budget: {summary[measurement]:.1f} "
+                    f"{measurement} per {unit} > {budget}"
+                )
+
+            if over_budget:
+                within_budget = False
+
+                for line, size in allocations.lines.most_common(top):
+                    print(f"    {size:>10} bytes  {line}")
+
+    return within_budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--top", type=int, default=10, help="Lines to show over budget"
+    )
+
+    for budget_name, default in BUDGETS.items():
+        parser.add_argument(
+            "--" + budget_name.replace("_", "-"), type=int, default=default
+        )
+
+    args = parser.parse_args()
+    budgets = {
+        budget_name: getattr(args, budget_name) for budget_name in BUDGETS
+    }
+
+    if not check_budgets(args.steps, args.seed, budgets, args.top):
+        sys.exit(1)
@@ -0,0 +1,131 @@
+"""Smoke test of ToepReplayBuffer under RLlib's prioritized replay.
+
+Plays random ToepEnv steps, adds them per agent to a
+MultiAgentPrioritizedReplayBuffer with ToepReplayBuffer underneath, as
+training.py configures it, and then samples batches and updates their
+priorities, including an empty update. Checks that every sampled
+observation is one that was added and that the new priorities change what
+is sampled. Needs Ray.
+
+Usage: python tests/replay_buffer_smoke.py [--steps N] [--batch-size N]
+"""
+
+import argparse
+import collections
+import random
+
+import numpy as np
+from ray.rllib.policy.sample_batch import MultiAgentBatch, SampleBatch
+from ray.rllib.utils.replay_buffers.multi_agent_prioritized_replay_buffer import (
+    MultiAgentPrioritizedReplayBuffer,
+)
+
+from toeppo.environment.toep_env import ToepEnv
+from toeppo.training.rllib_replay_buffer import ToepReplayBuffer
+
+
+def rllib_observation(observation: dict) -> np.ndarray:
+    # RLlib flattens the Dict in key order: the action mask, then the rest
+    return np.concatenate(
+        [observation["action_mask"], observation["observation"]]
+    ).astype(np.float32)
+
+
+def play(n_steps: int, seed: int) -> MultiAgentBatch:
+    """Random transitions of every agent, from its decision to its next one"""
+    rng = random.Random(seed)
+    env = ToepEnv(4)
+    env.reset(seed=seed)
+    columns = collections.defaultdict(lambda: collections.defaultdict(list))
+
+    for _ in range(n_steps):
+        agent = env.agent_selection
+        observation = env.observations[agent]
+        action = rng.choice(np.flatnonzero(observation["action_mask"]))
+        env.step(int(action))
+
+        agent_columns = columns[agent]
+        agent_columns[SampleBatch.OBS].append(rllib_observation(observation))
+        agent_columns[SampleBatch.ACTIONS].append(int(action))
+        agent_columns[SampleBatch.REWARDS].append(env.rewards[agent])
+        agent_columns[SampleBatch.NEXT_OBS].append(
+            rllib_observation(env.observations[agent])
+        )
+        agent_columns[SampleBatch.TERMINATEDS].append(False)
+        agent_columns[SampleBatch.TRUNCATEDS].append(False)
+
+    return MultiAgentBatch(
+        {
+            agent: SampleBatch(
+                {
+                    name: np.array(values)
+                    for name, values in agent_columns.items()
+                }
+            )
+            for agent, agent_columns in columns.items()
+        },
+        n_steps,
+    )
+
+
+def smoke_test(n_steps: int, batch_size: int, seed: int):
+    buffer = MultiAgentPrioritizedReplayBuffer(
+        capacity=n_steps,
+        underlying_buffer_config={"type": ToepReplayBuffer},
+    )
+    batch = play(n_steps, seed)
+    buffer.add(batch)
+
+    added = {
+        agent: {row.tobytes() for row in agent_batch[SampleBatch.OBS]}
+        for agent, agent_batch in batch.policy_batches.items()
+    }
+
+    for agent, agent_buffer in buffer.replay_buffers.items():
+        assert isinstance(agent_buffer, ToepReplayBuffer), type(agent_buffer)
+        assert len(agent_buffer) == len(batch.policy_batches[agent]), agent
+
+    sample = buffer.sample(batch_size)
+    priorities = {}
+
+    for agent, agent_sample in sample.policy_batches.items():
+        for row in agent_sample[SampleBatch.OBS]:
+            assert row.tobytes() in added[agent], f"Unknown sample of {agent}"
+
+        indices = agent_sample["batch_indexes"]
+        # Make the first sampled transition far more likely than the rest
+        td_errors = np.full(len(indices), 1e-3)
+        td_errors[0] = 1e3
+        priorities[agent] = (indices, td_errors)
+
+    buffer.update_priorities(priorities)
+    buffer.update_priorities(
+        {
+            agent: (np.array([], dtype=np.int64), np.array([]))
+            for agent in added
+        }
+    )
+
+    # Transitions that were not sampled keep the priority they were added
+    # with, the favoured one should still come up far more than uniformly
+    for agent, (indices, _) in priorities.items():
+        agent_buffer = buffer.replay_buffers[agent]
+        favoured = indices[0]
+        agent_sample = agent_buffer.sample(1000)
+        share = np.mean(agent_sample["batch_indexes"] == favoured)
+        assert share > 5 / len(agent_buffer), f"{agent} sampled {share:.1%}"
+
+    print(
+        f"{n_steps} steps of {len(added)} agents added, sampled "
+        f"{sample.env_steps()} and updated their priorities"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    smoke_test(args.steps, args.batch_size, args.seed)